@@ -0,0 +1,7 @@
+"""
+Offline load-test kit for the Zalo bridge + CashyBear API (no Zalo, Gemini or node needed):
+
+- bench.synth   — COPY-load synthetic customer_accounts / features_monthly / predictions_llm_with_facts
+- bench.stubs   — local zapps sendMessage, Gemini REST and :4000 hook server stand-ins
+- bench.replay  — webhook + /chat/reply traffic at a given concurrency, p50/p95/p99 report
+"""
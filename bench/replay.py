@@ -0,0 +1,150 @@
+"""
+Replay driver: virtual users fire Zalo webhooks at the bridge (:8011) and
+/chat/reply conversations at CashyBear (:8010), `--concurrency` users at a time,
+then print p50/p95/p99 + throughput per endpoint.
+
+    python -m bench.replay --concurrency 50 --duration 60 --mix webhook=1,chat=1 --json-out bench_report.json
+
+Each chat user walks a realistic session (chào → mục tiêu → 7/14 ngày → đồng ý);
+each webhook is a zapps `message.text.received` event with a unique message_id.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .report import LatencyRecorder, format_table
+
+PERSONAS = ["Mentor", "Angry Mom", "Banter"]
+
+CHAT_SCRIPTS: List[List[str]] = [
+    ["chào gấu", "mình muốn tiết kiệm 10 triệu trong 3 tháng", "14 ngày", "đồng ý"],
+    ["hi", "tiết kiệm 5tr trong 2 tháng", "7 ngày", "đổi kế hoạch khác", "ok chốt"],
+    ["bạn là ai", "muốn để dành 20 triệu đi du lịch 6 tháng nữa", "14", "nhẹ hơn chút", "được"],
+    ["mình tiêu nhiều quá", "tiết kiệm 3 triệu 1 tháng", "7", "ok"],
+]
+
+WEBHOOK_TEXTS = [
+    "chào gấu", "hôm nay mình tiêu 150k ăn trưa", "tiết kiệm 5 triệu trong 2 tháng",
+    "7 ngày", "đồng ý", "kế hoạch của mình sao rồi", "mua trà sữa 45k", "đổi kế hoạch",
+]
+
+
+def _webhook_event(user: int, text: str) -> Dict:
+    return {
+        "event_name": "message.text.received",
+        "message": {
+            "message_id": uuid.uuid4().hex,
+            "date": int(time.time() * 1000),
+            "text": text,
+            "chat": {"id": f"bench-chat-{user}", "chat_type": "PRIVATE"},
+            "from": {"id": f"bench-user-{user}", "display_name": f"Bench {user}", "is_bot": False},
+        },
+    }
+
+
+async def _timed(rec: LatencyRecorder, name: str, coro) -> Optional[httpx.Response]:
+    t0 = time.perf_counter()
+    try:
+        resp = await coro
+        rec.add(name, time.perf_counter() - t0, resp.status_code < 400)
+        return resp
+    except Exception:
+        rec.add(name, time.perf_counter() - t0, False)
+        return None
+
+
+async def chat_session(client: httpx.AsyncClient, rec: LatencyRecorder, api: str, customers: Tuple[int, int], think_secs: float):
+    cid = random.randint(*customers)
+    body = {"customerId": cid, "persona": random.choice(PERSONAS), "sessionId": f"bench-{uuid.uuid4().hex[:12]}", "message": ""}
+    for text in random.choice(CHAT_SCRIPTS):
+        body["message"] = text
+        await _timed(rec, "POST /chat/reply", client.post(f"{api}/chat/reply", json=body))
+        if think_secs:
+            await asyncio.sleep(random.uniform(0, think_secs))
+
+
+async def webhook_burst(client: httpx.AsyncClient, rec: LatencyRecorder, bridge: str, users: int):
+    user = random.randint(1, users)
+    event = _webhook_event(user, random.choice(WEBHOOK_TEXTS))
+    resp = await _timed(rec, "POST /webhook-test", client.post(f"{bridge}/webhook-test/bench", json=event))
+    # ~5% gửi lại cùng event như Zalo retry → đo đường dedup
+    if resp is not None and random.random() < 0.05:
+        await _timed(rec, "POST /webhook-test (retry)", client.post(f"{bridge}/webhook-test/bench", json=event))
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        mix[name.strip()] = float(w or 1)
+    unknown = set(mix) - {"webhook", "chat"}
+    if unknown:
+        raise SystemExit(f"unknown scenario(s) in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def run(args) -> LatencyRecorder:
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rec = LatencyRecorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    deadline = time.monotonic() + args.duration if args.duration else None
+    budget = [args.requests]
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                if deadline is None:
+                    if budget[0] <= 0:
+                        return
+                    budget[0] -= 1
+                kind = random.choices(names, weights)[0]
+                if kind == "chat":
+                    await chat_session(client, rec, args.api, (args.customer_min, args.customer_max), args.think)
+                else:
+                    await webhook_burst(client, rec, args.bridge, args.zalo_users)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    rec.stop()
+    return rec
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="bench.replay", description="Load driver for the Zalo bridge and CashyBear API")
+    ap.add_argument("--api", default="http://127.0.0.1:8010")
+    ap.add_argument("--bridge", default="http://127.0.0.1:8011")
+    ap.add_argument("--concurrency", type=int, default=20, help="số virtual user chạy song song")
+    ap.add_argument("--duration", type=float, default=30.0, help="giây; 0 = dùng --requests")
+    ap.add_argument("--requests", type=int, default=1000, help="số kịch bản (chat session / webhook) khi --duration 0")
+    ap.add_argument("--mix", default="webhook=1,chat=1", help="tỉ trọng kịch bản, vd. webhook=3,chat=1")
+    ap.add_argument("--customer-min", type=int, default=1)
+    ap.add_argument("--customer-max", type=int, default=500)
+    ap.add_argument("--zalo-users", type=int, default=1000)
+    ap.add_argument("--think", type=float, default=0.0, help="nghỉ ngẫu nhiên tối đa giữa 2 lượt chat (giây)")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--json-out", default=None)
+    args = ap.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    rec = asyncio.run(run(args))
+    print(format_table(rec.summary()))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            f.write(rec.as_json(concurrency=args.concurrency, mix=args.mix, duration=args.duration, requests=args.requests))
+        print("Saved:", args.json_out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Latency recorder + p50/p95/p99 / throughput report per endpoint."""
+
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """Collects (endpoint, seconds, ok) samples; single event loop → no locking needed"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add(self, endpoint: str, secs: float, ok: bool = True):
+        self.samples[endpoint].append(secs)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        wall = max((self.finished or time.perf_counter()) - self.started, 1e-9)
+        out: Dict[str, Dict[str, Any]] = {}
+        for ep, xs in sorted(self.samples.items()):
+            a = np.asarray(xs) * 1000.0
+            p50, p95, p99 = np.percentile(a, [50, 95, 99])
+            out[ep] = {
+                "count": int(a.size),
+                "errors": int(self.errors[ep]),
+                "rps": round(a.size / wall, 2),
+                "mean_ms": round(float(a.mean()), 2),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "max_ms": round(float(a.max()), 2),
+            }
+        return out
+
+    def as_json(self, **meta: Any) -> str:
+        wall = (self.finished or time.perf_counter()) - self.started
+        return json.dumps({"meta": meta, "wall_secs": round(wall, 3), "endpoints": self.summary()}, ensure_ascii=False, indent=2)
+
+
+def format_table(summary: Dict[str, Dict[str, Any]]) -> str:
+    cols = ["count", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    width = max([len("endpoint")] + [len(k) for k in summary])
+    lines = [f"{'endpoint':<{width}}  " + "  ".join(f"{c:>9}" for c in cols)]
+    for ep, row in summary.items():
+        lines.append(f"{ep:<{width}}  " + "  ".join(f"{row[c]:>9}" for c in cols))
+    return "\n".join(lines)
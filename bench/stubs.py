@@ -0,0 +1,134 @@
+"""
+Local stand-ins for the external services, one FastAPI app on one port:
+
+- zapps Bot API:  POST /bot{token}/sendMessage          → {"ok": true, ...}
+- Gemini (REST):  POST /v1beta/models/{model}:generateContent
+                  POST /v1beta/models/{model}:streamGenerateContent
+- :4000 hooks:    POST /hook/...  (and any other POST path) → {"ok": true}
+
+Each kind has its own simulated latency. Point the stack at it with:
+    ZALO_API_BASE=http://127.0.0.1:8099/bot  GEMINI_API_ENDPOINT=http://127.0.0.1:8099
+    GEMINI_API_KEY=bench  HOOKS_BASE=http://127.0.0.1:8099
+
+    python -m bench.stubs --port 8099 --gemini-ms 400 --zapps-ms 80 --hooks-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS: Dict[str, float] = {"gemini": 400.0, "zapps": 80.0, "hooks": 20.0}
+JITTER = 0.3  # ± tỉ lệ ngẫu nhiên quanh latency
+CALLS: Counter = Counter()
+
+app = FastAPI(title="Bench stubs")
+
+
+async def _delay(kind: str):
+    CALLS[kind] += 1
+    base = LATENCY_MS.get(kind, 0.0) / 1000.0
+    if base > 0:
+        await asyncio.sleep(base * random.uniform(1 - JITTER, 1 + JITTER))
+
+
+def _stub_plan(prompt: str) -> Dict[str, Any]:
+    """Plan JSON đúng schema SYSTEM_PROMPT của cashybear.llm"""
+    m = re.search(r"Goal amount: ([\d.]+); Months: (\d+); Horizon: (\d+)", prompt)
+    amount, months, horizon = (float(m.group(1)), int(m.group(2)), int(m.group(3))) if m else (5_000_000.0, 3, 7)
+    day_save = round(amount / max(months * 30, 1))
+    today = date.today()
+    return {
+        "feasibility": "ok",
+        "weekly_cap_save": day_save * 7,
+        "recommended_weekly_save": day_save * 7,
+        "reasons": ["[stub] kế hoạch mẫu cho benchmark"],
+        "proposal": {"target_amount": amount, "target_date": (today + timedelta(days=months * 30)).isoformat(), "horizon_days": horizon},
+        "week_plan": [
+            {"date": (today + timedelta(days=i)).isoformat(), "tasks": ["Nấu cơm ở nhà", "Không mua trà sữa"], "day_target_save": day_save}
+            for i in range(horizon)
+        ],
+        "supervision_note": "[stub] Gấu sẽ theo dõi mỗi ngày.",
+        "confirm_question": "Bạn đồng ý kế hoạch này chứ?",
+    }
+
+
+def _gemini_text(body: Dict[str, Any]) -> str:
+    gen = body.get("generationConfig") or body.get("generation_config") or {}
+    prompt = " ".join(p.get("text", "") for c in body.get("contents") or [] for p in c.get("parts") or [])
+    if (gen.get("responseMimeType") or gen.get("response_mime_type")) == "application/json":
+        return json.dumps(_stub_plan(prompt), ensure_ascii=False)
+    return "[stub] Gấu nghe rồi nè! Mình cùng đặt mục tiêu tiết kiệm nhé, bạn muốn 7 hay 14 ngày?"
+
+
+def _candidate(text: str) -> Dict[str, Any]:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0},
+    }
+
+
+@app.post("/v1beta/models/{model_action}")
+async def gemini(model_action: str, request: Request):
+    body = await request.json()
+    await _delay("gemini")
+    text = _gemini_text(body)
+    if not model_action.endswith(":streamGenerateContent"):
+        return JSONResponse(_candidate(text))
+    parts = [text[i:i + 40] for i in range(0, len(text), 40)] or [""]
+    if request.query_params.get("alt") == "sse":
+        async def sse():
+            for p in parts:
+                yield f"data: {json.dumps(_candidate(p), ensure_ascii=False)}\n\n"
+        return StreamingResponse(sse(), media_type="text/event-stream")
+    # alt=json: mảng JSON được stream dần
+    async def arr():
+        for i, p in enumerate(parts):
+            yield ("[" if i == 0 else ",") + json.dumps(_candidate(p), ensure_ascii=False)
+        yield "]"
+    return StreamingResponse(arr(), media_type="application/json")
+
+
+@app.post("/{bot_token}/sendMessage")
+async def zapps_send_message(bot_token: str, request: Request):
+    body = await request.json()
+    await _delay("zapps")
+    return {"ok": True, "result": {"message_id": f"stub-{CALLS['zapps']}", "chat": {"id": body.get("chat_id")}, "text": body.get("text")}}
+
+
+@app.get("/_stats")
+async def stats():
+    return {"calls": dict(CALLS), "latency_ms": LATENCY_MS}
+
+
+@app.post("/{path:path}")
+async def hooks(path: str, request: Request):
+    await request.body()
+    await _delay("hooks")
+    return {"ok": True, "path": "/" + path}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="bench.stubs", description="Stub zapps / Gemini / hook server for load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--gemini-ms", type=float, default=LATENCY_MS["gemini"])
+    ap.add_argument("--zapps-ms", type=float, default=LATENCY_MS["zapps"])
+    ap.add_argument("--hooks-ms", type=float, default=LATENCY_MS["hooks"])
+    args = ap.parse_args()
+    LATENCY_MS.update({"gemini": args.gemini_ms, "zapps": args.zapps_ms, "hooks": args.hooks_ms})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
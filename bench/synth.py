@@ -0,0 +1,209 @@
+"""
+Synthetic data at scale for load tests, bulk-loaded with COPY (propensity.db).
+
+    python -m bench.synth --customers 1000000 --months 2025-03..2025-08 --chunk 100000 [--truncate]
+
+Fills customer_accounts (khachhang{i} / 123456 như scripts/seed_accounts.py),
+features_monthly (đúng cột input của customer_propensity_model.joblib, số liệu
+nhất quán: spend_ratio = spend/income, dti = loan/income, ...) and
+predictions_llm_with_facts (facts từ FACT_CATALOG). Customers are generated
+and loaded chunk by chunk, so memory depends on --chunk only.
+"""
+
+import argparse
+import sys
+import time
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+
+from propensity import config as pconfig
+from propensity.db import PREDICTION_KEYS, PREDICTION_LLM_COLS, PREDICTIONS_LLM_DDL, copy_insert, copy_upsert, get_engine
+from propensity.facts import FACT_CATALOG
+from propensity.scoring import classify_decisions, feature_columns, load_model
+
+ACCOUNTS_DDL = """
+CREATE TABLE IF NOT EXISTS customer_accounts (
+  id SERIAL PRIMARY KEY,
+  customer_id INTEGER NOT NULL UNIQUE,
+  username TEXT NOT NULL UNIQUE,
+  password TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+CAT_VALUES = {
+    "season_flag": ["pre_holiday", "holiday_week", "post_holiday", None],
+    "segment": ["worker", "student", "family", "senior", "other"],
+}
+INT_COLS = {
+    "age", "digital_logins_30d", "incoming_tx_cnt_30d", "outgoing_tx_cnt_30d", "travel_tx_cnt_90d",
+    "recency_last_travel_days", "bill_autopay_active", "failed_payments_90d", "payday_cadence_days",
+    "days_since_last_payday", "upcoming_bill_due_days", "large_inflow_flag_7d", "days_since_large_inflow",
+}
+SPEND_SPLIT = ["spend_food_grocery", "spend_shopping", "spend_entertainment", "spend_travel", "spend_utilities", "spend_health", "spend_education"]
+
+
+def features_ddl(columns: List[str]) -> str:
+    defs = []
+    for c in columns:
+        if c in CAT_VALUES:
+            defs.append(f"{c} TEXT")
+        elif c in INT_COLS:
+            defs.append(f"{c} INT")
+        else:
+            defs.append(f"{c} DOUBLE PRECISION")
+    return (
+        "CREATE TABLE IF NOT EXISTS features_monthly (\n  customer_id INT NOT NULL,\n  year_month VARCHAR(7) NOT NULL,\n  "
+        + ",\n  ".join(defs)
+        + ",\n  PRIMARY KEY (customer_id, year_month)\n)"
+    )
+
+
+def month_range(spec: str) -> List[str]:
+    """'2025-03..2025-08' → ['2025-03', ..., '2025-08']; '2025-08' → ['2025-08']"""
+    start, _, end = spec.partition("..")
+    return [str(p) for p in pd.period_range(start, end or start, freq="M")]
+
+
+def gen_features(rng: np.random.Generator, ids: np.ndarray, months: List[str], columns: List[str]) -> pd.DataFrame:
+    """One row per (customer, month); per-customer base income/spend with monthly noise"""
+    n_c, n_m = len(ids), len(months)
+    n = n_c * n_m
+    base_income = np.repeat(rng.lognormal(np.log(15e6), 0.5, n_c), n_m)
+    income = base_income * rng.normal(1.0, 0.08, n).clip(0.5, 1.5)
+    spend = income * rng.uniform(0.35, 1.05, n)
+    loan = income * rng.choice([0.0, 0.1, 0.25, 0.4], n, p=[0.45, 0.25, 0.2, 0.1])
+    balance = income * rng.lognormal(0.0, 0.7, n)
+    inflow_z = rng.normal(0.0, 1.2, n)
+    large_inflow = (inflow_z > 2.0).astype(int)
+
+    d = {
+        "customer_id": np.repeat(ids, n_m),
+        "year_month": np.tile(months, n_c),
+        "age": np.repeat(rng.integers(18, 70, n_c), n_m),
+        "income": income.round(0),
+        "spend": spend.round(0),
+        "balance_avg": balance.round(0),
+        "loan": loan.round(0),
+        "digital_logins_30d": rng.poisson(12, n),
+        "incoming_tx_cnt_30d": rng.poisson(6, n),
+        "outgoing_tx_cnt_30d": rng.poisson(30, n),
+        "salary_variance": rng.uniform(0.0, 0.3, n),
+        "balance_trend_90d": rng.normal(0.0, 0.15, n),
+        "travel_tx_cnt_90d": rng.poisson(1.0, n),
+        "recency_last_travel_days": rng.integers(0, 365, n),
+        "bill_autopay_active": rng.integers(0, 2, n),
+        "failed_payments_90d": rng.poisson(0.3, n),
+        "payday_cadence_days": rng.choice([14, 30], n, p=[0.2, 0.8]),
+        "days_since_last_payday": rng.integers(0, 30, n),
+        "upcoming_bill_due_days": rng.integers(0, 30, n),
+        "balance_ratio": balance / income,
+        "surplus": (income - spend - loan).round(0),
+        "spend_ratio": spend / income,
+        "dti": loan / income,
+        "cashflow_volatility": rng.uniform(0.05, 0.6, n),
+        "liquidity_buffer": balance / np.maximum(spend, 1.0),
+        "digital_index": rng.uniform(0.0, 1.0, n),
+        "inflow_baseline_90d": (income * rng.uniform(0.9, 1.1, n)).round(0),
+        "max_inflow_z_30d": inflow_z,
+        "max_inflow_pct_30d": np.exp(inflow_z / 3.0) - 1.0,
+        "large_inflow_flag_7d": large_inflow,
+        "days_since_large_inflow": np.where(large_inflow == 1, rng.integers(0, 7, n), rng.integers(7, 180, n)),
+        "season_flag": rng.choice(np.array(CAT_VALUES["season_flag"], dtype=object), n, p=[0.15, 0.1, 0.1, 0.65]),
+        "segment": np.repeat(rng.choice(CAT_VALUES["segment"], n_c, p=[0.5, 0.15, 0.2, 0.1, 0.05]), n_m),
+    }
+    shares = rng.dirichlet(np.ones(len(SPEND_SPLIT)), n)
+    for i, c in enumerate(SPEND_SPLIT):
+        d[c] = (spend * shares[:, i]).round(0)
+    df = pd.DataFrame(d)
+    for c in columns:  # cột model mới chưa có generator riêng → nhiễu chuẩn
+        if c not in df:
+            df[c] = rng.normal(size=n)
+    return df[["customer_id", "year_month"] + columns]
+
+
+def gen_predictions(rng: np.random.Generator, feats: pd.DataFrame) -> pd.DataFrame:
+    n = len(feats)
+    p = rng.beta(2.0, 3.0, n)
+    keys = np.array(sorted(FACT_CATALOG))
+    picks = np.stack([rng.permutation(len(keys))[:3] for _ in range(min(n, 4096))])[rng.integers(0, min(n, 4096), n)]
+    sign = rng.random((n, 3)) < p[:, None]
+    pos = np.array([FACT_CATALOG[k]["pos"] for k in keys], dtype=object)
+    neg = np.array([FACT_CATALOG[k]["neg"] for k in keys], dtype=object)
+    facts = np.where(sign, pos[picks], neg[picks])
+    decision = classify_decisions(p)
+    return pd.DataFrame({
+        "customer_id": feats["customer_id"].to_numpy(),
+        "year_month": feats["year_month"].to_numpy(),
+        "probability": p.round(6),
+        "decision": decision,
+        "facts": ["; ".join(r) for r in facts.tolist()],
+        "explanation": ["[synthetic] " + d for d in decision],
+    })
+
+
+def _chunks(n_customers: int, chunk: int, start_id: int) -> Iterator[np.ndarray]:
+    for lo in range(start_id, start_id + n_customers, chunk):
+        yield np.arange(lo, min(lo + chunk, start_id + n_customers), dtype=np.int64)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="bench.synth", description="COPY-load synthetic customers/features/predictions")
+    ap.add_argument("--customers", type=int, default=100_000)
+    ap.add_argument("--start-id", type=int, default=1)
+    ap.add_argument("--months", default="2025-08", help="vd. 2025-03..2025-08")
+    ap.add_argument("--chunk", type=int, default=50_000, help="số KH mỗi lần COPY")
+    ap.add_argument("--tables", default="accounts,features,predictions")
+    ap.add_argument("--truncate", action="store_true", help="TRUNCATE trước rồi COPY thẳng (nhanh nhất, không merge)")
+    ap.add_argument("--model", default=pconfig.MODEL_FILE)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    tables = {t.strip() for t in args.tables.split(",") if t.strip()}
+    months = month_range(args.months)
+    columns = feature_columns(load_model(args.model))
+    rng = np.random.default_rng(args.seed)
+    engine = get_engine()
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(ACCOUNTS_DDL)
+        conn.exec_driver_sql(features_ddl(columns))
+        conn.exec_driver_sql(PREDICTIONS_LLM_DDL)
+        if args.truncate:
+            names = {"accounts": "customer_accounts", "features": "features_monthly", "predictions": "predictions_llm_with_facts"}
+            conn.exec_driver_sql("TRUNCATE " + ", ".join(names[t] for t in sorted(tables)))
+
+    t0 = time.perf_counter()
+    rows = 0
+    for ids in _chunks(args.customers, args.chunk, args.start_id):
+        with engine.begin() as conn:
+            if "accounts" in tables:
+                acc = pd.DataFrame({"customer_id": ids, "username": [f"khachhang{i}" for i in ids], "password": "123456"})
+                if args.truncate:
+                    copy_insert(conn, "customer_accounts", acc)
+                else:
+                    copy_upsert(conn, "customer_accounts", acc, ["customer_id"], touch_created_at=False)
+            feats = gen_features(rng, ids, months, columns) if tables & {"features", "predictions"} else None
+            if "features" in tables:
+                if args.truncate:
+                    copy_insert(conn, "features_monthly", feats)
+                else:
+                    copy_upsert(conn, "features_monthly", feats, PREDICTION_KEYS, touch_created_at=False)
+            if "predictions" in tables:
+                preds = gen_predictions(rng, feats)
+                if args.truncate:
+                    copy_insert(conn, "predictions_llm_with_facts", preds)
+                else:
+                    copy_upsert(conn, "predictions_llm_with_facts", preds, PREDICTION_KEYS, PREDICTION_LLM_COLS)
+        rows += len(ids) * len(months)
+        print(f"  {ids[-1] - args.start_id + 1}/{args.customers} customers, {rows} rows ({rows / max(time.perf_counter() - t0, 1e-9):.0f} rows/s)", flush=True)
+
+    print(f"✅ Done: {args.customers} customers × {len(months)} months in {time.perf_counter() - t0:.1f}s ({', '.join(sorted(tables))})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
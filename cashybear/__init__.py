@@ -0,0 +1,9 @@
+"""
+CashyBear persona chatbot API, packaged out of CashyBear_Persona_Chatbot.ipynb.
+
+Run with `python -m cashybear --workers 4`; the ASGI app is `cashybear.api:app`.
+"""
+
+from .planner import DayItem, PlanProposal, affordability_from_context, diff_plans, propose_week_plan_deterministic
+
+__all__ = ["DayItem", "PlanProposal", "affordability_from_context", "diff_plans", "propose_week_plan_deterministic"]
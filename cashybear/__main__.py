@@ -0,0 +1,39 @@
+"""
+Entry point: `python -m cashybear [--workers N] [--host H] [--port P]`.
+
+Schema migration runs once here, before workers are spawned; each worker then
+imports `cashybear.api:app`. Under gunicorn use
+`python -m cashybear --migrate-only` followed by
+`gunicorn -k uvicorn.workers.UvicornWorker -w N cashybear.api:app`.
+"""
+
+import argparse
+import sys
+
+import uvicorn
+
+from . import config, db
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="cashybear", description="CashyBear API server")
+    ap.add_argument("--host", default=config.HOST)
+    ap.add_argument("--port", type=int, default=config.PORT)
+    ap.add_argument("--workers", type=int, default=config.WORKERS)
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--no-migrate", action="store_true", help="skip persona_* DDL")
+    ap.add_argument("--migrate-only", action="store_true", help="run DDL and exit")
+    args = ap.parse_args()
+
+    if not args.no_migrate:
+        ok = db.migrate(db.get_engine())
+        print("DDL persona_* OK" if ok else "DDL persona_* BỎ QUA (DB không sẵn sàng)")
+        if args.migrate_only:
+            return 0 if ok else 1
+
+    uvicorn.run("cashybear.api:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,956 @@
+"""
+CashyBear HTTP API (chat, plan, dashboard, signals).
+
+ASGI entry point: `cashybear.api:app` (see `python -m cashybear`). Every worker
+imports this module on its own and lazily builds its own DB engine.
+"""
+
+import contextvars
+import json
+import threading
+import urllib.request
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from . import config, db
+from .llm import LLM_CACHE, llm_chat_reply, llm_chat_reply_stream, llm_generate_plan
+from .metrics import FAST_REPLIES, HOOK_POSTS, REGISTRY, TRACER
+from .intents import INTENTS, fast_intent, render_fast_reply
+from .invalidate import SummaryInvalidator
+from .outbox import HookDispatcher, HookEvent
+from .nlu import format_vnd, parse_amount_vi, parse_horizon_vi, parse_months_vi
+from .planner import PlanProposal, affordability_from_context, deterministic_plan, diff_plans, plan_to_dict
+from .profiles import ProfileCache
+from .signals import PredictionIndex
+from .sessions import SessionStore, make_session_store
+from .spend import SpendIngestor, make_event, week_start
+from propensity.compact import CompactScorer, load_compact
+from propensity.config import PRIORITY_SEASONS
+from propensity.scoring import classify_decisions
+from telemetry import CONTENT_TYPE, TraceMiddleware
+
+# ---------- Pydantic IO models ----------
+class ChatRequest(BaseModel):
+    customerId: int
+    persona: str
+    sessionId: str
+    message: str
+    history: Optional[List[Dict[str, str]]] = None
+    spendLogged: bool = False  # khoản chi trong tin nhắn đã ghi qua /spend/log (Zalo /trigger/spend) → không ghi lại
+
+class ChatResponse(BaseModel):
+    reply: str
+    phase: Optional[str] = None
+    planHint: Optional[str] = None  # 'proposed' | 'accepted' | None
+    plan: Optional[Dict[str, Any]] = None
+
+class ProposeRequest(BaseModel):
+    customerId: int
+    persona: str
+    amount: float
+    months: int
+    horizon: int  # 7 or 14
+    feedback: Optional[str] = None
+    prevPlan: Optional[Dict[str, Any]] = None
+
+class PlanResponse(BaseModel):
+    plan: Dict[str, Any]
+    diff: Optional[List[str]] = None
+
+class AcceptRequest(BaseModel):
+    customerId: int
+    persona: Optional[str] = None
+    plan: Dict[str, Any]
+
+class SpendLogRequest(BaseModel):
+    customerId: int
+    date: str
+    category: Optional[str] = None
+    amount: float
+    note: Optional[str] = None
+    returnTotals: bool = False  # ghi ngay (không buffer) rồi trả kèm tổng chi hôm nay/tuần này, worker nào đọc cũng thấy
+
+class OfferBatchRequest(BaseModel):
+    customerIds: List[int]
+    threshold: float = 0.6
+    year_month: str = "2025-08"
+
+class ScoreBatchRequest(BaseModel):
+    customerIds: Optional[List[int]] = None  # chấm theo features_monthly mới nhất (≤ year_month)
+    rows: Optional[List[Dict[str, Any]]] = None  # hoặc chấm trực tiếp các dòng features
+    threshold: float = 0.6
+    year_month: str = config.YEAR_MONTH
+
+class TodoUpdateRequest(BaseModel):
+    planId: str
+    dayIndex: int
+    taskIndex: int
+    progress: int
+    note: Optional[str] = None
+
+class TodoCheckRequest(BaseModel):
+    planId: str
+    dayIndex: int
+    taskIndex: int
+    done: bool
+
+# ---------- FastAPI app ----------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.HOOK_OUTBOX_ENABLED and db.get_engine() is not None:
+        HOOKS.start()
+    if config.SPEND_BATCH_ENABLED and db.get_engine() is not None:
+        SPEND.start()
+    PLAN_SUMMARY_INVALIDATOR.start()
+    if config.SIGNALS_PRELOAD and db.get_engine() is not None:
+        try:
+            n = await run_in_threadpool(PREDICTIONS.load)
+            print(f"Predictions index: {n} dòng")
+        except Exception as e:
+            print("[Cảnh báo] Nạp predictions index lỗi:", e)
+    if config.PROFILE_WARMUP > 0:
+        try:
+            n = await run_in_threadpool(warm_up_profiles, config.PROFILE_WARMUP)
+            print(f"Profile cache warm-up: {n} khách hàng")
+        except Exception as e:
+            print("[Cảnh báo] Profile warm-up lỗi:", e)
+    yield
+    SPEND.stop()
+    PLAN_SUMMARY_INVALIDATOR.stop()
+    HOOKS.stop()
+
+
+app = FastAPI(title="CashyBear API", version="0.1.0", lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=config.CORS_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(TraceMiddleware, tracer=TRACER)
+
+# ---------- Helpers ----------
+
+def _engine_or_500():
+    engine = db.get_engine()
+    if engine is None:
+        raise HTTPException(status_code=500, detail="DB engine not available")
+    return engine
+
+
+def _post_json_background(url: str, body: Dict[str, Any]) -> None:
+    """Best-effort hook, chạy nền để không chặn request"""
+    def _post():
+        try:
+            with TRACER.span("hook.urlopen", url=url):
+                urllib.request.urlopen(
+                    urllib.request.Request(
+                        url,
+                        data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                        headers={"content-type": "application/json"}
+                    ),
+                    timeout=2
+                )
+            HOOK_POSTS.inc(outcome="ok")
+        except Exception:
+            HOOK_POSTS.inc(outcome="error")
+    # copy_context: span của thread nền vẫn gắn vào trace của request đã gọi
+    threading.Thread(target=contextvars.copy_context().run, args=(_post,), daemon=True).start()
+
+
+# Zalo bridge giữ cache plan summary theo customer; báo để nó xóa khi plan/spend thay đổi.
+# Gom theo customer, 1 thread + 1 client keep-alive cho cả worker (không mở thread/urlopen mỗi request)
+PLAN_SUMMARY_INVALIDATOR = SummaryInvalidator(
+    f"{config.ZALO_BRIDGE_BASE}/plan_summary/invalidate",
+    debounce_secs=config.PLAN_INVALIDATE_DEBOUNCE_SECS,
+)
+
+
+def _notify_plan_summary_changed(customer_id) -> None:
+    PLAN_SUMMARY_INVALIDATOR.notify(customer_id)
+
+
+# Chain logging hooks (AdviceLog qua server :4000) đi qua outbox, worker nào cũng drain được
+HOOKS = HookDispatcher(
+    db.get_engine,
+    config.HOOKS_BASE,
+    batch_size=config.HOOK_BATCH_SIZE,
+    poll_secs=config.HOOK_POLL_SECS,
+    max_attempts=config.HOOK_MAX_ATTEMPTS,
+    timeout_secs=config.HOOK_TIMEOUT_SECS,
+)
+
+# /spend/log: buffer RAM, ghi micro-batch + cập nhật tổng chi ngày/tuần
+SPEND = SpendIngestor(
+    db.get_engine,
+    batch_size=config.SPEND_BATCH_SIZE,
+    flush_secs=config.SPEND_FLUSH_SECS,
+    max_buffer=config.SPEND_BUFFER_MAX,
+)
+
+
+def _plan_accept_event(customer_id, plan_id: Optional[str], persona: Optional[str], plan: Any) -> HookEvent:
+    return ("/hook/plan/accept", {
+        "customerId": int(customer_id),
+        "sessionId": f"plan-{plan_id or ''}",
+        "persona": str(persona or "Mentor"),
+        "modelVersion": config.GEMINI_MODEL_PRIMARY,
+        "plan": plan,
+    })
+
+
+def _enqueue_hooks(events: List[HookEvent]) -> None:
+    if config.HOOK_OUTBOX_ENABLED:
+        try:
+            with TRACER.span("db.enqueue_hooks"):
+                db.enqueue_hooks(db.get_engine(), events)
+            HOOKS.wake()
+            return
+        except Exception as e:
+            print("[Cảnh báo] Không ghi được hook_outbox, gửi trực tiếp:", e)
+    for path, body in events:
+        _post_json_background(f"{config.HOOKS_BASE}{path}", body)
+
+
+def _hook_chat_reply(customer_id, session_id: str, persona: Optional[str], message: str, reply: str) -> None:
+    _enqueue_hooks([("/hook/chat/reply", {
+        "customerId": int(customer_id),
+        "sessionId": str(session_id),
+        "persona": str(persona or "Mentor"),
+        "modelVersion": config.GEMINI_MODEL_PRIMARY,
+        "message": message,
+        "reply": reply,
+    })])
+
+
+def _load_profile_context(customer_id: int, year_month: str) -> Optional[Dict[str, Any]]:
+    row = db.fetch_profile(_engine_or_500(), customer_id, year_month)
+    return db.build_context(row) if row else None
+
+
+# Context đã chuẩn hóa theo (customer_id, year_month); chat turn không cần query features_monthly
+PROFILES = ProfileCache(
+    _load_profile_context,
+    max_entries=config.PROFILE_CACHE_SIZE,
+    ttl_secs=config.PROFILE_CACHE_TTL_SECS or None,
+    epoch_path=config.PROFILE_EPOCH_PATH,
+)
+
+
+def _fetch_profile_latest(customer_id: int) -> Dict[str, Any]:
+    TRACER.tag(customer_id=customer_id)
+    with TRACER.span("profile"):
+        ctx = PROFILES.get(customer_id, config.YEAR_MONTH)
+    if ctx is None:
+        raise HTTPException(status_code=404, detail="Customer profile not found")
+    return ctx
+
+
+def warm_up_profiles(limit: int) -> int:
+    """Nạp sẵn context của các KH có plan gần đây"""
+    rows = db.fetch_active_profiles(db.get_engine(), config.YEAR_MONTH, limit=limit)
+    return PROFILES.warm_up((int(r["customer_id"]), config.YEAR_MONTH, db.build_context(r)) for r in rows)
+
+
+def _call_llm_generate_plan(persona: str, ctx: Dict[str, Any], amount: float, months: int, horizon: int, feedback: Optional[str], prev_plan: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Gọi đúng chữ ký và tắt fallback theo yêu cầu
+    try:
+        res = llm_generate_plan(ctx=ctx, goal_amount=amount, months=months, horizon_days=horizon, persona=persona, feedback=feedback or "", allow_fallback=False, prev_plan=prev_plan)
+        return plan_to_dict(res)
+    except Exception:
+        pass
+    # Fallback tối thiểu (nếu thật sự cần) — tính tuần và dựng kế hoạch deterministic
+    try:
+        return plan_to_dict(deterministic_plan(ctx, amount, months, horizon))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Planner fallback error: {e}")
+
+
+@app.get("/health")
+async def health():
+    return {"ok": True}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text format: histogram theo stage/route + counters (cache, LLM, hooks)"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/slow")
+async def debug_slow(limit: int = 20, name: Optional[str] = None):
+    """Slowest recent requests of this worker, with per-stage breakdown (name: lọc theo route, vd. /chat/reply)"""
+    return {"worker_traces": TRACER.slowest(limit, name)}
+
+@app.get("/profiles/stats")
+async def profiles_stats():
+    return PROFILES.stats()
+
+@app.post("/profiles/invalidate")
+async def profiles_invalidate(payload: Optional[Dict[str, Any]] = None):
+    """Gọi sau khi nạp features_monthly mới: { customerId?: number } (bỏ trống = xóa hết, mọi worker)"""
+    customer_id = (payload or {}).get("customerId")
+    dropped = PROFILES.invalidate(int(customer_id) if customer_id is not None else None)
+    return {"ok": True, "dropped": dropped}
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return SESSIONS.stats()
+
+@app.get("/hooks/outbox/stats")
+async def hooks_outbox_stats():
+    """Backlog depth (pending/dead/oldest) + counters của dispatcher trong worker này"""
+    try:
+        return await run_in_threadpool(HOOKS.stats)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Outbox stats error: {e}")
+
+@app.get("/llm/cache/stats")
+async def llm_cache_stats():
+    return LLM_CACHE.stats()
+
+# ---- Session store (sqlite: dùng chung giữa các worker) ----
+SESSIONS: SessionStore = make_session_store()
+
+
+def _reply_text(out: Any) -> str:
+    return str(out.get("reply", "")) if isinstance(out, dict) else str(out)
+
+
+def _chat_response(out: Any, phase: Optional[str]) -> ChatResponse:
+    if isinstance(out, dict):
+        return ChatResponse(reply=_reply_text(out), planHint=out.get("planHint"), plan=out.get("plan"), phase=phase)
+    return ChatResponse(reply=_reply_text(out), phase=phase)
+
+
+def _run_turn(turn: Iterator[str]) -> Any:
+    """Chạy hết generator của _reply_turn, trả về kết quả cuối"""
+    while True:
+        try:
+            next(turn)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _assistant_reply_http(session_id: str, persona: str, customer_id: int, text_msg: str, spend_logged: bool = False):
+    """One chat turn: load session → reply → save session. Returns (reply, phase)."""
+    TRACER.tag(session_id=session_id, customer_id=customer_id)
+    with TRACER.span("session.load"):
+        st = SESSIONS.load(session_id)
+    try:
+        out = _run_turn(_reply_turn(st, persona, customer_id, text_msg, spend_logged=spend_logged))
+    finally:
+        with TRACER.span("session.save"):
+            SESSIONS.save(session_id, st)
+    _hook_chat_reply(customer_id, session_id, persona, text_msg, _reply_text(out))
+    return out, st.get("phase")
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _assistant_reply_sse(session_id: str, persona: str, customer_id: int, text_msg: str, spend_logged: bool = False) -> Iterator[str]:
+    """Streaming chat turn: `delta` events as text is generated, then one `done` event (same fields as /chat/reply).
+    Any failure after the 200 headers ends the stream with one `error` event instead (client never waits for `done`)."""
+    TRACER.tag(session_id=session_id, customer_id=customer_id)
+    try:
+        with TRACER.span("session.load"):
+            st = SESSIONS.load(session_id)
+    except Exception as e:
+        print("[Cảnh báo] Chat stream không đọc được session:", e)
+        yield _sse("error", {"status": 500, "detail": f"Session error: {e}"})
+        return
+    streamed = False
+    error: Optional[Dict[str, Any]] = None
+    try:
+        turn = _reply_turn(st, persona, customer_id, text_msg, stream=True, spend_logged=spend_logged)
+        while True:
+            try:
+                piece = next(turn)
+            except StopIteration as stop:
+                out = stop.value
+                break
+            streamed = True
+            yield _sse("delta", {"text": piece})
+    except HTTPException as e:
+        error = {"status": e.status_code, "detail": e.detail}
+    except Exception as e:
+        print("[Cảnh báo] Chat stream lỗi:", e)
+        error = {"status": 500, "detail": f"Chat error: {e}"}
+    finally:
+        # lưu session cả khi lỗi / client ngắt (lịch sử + state đã cập nhật tới đâu giữ tới đó)
+        try:
+            with TRACER.span("session.save"):
+                SESSIONS.save(session_id, st)
+        except Exception as e:
+            print("[Cảnh báo] Chat stream không lưu được session:", e)
+            error = error or {"status": 500, "detail": f"Session error: {e}"}
+    if error is not None:
+        yield _sse("error", error)
+        return
+    if not streamed:
+        # plan propose/accept không stream: gửi nguyên câu trả lời một lần
+        yield _sse("delta", {"text": _reply_text(out)})
+    _hook_chat_reply(customer_id, session_id, persona, text_msg, _reply_text(out))
+    yield _sse("done", _chat_response(out, st.get("phase")).model_dump())
+
+
+def _reply_turn(st: Dict[str, Any], persona: str, customer_id: int, text_msg: str, stream: bool = False, spend_logged: bool = False):
+    """Generator: yields reply chunks (free chat, stream=True only) and returns the final reply/plan dict.
+    spend_logged: the spend in text_msg is already recorded (fast path only reads the totals)."""
+    # Load context
+    ctx = _fetch_profile_latest(customer_id)
+    st["ctx"] = ctx
+
+    # Update history
+    st["history"].append({"role": "user", "text": text_msg})
+
+    # Extract intents (cashybear.intents: 1 lượt regex trên text đã bỏ dấu)
+    found = INTENTS.match(text_msg)
+    is_accept = "accept" in found
+    is_change = "change" in found
+    amt = parse_amount_vi(text_msg)
+    fast = fast_intent(found, amt, spend_logged) if config.INTENT_FASTPATH else None
+    spent = None
+    if fast == "spend":
+        # "mình vừa chi 150k" là khoản chi, không phải mục tiêu tiết kiệm
+        spent, amt, mon, hz = amt, None, None, None
+    else:
+        mon = parse_months_vi(text_msg)
+        hz = parse_horizon_vi(text_msg)
+    if amt is not None:
+        st["goal_amount"] = amt
+    if mon is not None:
+        st["months"] = mon
+    if hz is not None:
+        st["horizon"] = hz
+
+    goal_amount = st["goal_amount"]
+    months = st["months"]
+    horizon = st["horizon"]
+
+    # Only allow regen when explicit change intent
+    if is_change:
+        st["plan_generated"] = False
+        st["phase"] = "awaiting_goal"
+        # keep horizon only if user specified again
+        if hz is None:
+            st["horizon"] = None
+
+    # Decide phase (do not move phases after having a plan unless change intent)
+    if not st.get("plan_generated"):
+        if goal_amount is not None and months is not None and horizon not in (7, 14):
+            st["phase"] = "awaiting_horizon"
+        elif goal_amount is not None and months is not None and horizon in (7, 14):
+            st["phase"] = "proposed"
+        else:
+            st["phase"] = st.get("phase", "awaiting_goal")
+    else:
+        # keep current phase (accepted/proposed) when plan already exists
+        st["phase"] = st.get("phase", "accepted")
+
+    # Generate plan if ready
+    if st["phase"] == "proposed" and not st.get("plan_generated"):
+        plan = None
+        try:
+            plan = llm_generate_plan(ctx=ctx, goal_amount=float(goal_amount), months=int(months), horizon_days=int(horizon), persona=persona, feedback="", allow_fallback=False, prev_plan=None)
+            st["last_plan"] = plan_to_dict(plan)
+            # Render like notebook UI
+            lines = [f"Kế hoạch {horizon} ngày gợi ý:"]
+            for d in plan.week_plan:
+                formatted = [(t.strip().rstrip('.') + '.') if t else '' for t in d.tasks]
+                lines.append(f"- {d.date}: {format_vnd(d.day_target_save)} | " + "; ".join(formatted))
+            lines.append("Mình sẽ giám sát {h} ngày này. Đạt → tiếp tục; Không đạt → mình chỉnh kế hoạch.".format(h=horizon))
+            reply = "\n".join(lines)
+            st["plan_generated"] = True
+        except Exception:
+            reply = "Tôi không thể xác minh điều này."
+        st["history"].append({"role": "assistant", "text": reply})
+        return {"reply": reply, "planHint": "proposed", "plan": (plan_to_dict(plan) if plan is not None else None)}
+
+    # If plan already generated, detect accept/ok; otherwise chat normally
+    if st.get("plan_generated") and is_accept:
+        # Save once if not saved
+        try:
+            if not st.get("saved_plan_id") and st.get("last_plan") is not None:
+                plan_dict = plan_to_dict(st["last_plan"])
+                with TRACER.span("db.persist_plan"):
+                    st["saved_plan_id"] = db.persist_plan_and_tasks(
+                        db.get_engine(), st["last_plan"], str(customer_id), persona,
+                        hook_events=lambda pid: [_plan_accept_event(customer_id, pid, persona, plan_dict)],
+                    )
+                _notify_plan_summary_changed(customer_id)
+                HOOKS.wake()
+            else:
+                _enqueue_hooks([_plan_accept_event(customer_id, st.get("saved_plan_id"), persona, plan_to_dict(st.get("last_plan")))])
+        except Exception:
+            pass
+        reply = "Tuyệt! Mình đã ghi nhận kế hoạch. Bạn có thể theo dõi tiến độ ở Dashboard To‑do."
+        st["history"].append({"role": "assistant", "text": reply})
+        st["phase"] = "accepted"
+        return {"reply": reply, "planHint": "accepted", "plan": (plan_to_dict(st["last_plan"]) if st.get("last_plan") is not None else None)}
+
+    # Intent đơn giản: template theo persona + plan summary, không gọi Gemini
+    if fast is not None:
+        reply = _fast_reply(fast, persona, st["phase"], customer_id, spent, spend_logged=spend_logged)
+        if reply is not None:
+            st["history"].append({"role": "assistant", "text": reply})
+            return reply
+
+    # Otherwise, fall back to chat reply with current phase
+    try:
+        aff = None
+        if goal_amount is not None and months is not None:
+            aff = affordability_from_context(ctx, float(goal_amount), int(months))
+        kwargs = dict(ctx=ctx, persona=persona, text=text_msg, phase=st["phase"], goal_amount=goal_amount, months=months, horizon=horizon, aff=aff, history=st["history"], plan=None)
+        if stream:
+            parts = []
+            for piece in llm_chat_reply_stream(**kwargs):
+                parts.append(piece)
+                yield piece
+            reply = "".join(parts)
+        else:
+            reply = llm_chat_reply(**kwargs)
+    except Exception:
+        reply = "Tôi không thể xác minh điều này."
+    st["history"].append({"role": "assistant", "text": reply})
+    return reply
+
+
+def _fast_reply(intent: str, persona: str, phase: Optional[str], customer_id: int, amount: Optional[float], spend_logged: bool = False) -> Optional[str]:
+    """Template reply, or None (→ LLM) when the plan summary / spend totals it needs cannot be read.
+    spend: ghi khoản chi (trừ khi spend_logged) rồi trả lời theo tổng chi hôm nay/tuần này"""
+    summary = spend = None
+    try:
+        engine = _engine_or_500() if intent in ("spend", "progress") else None
+        if intent == "spend":
+            if not spend_logged:
+                _store_spend(engine, make_event(customer_id, date.today(), float(amount), "chat", ""))
+                _notify_plan_summary_changed(customer_id)
+            with TRACER.span("db.spend_totals"):
+                spend = _spend_totals(engine, customer_id, date.today())
+        elif intent == "progress":
+            with TRACER.span("db.dashboard"):
+                summary = db.fetch_dashboard(engine, str(customer_id), include_tasks=False)
+    except Exception as e:
+        print("[Cảnh báo] Fast path không ghi/đọc được dữ liệu plan/chi tiêu:", e)
+        return None
+    FAST_REPLIES.inc(intent=intent)
+    return render_fast_reply(intent, persona, phase, amount=amount, summary=summary, spend=spend)
+
+
+@app.post("/chat/reply", response_model=ChatResponse)
+async def chat_reply(req: ChatRequest):
+    # profile/Gemini/session/DB đều blocking → threadpool, event loop chỉ điều phối
+    out, phase = await run_in_threadpool(_assistant_reply_http, req.sessionId, req.persona, req.customerId, req.message, req.spendLogged)
+    # Optionally return phase for FE debugging
+    return _chat_response(out, phase)
+
+@app.post("/chat/reply/stream")
+async def chat_reply_stream(req: ChatRequest):
+    """SSE: `event: delta` {text} khi model sinh chữ, cuối cùng `event: done` {reply, phase, planHint, plan}"""
+    return StreamingResponse(
+        _assistant_reply_sse(req.sessionId, req.persona, req.customerId, req.message, req.spendLogged),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/plan/propose", response_model=PlanResponse)
+async def plan_propose(req: ProposeRequest):
+    ctx = await run_in_threadpool(_fetch_profile_latest, req.customerId)
+    plan = await run_in_threadpool(_call_llm_generate_plan, req.persona, ctx, req.amount, req.months, req.horizon, req.feedback, req.prevPlan)
+    return PlanResponse(plan=plan)
+
+@app.post("/plan/regen", response_model=PlanResponse)
+async def plan_regen(req: ProposeRequest):
+    ctx = await run_in_threadpool(_fetch_profile_latest, req.customerId)
+    plan = await run_in_threadpool(_call_llm_generate_plan, req.persona, ctx, req.amount, req.months, req.horizon, req.feedback, req.prevPlan)
+    diff_obj = None
+    if req.prevPlan:
+        try:
+            diff_obj = diff_plans(req.prevPlan, plan)
+        except Exception:
+            diff_obj = None
+    return PlanResponse(plan=plan, diff=diff_obj)
+
+@app.post("/plan/accept")
+async def plan_accept(req: AcceptRequest):
+    plan_id = None
+    error = None
+    engine = db.get_engine()
+    if req.plan:
+        try:
+            # Hook ghi vào outbox trong cùng transaction; dispatcher gửi sau, request không chờ node
+            with TRACER.span("db.persist_plan"):
+                plan_id = await db.run_sync(
+                    db.persist_plan_and_tasks,
+                    engine, PlanProposal(**req.plan), str(req.customerId), req.persona or "Mentor",
+                    hook_events=lambda pid: [_plan_accept_event(req.customerId, pid, req.persona, req.plan)],
+                )
+            if plan_id:
+                _notify_plan_summary_changed(req.customerId)
+                HOOKS.wake()
+        except Exception as e:
+            error = str(e)
+            plan_id = None
+    # "db": tên DB từ cấu hình (trước đây SELECT current_database() mỗi request)
+    return {"ok": bool(plan_id), "plan_id": plan_id, "db": (config.PG_DB if engine is not None else None), "error": error}
+
+def _spend_totals(engine: Any, customer_id: int, day: date) -> Dict[str, Any]:
+    """Tổng chi ngày/tuần (bảng tổng hợp + event chưa flush) so với mức ~recommended_weekly_save/7 mỗi ngày"""
+    with engine.connect() as conn:
+        t = SPEND.totals(conn, customer_id, day)
+    header = db.fetch_plan_header(engine, str(customer_id))
+    rec_week = header.get("recommended_weekly_save") if header else None
+    weekly = float(rec_week) if rec_week is not None else None
+    daily = weekly / 7.0 if weekly is not None else None
+    return {
+        "date": day.isoformat(),
+        "weekStart": week_start(day).isoformat(),
+        "todaySpend": t["day_amount"],
+        "todayEvents": t["day_events"],
+        "weekSpend": t["week_amount"],
+        "weekEvents": t["week_events"],
+        "dailyTarget": daily,
+        "weeklyTarget": weekly,
+        # over/within theo tổng chi thực tế hôm nay, không phải riêng khoản vừa chi
+        "status": (None if daily is None else ("over" if t["day_amount"] > daily else "within")),
+        "overBy": (t["day_amount"] - daily if daily is not None else None),
+    }
+
+
+def _store_spend(engine: Any, ev: Dict[str, Any], buffered: bool = True) -> bool:
+    """Buffer the event (micro-batch) or, when batching is off / the buffer is full / buffered=False,
+    write it now; returns True when it was buffered"""
+    if buffered and SPEND.running and SPEND.submit(ev):
+        return True
+    with TRACER.span("db.insert_spend"):
+        db.ingest_spend(engine, [ev])
+    return False
+
+
+@app.post("/spend/log")
+async def spend_log(req: SpendLogRequest):
+    """Ghi khoản chi: vào buffer (ghi DB theo micro-batch); buffer đầy / tắt batch / returnTotals → ghi ngay"""
+    try:
+        ev = make_event(req.customerId, req.date, req.amount, req.category or "", req.note or "")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid spend event: {e}")
+    engine = db.get_engine()
+    try:
+        # returnTotals: caller (Zalo /trigger/spend) đọc lại tổng ngay, có thể qua worker khác → không để trong buffer
+        queued = await db.run_sync(_store_spend, engine, ev, not req.returnTotals)
+    except Exception as e:
+        print("[Cảnh báo] Ghi chi tiêu lỗi:", e)
+        return {"ok": False, "queued": False, "eventId": None, "error": str(e)}
+    _notify_plan_summary_changed(req.customerId)
+    out: Dict[str, Any] = {"ok": True, "queued": queued, "eventId": ev["event_id"]}
+    if req.returnTotals and engine is not None:
+        try:
+            with TRACER.span("db.spend_totals"):
+                out["spend"] = await db.run_sync(_spend_totals, engine, req.customerId, date.fromisoformat(ev["date"]))
+        except Exception as e:
+            print("[Cảnh báo] Đọc tổng chi tiêu lỗi:", e)
+            out["spend"] = None
+    return out
+
+@app.get("/spend/summary")
+async def spend_summary(customerId: int, day: Optional[str] = None):
+    """Tổng chi hôm nay / tuần này (mặc định: ngày hiện tại) + trạng thái so với kế hoạch"""
+    try:
+        d = date.fromisoformat(day[:10]) if day else date.today()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid day: {day}")
+    engine = _engine_or_500()
+    try:
+        with TRACER.span("db.spend_totals"):
+            return await db.run_sync(_spend_totals, engine, customerId, d)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Spend summary error: {e}")
+
+@app.post("/spend/flush")
+async def spend_flush():
+    """Ghi ngay phần buffer của worker này (test / trước khi deploy)"""
+    n = 0
+    try:
+        while True:
+            k = await db.run_sync(SPEND.flush)
+            if not k:
+                break
+            n += k
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Spend flush error: {e}")
+    return {"ok": True, "flushed": n, **SPEND.stats()}
+
+@app.get("/spend/stats")
+async def spend_stats():
+    return SPEND.stats()
+
+# Latest prediction theo (customer_id, year_month), nạp lúc khởi động + refresh theo watermark
+PREDICTIONS = PredictionIndex(db.get_engine, refresh_secs=config.SIGNALS_REFRESH_SECS)
+
+# Counters mà cache/dispatcher đã tự đếm: đọc lúc scrape, không đếm hai lần
+REGISTRY.callback(
+    "cashybear_llm_cache_requests_total", "LLM cache lookups by namespace and result", "counter", ["namespace", "result"],
+    lambda: {(ns, r): st[r] for ns, st in LLM_CACHE.stats().items() if isinstance(st, dict) for r in ("hits", "misses", "coalesced")},
+)
+REGISTRY.callback(
+    "cashybear_profile_cache_requests_total", "Profile context cache lookups", "counter", ["result"],
+    lambda: {("hit",): PROFILES.hits, ("miss",): PROFILES.misses},
+)
+REGISTRY.callback(
+    "cashybear_hook_outbox_deliveries_total", "Outbox hook deliveries by this worker's dispatcher", "counter", ["outcome"],
+    lambda: {("delivered",): HOOKS.delivered, ("failed",): HOOKS.failed},
+)
+REGISTRY.callback(
+    "cashybear_spend_events_total", "Spend events written by this worker's micro-batcher", "counter", ["outcome"],
+    lambda: {("flushed",): SPEND.flushed, ("rejected",): SPEND.rejected},
+)
+REGISTRY.callback(
+    "cashybear_plan_summary_invalidations_total", "Plan-summary invalidations requested vs. customer ids posted to the Zalo bridge", "counter", ["outcome"],
+    lambda: {("requested",): PLAN_SUMMARY_INVALIDATOR.requested, ("sent",): PLAN_SUMMARY_INVALIDATOR.sent},
+)
+REGISTRY.callback(
+    "cashybear_spend_buffered", "Spend events buffered in this worker, not yet written", "gauge", [],
+    lambda: {(): SPEND.stats()["buffered"]},
+)
+
+OFFER_MESSAGE = {
+    "title": "Ưu đãi dành riêng cho bạn – Đừng bỏ lỡ!",
+    "lines": [
+        "👉 Đặt vé bay ngay hôm nay để được giảm 20%.",
+        "⏰ Voucher chỉ còn hiệu lực 1 ngày nữa – tranh thủ kẻo lỡ nha!",
+    ],
+    "timeoutMs": 10000,
+}
+
+
+def _offer_signal(row: Optional[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    probability = row["probability"] if row else None
+    return {
+        "shouldNotify": probability is not None and probability > float(threshold),
+        "probability": probability,
+        "decision": (row["decision"] if row else None),
+        "facts": (row["facts"] if row else None),
+    }
+
+
+@app.get("/signals/offer")
+async def offer(customerId: int, threshold: float = 0.6, year_month: str = "2025-08", fresh: bool = False):
+    """fresh=true: probability/decision chấm lại từ features hiện tại (facts vẫn lấy từ predictions)"""
+    _engine_or_500()
+    row = await run_in_threadpool(PREDICTIONS.get, customerId, year_month)
+    if fresh:
+        live = await _score_customers([customerId], year_month, threshold)
+        if live:
+            row = {**(row or {"facts": None}), "probability": live[0]["probability"], "decision": live[0]["decision"]}
+    sig = _offer_signal(row, threshold)
+    return {**sig, "year_month": year_month, "message": (OFFER_MESSAGE if sig["shouldNotify"] else None)}
+
+@app.post("/signals/offer/batch")
+async def offer_batch(req: OfferBatchRequest):
+    """Offer signal cho cả danh sách KH (campaign sweep): 1 lần tra index mỗi KH, không query DB"""
+    _engine_or_500()
+    rows = await run_in_threadpool(PREDICTIONS.get_many, req.customerIds, req.year_month)
+    results = [{"customerId": cid, **_offer_signal(row, req.threshold)} for cid, row in rows]
+    return {
+        "year_month": req.year_month,
+        "threshold": req.threshold,
+        "notifyCount": sum(1 for r in results if r["shouldNotify"]),
+        "results": results,
+        "message": OFFER_MESSAGE,
+    }
+
+@app.post("/signals/refresh")
+async def signals_refresh(payload: Optional[Dict[str, Any]] = None):
+    """Gọi sau khi notebook scoring upsert: { full?: bool } (mặc định incremental theo watermark)"""
+    _engine_or_500()
+    full = bool((payload or {}).get("full"))
+    try:
+        n = await run_in_threadpool(PREDICTIONS.load if full else PREDICTIONS.refresh)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Predictions refresh error: {e}")
+    return {"ok": True, "updated": n, **PREDICTIONS.stats()}
+
+@app.get("/signals/stats")
+async def signals_stats():
+    return PREDICTIONS.stats()
+
+def _scorer() -> CompactScorer:
+    try:
+        return load_compact(config.SCORER_FILE)
+    except (OSError, ValueError, KeyError) as e:
+        raise HTTPException(status_code=503, detail=f"Scorer not available ({config.SCORER_FILE}): {e}")
+
+
+def _score_rows(scorer: CompactScorer, rows: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """features_monthly rows → probability, decision, priority_send (NumPy scorer, không cần scikit-learn)"""
+    with TRACER.span("score"):
+        try:
+            proba = scorer.predict_records(rows)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid features: {e}")
+        decisions = classify_decisions(proba)
+    return [
+        {
+            "customerId": (int(r["customer_id"]) if r.get("customer_id") is not None else None),
+            "year_month": (str(r["year_month"]) if r.get("year_month") is not None else None),
+            "probability": float(p),
+            "decision": str(d),
+            "prioritySend": bool(r.get("large_inflow_flag_7d") == 1 or r.get("season_flag") in PRIORITY_SEASONS),
+            "shouldNotify": bool(p > float(threshold)),
+        }
+        for r, p, d in zip(rows, proba, decisions)
+    ]
+
+
+async def _score_customers(customer_ids: List[int], year_month: str, threshold: float) -> List[Dict[str, Any]]:
+    scorer, engine = _scorer(), _engine_or_500()
+
+    def work() -> List[Dict[str, Any]]:
+        with TRACER.span("db.features"):
+            rows = db.fetch_profiles(engine, customer_ids, year_month)
+        return _score_rows(scorer, rows, threshold) if rows else []
+
+    return await db.run_sync(work)
+
+
+@app.get("/signals/score")
+async def signals_score(customerId: int, threshold: float = 0.6, year_month: str = config.YEAR_MONTH):
+    """Chấm điểm real-time từ features_monthly mới nhất (≤ year_month), không đọc predictions"""
+    TRACER.tag(customer_id=customerId)
+    results = await _score_customers([customerId], year_month, threshold)
+    if not results:
+        raise HTTPException(status_code=404, detail="Customer features not found")
+    return {**results[0], "modelVersion": _scorer().version}
+
+@app.post("/signals/score")
+async def signals_score_batch(req: ScoreBatchRequest):
+    """Batch: { customerIds } (1 query features_monthly) hoặc { rows } (dòng features gửi kèm, không query DB)"""
+    if (req.customerIds is None) == (req.rows is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of customerIds or rows")
+    n = len(req.customerIds if req.customerIds is not None else req.rows)
+    if n > config.SCORE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large ({n} > {config.SCORE_BATCH_MAX})")
+    scorer = _scorer()
+    if req.customerIds is not None:
+        results = await _score_customers(req.customerIds, req.year_month, req.threshold)
+        found = {r["customerId"] for r in results}
+        missing = [cid for cid in dict.fromkeys(req.customerIds) if cid not in found]
+    else:
+        results = await run_in_threadpool(_score_rows, scorer, req.rows, req.threshold) if req.rows else []
+        missing = []
+    return {
+        "year_month": req.year_month,
+        "threshold": req.threshold,
+        "modelVersion": scorer.version,
+        "notifyCount": sum(1 for r in results if r["shouldNotify"]),
+        "results": results,
+        "missing": missing,
+    }
+
+# ---------- Dashboard APIs ----------
+
+def _parse_amount_loose(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except Exception:
+        try:
+            return float(str(value).replace(",", "").replace("_", "").replace("đ", "").replace("VND", "").strip())
+        except Exception:
+            return None
+
+@app.get("/dashboard/summary")
+async def dashboard_summary(customerId: int):
+    """Plan header only (no task rows) – dùng cho Zalo /trigger/spend"""
+    engine = _engine_or_500()
+    with TRACER.span("db.dashboard"):
+        row = await db.run_sync(db.fetch_plan_header, engine, str(customerId))
+    if not row:
+        return {"planId": None, "createdAt": None, "recommendedWeeklySave": None, "weeklyCapSave": None, "targetAmount": None}
+    return {
+        "planId": str(row["plan_id"]),
+        "createdAt": (str(row["created_at"]) if row["created_at"] else None),
+        "recommendedWeeklySave": (float(row["recommended_weekly_save"]) if row["recommended_weekly_save"] is not None else None),
+        "weeklyCapSave": (float(row["weekly_cap_save"]) if row["weekly_cap_save"] is not None else None),
+        "targetAmount": (_parse_amount_loose(row["target_amount"]) if row["target_amount"] is not None else None),
+    }
+
+@app.get("/dashboard/todo")
+async def dashboard_todo(customerId: int, includeTasks: bool = False, includeSpend: bool = False):
+    """Tiến độ plan mới nhất: đọc bảng tổng hợp persona_plan_progress (1 query). Mặc định chỉ summary (đường polling);
+    includeTasks=true → thêm danh sách task, includeSpend=true → thêm summary.spend (tổng chi hôm nay/tuần, như /spend/summary)"""
+    try:
+        engine = _engine_or_500()
+        with TRACER.span("db.dashboard"):
+            row = await db.run_sync(db.fetch_dashboard, engine, str(customerId), include_tasks=includeTasks)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Dashboard error: {e}")
+    if not row:
+        return {"planId": None, "tasks": [], "summary": {"totalTasks": 0, "completedTasks": 0, "completionPct": 0.0, "perDay": [], "targetAmount": None, "recommendedWeeklySave": None, "weeklyCapSave": None, "remainingAmount": None}}
+
+    total = int(row["total_tasks"] or 0)
+    pct = (int(row["sum_progress"] or 0) / (total * 100) * 100.0) if total else 0.0
+    saved_amount = float(row["saved_amount"] or 0.0)
+    target_amount = _parse_amount_loose(row["target_amount"]) if row["target_amount"] is not None else None
+    remaining_amount = None
+    if target_amount is not None:
+        remaining_amount = max(float(target_amount) - saved_amount, 0.0)
+    per_day = row["per_day"]
+    if isinstance(per_day, str):
+        per_day = json.loads(per_day)
+    tasks = row["tasks"]
+    if isinstance(tasks, str):
+        tasks = json.loads(tasks)
+
+    return {
+        "planId": str(row["plan_id"]),
+        "tasks": tasks or [],
+        "summary": {
+            "totalTasks": total,
+            "completedTasks": int(row["completed_tasks"] or 0),
+            "completionPct": pct,
+            "perDay": per_day or [],
+            "targetAmount": target_amount,
+            "recommendedWeeklySave": (float(row["recommended_weekly_save"]) if row["recommended_weekly_save"] is not None else None),
+            "weeklyCapSave": (float(row["weekly_cap_save"]) if row["weekly_cap_save"] is not None else None),
+            "remainingAmount": remaining_amount,
+            "savedAmount": saved_amount,
+            **({"spend": await _spend_summary_or_none(engine, customerId)} if includeSpend else {}),
+        }
+    }
+
+
+async def _spend_summary_or_none(engine: Any, customer_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        with TRACER.span("db.spend_totals"):
+            return await db.run_sync(_spend_totals, engine, customer_id, date.today())
+    except Exception as e:
+        print("[Cảnh báo] Đọc tổng chi tiêu lỗi:", e)
+        return None
+
+@app.post("/dashboard/todo/update")
+async def dashboard_todo_update(req: TodoUpdateRequest):
+    engine = _engine_or_500()
+    progress = req.progress
+    # snap to 0/25/50/75/100
+    progress = max(0, min(100, int(round(progress/25)*25)))
+    status = 'done' if progress >= 100 else ('in_progress' if progress > 0 else 'todo')
+    # task + log + persona_plan_progress trong cùng transaction
+    with TRACER.span("db.update_task"):
+        await db.run_sync(db.update_task_progress, engine, req.planId, req.dayIndex, req.taskIndex, progress, status, req.note or '')
+    return {"ok": True, "progress": progress, "status": status}
+
+@app.post("/dashboard/todo/check")
+async def dashboard_todo_check(req: TodoCheckRequest):
+    target = 100 if req.done else 0
+    return await dashboard_todo_update(TodoUpdateRequest(planId=req.planId, dayIndex=req.dayIndex, taskIndex=req.taskIndex, progress=target, note=None))
@@ -0,0 +1,85 @@
+"""Service configuration (env vars, defaults = notebook demo values)."""
+
+import os
+
+# Postgres
+PG_HOST = os.getenv("PG_HOST", "127.0.0.1")
+PG_PORT = int(os.getenv("PG_PORT", "5435"))
+PG_DB = os.getenv("PG_DB", "db_fin")
+PG_USER = os.getenv("PG_USER", "HiepData")
+PG_PASSWORD = os.getenv("PG_PASSWORD", "123456")
+
+# Connection pool mỗi worker: handler chạy query qua threadpool riêng cùng cỡ với pool (db.run_sync)
+DB_POOL_SIZE = int(os.getenv("CASHYBEAR_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("CASHYBEAR_DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECS = float(os.getenv("CASHYBEAR_DB_POOL_TIMEOUT_SECS", "5"))
+DB_POOL_RECYCLE_SECS = int(os.getenv("CASHYBEAR_DB_POOL_RECYCLE_SECS", "1800"))
+DB_PRE_PING = os.getenv("CASHYBEAR_DB_PRE_PING", "0") == "1"  # 1 = thêm round trip kiểm tra mỗi lần checkout
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("CASHYBEAR_DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Gemini
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "API-Key")
+GEMINI_MODEL_PRIMARY = os.getenv("GEMINI_MODEL_PRIMARY", "gemini-2.0-flash")
+GEMINI_MODEL_FALLBACK = os.getenv("GEMINI_MODEL_FALLBACK", "gemini-1.5-flash")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")  # "" = Google; vd. http://127.0.0.1:8099 (bench/stubs.py, REST)
+
+# LLM response cache (RAM LRU + SQLite dùng chung, "" = chỉ RAM)
+LLM_CACHE_DB_PATH = os.getenv("CASHYBEAR_LLM_CACHE_DB", "cashybear_llm_cache.db")
+LLM_CACHE_SIZE = int(os.getenv("CASHYBEAR_LLM_CACHE_SIZE", "2000"))
+LLM_PLAN_TTL_SECS = float(os.getenv("CASHYBEAR_LLM_PLAN_TTL_SECS", str(7 * 24 * 3600)))
+LLM_CHAT_TTL_SECS = float(os.getenv("CASHYBEAR_LLM_CHAT_TTL_SECS", str(3600)))
+
+# Chào / cảm ơn / "vừa chi X" / hỏi tiến độ → template theo persona, không gọi Gemini
+INTENT_FASTPATH = os.getenv("CASHYBEAR_INTENT_FASTPATH", "1") == "1"
+
+# Demo dùng cố định tháng dữ liệu 2025-08
+YEAR_MONTH = os.getenv("CASHYBEAR_YEAR_MONTH", "2025-08")
+
+# Downstream services (best-effort hooks)
+HOOKS_BASE = os.getenv("HOOKS_BASE", "http://127.0.0.1:4000")
+ZALO_BRIDGE_BASE = os.getenv("ZALO_BRIDGE_BASE", "http://127.0.0.1:8011")
+# Invalidate plan summary bên Zalo bridge: gom theo customer trong khoảng này rồi gửi 1 lần
+PLAN_INVALIDATE_DEBOUNCE_SECS = float(os.getenv("CASHYBEAR_PLAN_INVALIDATE_DEBOUNCE_SECS", "0.2"))
+
+# Chain hooks đi qua bảng hook_outbox (gửi nền, retry + backoff)
+HOOK_OUTBOX_ENABLED = os.getenv("CASHYBEAR_HOOK_OUTBOX", "1") == "1"
+HOOK_BATCH_SIZE = int(os.getenv("CASHYBEAR_HOOK_BATCH_SIZE", "50"))
+HOOK_POLL_SECS = float(os.getenv("CASHYBEAR_HOOK_POLL_SECS", "1.0"))
+HOOK_MAX_ATTEMPTS = int(os.getenv("CASHYBEAR_HOOK_MAX_ATTEMPTS", "20"))
+HOOK_TIMEOUT_SECS = float(os.getenv("CASHYBEAR_HOOK_TIMEOUT_SECS", "10"))
+
+# /spend/log: buffer RAM → ghi micro-batch (events + tổng ngày/tuần trong 1 câu lệnh); 0 = ghi đồng bộ từng event
+SPEND_BATCH_ENABLED = os.getenv("CASHYBEAR_SPEND_BATCH", "1") == "1"
+SPEND_BATCH_SIZE = int(os.getenv("CASHYBEAR_SPEND_BATCH_SIZE", "500"))
+SPEND_FLUSH_SECS = float(os.getenv("CASHYBEAR_SPEND_FLUSH_SECS", "0.5"))
+SPEND_BUFFER_MAX = int(os.getenv("CASHYBEAR_SPEND_BUFFER_MAX", "20000"))  # đầy → ghi đồng bộ
+
+# Chat sessions: 'sqlite' (dùng chung giữa các worker) | 'memory' (từng process)
+SESSION_BACKEND = os.getenv("CASHYBEAR_SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.getenv("CASHYBEAR_SESSION_DB", "cashybear_sessions.db")
+SESSION_TTL_SECS = int(os.getenv("CASHYBEAR_SESSION_TTL_SECS", str(60 * 60)))
+SESSION_HISTORY_LIMIT = int(os.getenv("CASHYBEAR_SESSION_HISTORY", "40"))
+
+# Profile/context cache (features_monthly đổi tối đa 1 lần/tháng)
+PROFILE_CACHE_SIZE = int(os.getenv("CASHYBEAR_PROFILE_CACHE_SIZE", "20000"))
+PROFILE_CACHE_TTL_SECS = float(os.getenv("CASHYBEAR_PROFILE_CACHE_TTL_SECS", str(6 * 3600)))
+PROFILE_EPOCH_PATH = os.getenv("CASHYBEAR_PROFILE_EPOCH", "cashybear_profiles.epoch")
+PROFILE_WARMUP = int(os.getenv("CASHYBEAR_PROFILE_WARMUP", "0"))  # số KH active nạp sẵn khi khởi động, 0 = tắt
+
+# Offer signals: index predictions_llm_with_facts trong RAM
+SIGNALS_PRELOAD = os.getenv("CASHYBEAR_SIGNALS_PRELOAD", "1") == "1"
+SIGNALS_REFRESH_SECS = float(os.getenv("CASHYBEAR_SIGNALS_REFRESH_SECS", "60"))
+
+# Chấm điểm real-time (/signals/score): model NumPy-only xuất bởi `python -m propensity.compact`
+SCORER_FILE = os.getenv("CASHYBEAR_SCORER_FILE", "customer_propensity_model.npz")
+SCORE_BATCH_MAX = int(os.getenv("CASHYBEAR_SCORE_BATCH_MAX", "5000"))
+
+# HTTP server
+HOST = os.getenv("CASHYBEAR_HOST", "127.0.0.1")
+PORT = int(os.getenv("CASHYBEAR_PORT", "8010"))
+WORKERS = int(os.getenv("CASHYBEAR_WORKERS", "1"))
+CORS_ORIGINS = [o for o in os.getenv("CASHYBEAR_CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",") if o]
+
+
+def pg_url() -> str:
+    return f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
@@ -0,0 +1,583 @@
+"""
+Postgres access for CashyBear: engine, schema migration, profile lookup and
+persona_* writes. Each worker process builds its own engine on first use.
+"""
+
+import functools
+import json
+import math
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import anyio
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import config
+from .outbox import OUTBOX_DDL, HookEvent, enqueue
+from .spend import SPEND_DDL, ingest, make_event
+
+_ENGINE: Optional[Engine] = None
+_LIMITER: Optional[anyio.CapacityLimiter] = None
+T = TypeVar("T")
+
+
+def get_engine() -> Optional[Engine]:
+    """Process-wide engine (None when the driver / URL is unusable)"""
+    global _ENGINE
+    if _ENGINE is None:
+        try:
+            _ENGINE = create_engine(
+                config.pg_url(),
+                future=True,
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_MAX_OVERFLOW,
+                pool_timeout=config.DB_POOL_TIMEOUT_SECS,
+                # recycle thay cho ping mỗi checkout; kết nối chết → SQLAlchemy invalidate cả pool ở lỗi đầu tiên
+                pool_recycle=config.DB_POOL_RECYCLE_SECS,
+                pool_pre_ping=config.DB_PRE_PING,
+                pool_use_lifo=True,
+                connect_args={"options": f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"},
+            )
+        except Exception as e:
+            print("[Cảnh báo] Không thể tạo engine DB:", e)
+            return None
+    return _ENGINE
+
+
+async def run_sync(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking DB helper off the event loop.
+
+    Uses its own limiter sized like the pool (pool_size + max_overflow): DB work
+    never waits in the threadpool behind slow Gemini calls, and never holds more
+    threads than there are connections to check out.
+    """
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = anyio.CapacityLimiter(max(config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW, 1))
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_LIMITER)
+
+
+# ---------- Schema ----------
+
+PERSONA_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS persona_plans (
+        plan_id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+        customer_id VARCHAR(64) NOT NULL,
+        year_month VARCHAR(7) NOT NULL,
+        persona VARCHAR(32) NOT NULL,
+        goal TEXT,
+        feasibility VARCHAR(16),
+        weekly_cap_save NUMERIC,
+        recommended_weekly_save NUMERIC,
+        created_at TIMESTAMP DEFAULT NOW(),
+        meta JSONB DEFAULT '{}'::jsonb
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS persona_plan_days (
+        plan_id UUID NOT NULL,
+        day_index INT NOT NULL,
+        date DATE,
+        tasks JSONB,
+        day_target_save NUMERIC,
+        PRIMARY KEY (plan_id, day_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS persona_chat_logs (
+        chat_id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+        customer_id VARCHAR(64),
+        persona VARCHAR(32),
+        role VARCHAR(16) NOT NULL,
+        message TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW(),
+        meta JSONB DEFAULT '{}'::jsonb
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS persona_spend_events (
+        event_id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+        customer_id VARCHAR(64) NOT NULL,
+        date DATE NOT NULL,
+        amount NUMERIC NOT NULL,
+        category VARCHAR(64),
+        note TEXT,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+]
+
+# Hardening: bảng cũ thiếu cột / index cho ON CONFLICT
+PERSONA_ALTER = [
+    "ALTER TABLE IF EXISTS persona_plans ADD COLUMN IF NOT EXISTS goal TEXT",
+    "ALTER TABLE IF EXISTS persona_plans ADD COLUMN IF NOT EXISTS feasibility VARCHAR(16)",
+    "ALTER TABLE IF EXISTS persona_plans ADD COLUMN IF NOT EXISTS weekly_cap_save NUMERIC",
+    "ALTER TABLE IF EXISTS persona_plans ADD COLUMN IF NOT EXISTS recommended_weekly_save NUMERIC",
+    "ALTER TABLE IF EXISTS persona_plans ADD COLUMN IF NOT EXISTS meta JSONB DEFAULT '{}'::jsonb",
+    "ALTER TABLE IF EXISTS persona_plan_days ADD COLUMN IF NOT EXISTS day_index INT",
+    "ALTER TABLE IF EXISTS persona_plan_days ADD COLUMN IF NOT EXISTS tasks JSONB",
+    "ALTER TABLE IF EXISTS persona_plan_days ADD COLUMN IF NOT EXISTS day_target_save NUMERIC",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_persona_plan_days_pid_day ON persona_plan_days(plan_id, day_index)",
+]
+
+DASHBOARD_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS persona_plan_day_tasks (
+      plan_id UUID NOT NULL REFERENCES persona_plans(plan_id) ON DELETE CASCADE,
+      day_index INT NOT NULL,
+      task_index INT NOT NULL,
+      date DATE NOT NULL,
+      task_text TEXT NOT NULL,
+      progress SMALLINT NOT NULL DEFAULT 0 CHECK (progress BETWEEN 0 AND 100),
+      status TEXT NOT NULL DEFAULT 'todo',
+      notes TEXT,
+      completed_at TIMESTAMP NULL,
+      created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+      updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+      PRIMARY KEY (plan_id, day_index, task_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS persona_task_updates (
+      id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+      plan_id UUID NOT NULL,
+      day_index INT NOT NULL,
+      task_index INT NOT NULL,
+      progress SMALLINT NOT NULL CHECK (progress BETWEEN 0 AND 100),
+      note TEXT,
+      created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_task_updates_plan ON persona_task_updates(plan_id)",
+    "ALTER TABLE IF EXISTS persona_plan_day_tasks ADD COLUMN IF NOT EXISTS progress SMALLINT DEFAULT 0",
+    "ALTER TABLE IF EXISTS persona_plan_day_tasks ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'todo'",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_persona_plan_day_tasks_pid_day_task ON persona_plan_day_tasks(plan_id, day_index, task_index)",
+    # Tổng hợp tiến độ theo plan, cập nhật mỗi khi task đổi (đọc dashboard O(1))
+    """
+    CREATE TABLE IF NOT EXISTS persona_plan_progress (
+      plan_id UUID PRIMARY KEY REFERENCES persona_plans(plan_id) ON DELETE CASCADE,
+      customer_id VARCHAR(64) NOT NULL,
+      plan_created_at TIMESTAMP,
+      total_tasks INT NOT NULL DEFAULT 0,
+      completed_tasks INT NOT NULL DEFAULT 0,
+      sum_progress INT NOT NULL DEFAULT 0,
+      saved_amount NUMERIC NOT NULL DEFAULT 0,
+      per_day JSONB NOT NULL DEFAULT '[]'::jsonb,
+      updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_plan_progress_customer ON persona_plan_progress(customer_id, plan_created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_persona_plans_customer ON persona_plans(customer_id, created_at DESC)",
+]
+
+
+def migrate(engine: Optional[Engine]) -> bool:
+    """Create/upgrade persona_*, dashboard, spend aggregate and hook_outbox tables. Run once per deploy, not per worker."""
+    if engine is None:
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+            for s in PERSONA_DDL + PERSONA_ALTER + DASHBOARD_DDL + SPEND_DDL + OUTBOX_DDL:
+                conn.execute(text(s))
+            # backfill plan cũ chưa có dòng tổng hợp
+            refresh_plan_progress(conn, None)
+        return True
+    except SQLAlchemyError as e:
+        print("[Cảnh báo] Migrate persona_* thất bại:", e)
+        return False
+
+
+# ---------- Profile ----------
+
+def _num(x: Any) -> float:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(v) else v
+
+
+def build_context(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Map schema thực tế (features_monthly) → context chuẩn cho LLM"""
+    income = row.get("income", row.get("income_net_month", row.get("income_month", 0)))
+    fixed = row.get("fixed_bills_month", row.get("fixed", row.get("bills", 0)))
+    variable = row.get("variable_spend_month", row.get("spend", row.get("variable", 0)))
+    loans = row.get("loan_month", row.get("loan", row.get("debt", 0)))
+    return {
+        "customer_id": str(row.get("customer_id", "")),
+        "year_month": str(row.get("year_month", "")),
+        "income_net_month": _num(income),
+        "fixed_bills_month": _num(fixed),
+        "variable_spend_month": _num(variable),
+        "loan_month": _num(loans),
+    }
+
+
+# Câu lệnh nóng dựng một lần ở module: SQLAlchemy dùng lại bản compile trong cache của engine
+_FETCH_PROFILE_SQL = text(
+    """
+    SELECT *
+    FROM features_monthly
+    WHERE customer_id = :cid AND (CAST(:ym AS TEXT) IS NULL OR year_month <= :ym)
+    ORDER BY year_month DESC NULLS LAST
+    LIMIT 1
+    """
+)
+
+
+def fetch_profile(engine: Optional[Engine], customer_id: int, year_month: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Latest features_monthly row of a customer, as of `year_month` when given (None when missing)"""
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        row = conn.execute(_FETCH_PROFILE_SQL, {"cid": int(customer_id), "ym": year_month}).mappings().first()
+    return dict(row) if row else None
+
+
+_FETCH_PROFILES_SQL = text(
+    """
+    SELECT DISTINCT ON (customer_id) *
+    FROM features_monthly
+    WHERE customer_id = ANY(:cids) AND (CAST(:ym AS TEXT) IS NULL OR year_month <= :ym)
+    ORDER BY customer_id, year_month DESC NULLS LAST
+    """
+)
+
+
+def fetch_profiles(engine: Optional[Engine], customer_ids: Iterable[int], year_month: Optional[str] = None) -> List[Dict[str, Any]]:
+    """fetch_profile for many customers in one query (customers without a row are absent)"""
+    cids = sorted({int(c) for c in customer_ids})
+    if engine is None or not cids:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(_FETCH_PROFILES_SQL, {"cids": cids, "ym": year_month}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def fetch_active_profiles(engine: Optional[Engine], year_month: str, days: int = 30, limit: int = 5000) -> List[Dict[str, Any]]:
+    """Latest features_monthly rows (as of `year_month`) of customers with a plan in the last `days` days"""
+    if engine is None:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            """
+            SELECT DISTINCT ON (f.customer_id) f.*
+            FROM features_monthly f
+            WHERE f.year_month <= :ym
+              AND CAST(f.customer_id AS TEXT) IN (
+                SELECT customer_id FROM persona_plans WHERE created_at > NOW() - make_interval(days => :days)
+              )
+            ORDER BY f.customer_id, f.year_month DESC
+            LIMIT :lim
+            """
+        ), {"ym": year_month, "days": int(days), "lim": int(limit)}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+# ---------- Writes ----------
+
+def _as_dict(obj: Any) -> Dict[str, Any]:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    return dict(obj)
+
+
+# Header + days + tasks trong MỘT câu lệnh (data-modifying CTE, rows truyền dạng JSONB):
+# số round trip không đổi theo horizon / số task
+_PERSIST_PLAN_SQL = text(
+    """
+    WITH hdr AS (
+        INSERT INTO persona_plans(plan_id, customer_id, year_month, persona, goal, feasibility, weekly_cap_save, recommended_weekly_save, meta)
+        VALUES (CAST(:pid AS UUID), :cid, :ym, :ps, :goal, :feas, :cap, :rec, CAST(:meta_json AS JSONB))
+        RETURNING plan_id
+    ), days AS (
+        INSERT INTO persona_plan_days(plan_id, day_index, date, tasks, day_target_save)
+        SELECT hdr.plan_id, d.day_index, d.date, d.tasks, d.day_target_save
+        FROM hdr, jsonb_to_recordset(CAST(:days_json AS JSONB)) AS d(day_index INT, date DATE, tasks JSONB, day_target_save NUMERIC)
+        ON CONFLICT (plan_id, day_index) DO NOTHING
+    ), tasks AS (
+        INSERT INTO persona_plan_day_tasks(plan_id, day_index, task_index, date, task_text, progress, status)
+        SELECT hdr.plan_id, t.day_index, t.task_index, t.date, t.task_text, 0, 'todo'
+        FROM hdr, jsonb_to_recordset(CAST(:tasks_json AS JSONB)) AS t(day_index INT, task_index INT, date DATE, task_text TEXT)
+        ON CONFLICT (plan_id, day_index, task_index) DO NOTHING
+    )
+    SELECT plan_id FROM hdr
+    """
+)
+
+
+def _plan_rows(p: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(persona_plan_days rows, persona_plan_day_tasks rows) of a plan dict"""
+    days: List[Dict[str, Any]] = []
+    tasks: List[Dict[str, Any]] = []
+    for day_index, d in enumerate(p.get("week_plan") or []):
+        dd = d if isinstance(d, dict) else _as_dict(d)
+        dt = dd.get("date")
+        day_tasks = dd.get("tasks", []) or []
+        days.append({"day_index": day_index, "date": dt, "tasks": day_tasks, "day_target_save": dd.get("day_target_save")})
+        tasks.extend({"day_index": day_index, "task_index": i, "date": dt, "task_text": str(t)} for i, t in enumerate(day_tasks))
+    return days, tasks
+
+
+def persist_plan_and_tasks(
+    engine: Optional[Engine],
+    plan_obj: Any,
+    customer_id: str,
+    persona: str,
+    hook_events: Optional[Callable[[str], Iterable[HookEvent]]] = None,
+    year_month: Optional[str] = None,
+    goal_text: Optional[str] = None,
+) -> Optional[str]:
+    """Persist plan header, days, flattened tasks and (optional) outbox hook events in ONE transaction.
+    Returns plan_id or None.
+    """
+    if engine is None:
+        return None
+    p = _as_dict(plan_obj)
+    if goal_text is None:
+        goal_text = f"{(p.get('proposal') or {}).get('target_amount','')} trong {(p.get('proposal') or {}).get('horizon_days','')} ngày"
+    days, tasks = _plan_rows(p)
+    with engine.begin() as conn:
+        plan_id = str(conn.execute(_PERSIST_PLAN_SQL, {
+            "pid": str(uuid.uuid4()),
+            "cid": str(customer_id),
+            "ym": year_month or config.YEAR_MONTH,
+            "ps": str(persona or "Mentor"),
+            "goal": goal_text,
+            "feas": p.get("feasibility"),
+            "cap": p.get("weekly_cap_save"),
+            "rec": p.get("recommended_weekly_save"),
+            "meta_json": json.dumps({"proposal": p.get("proposal")}, ensure_ascii=False, default=str),
+            "days_json": json.dumps(days, ensure_ascii=False, default=str),
+            "tasks_json": json.dumps(tasks, ensure_ascii=False, default=str),
+        }).scalar_one())
+        refresh_plan_progress(conn, [plan_id])
+        if hook_events is not None:
+            enqueue(conn, hook_events(plan_id))
+    return plan_id
+
+
+def enqueue_hooks(engine: Optional[Engine], events: Iterable[HookEvent]) -> int:
+    """Outbox insert on its own (events not tied to another write)"""
+    if engine is None:
+        raise RuntimeError("DB engine not available")
+    with engine.begin() as conn:
+        return enqueue(conn, events)
+
+
+# ---------- Plan progress (dashboard) ----------
+
+_PROGRESS_REFRESH_SQL = """
+    WITH plans AS (
+        SELECT plan_id, customer_id, created_at FROM persona_plans p WHERE {where}
+    ), tk AS (
+        SELECT t.plan_id, t.date, COALESCE(t.progress, 0) AS progress, t.status
+        FROM persona_plan_day_tasks t JOIN plans USING (plan_id)
+    ), per_day AS (
+        SELECT plan_id, date, COUNT(*) AS n, SUM(progress) AS s
+        FROM tk WHERE date IS NOT NULL GROUP BY plan_id, date
+    ), day_target AS (
+        SELECT d.plan_id, d.date, MAX(COALESCE(d.day_target_save, 0)) AS target
+        FROM persona_plan_days d JOIN plans USING (plan_id) GROUP BY d.plan_id, d.date
+    ), days AS (
+        SELECT pd.plan_id,
+               jsonb_agg(jsonb_build_object('date', pd.date::text, 'pct', pd.s::float8 / (pd.n * 100) * 100.0) ORDER BY pd.date) AS per_day,
+               SUM(pd.s::numeric / (pd.n * 100) * COALESCE(dt.target, 0)) AS saved
+        FROM per_day pd LEFT JOIN day_target dt ON dt.plan_id = pd.plan_id AND dt.date = pd.date
+        GROUP BY pd.plan_id
+    ), totals AS (
+        SELECT plan_id, COUNT(*) AS total, SUM(progress) AS sum_progress,
+               COUNT(*) FILTER (WHERE progress >= 100 OR status = 'done') AS completed
+        FROM tk GROUP BY plan_id
+    )
+    INSERT INTO persona_plan_progress(plan_id, customer_id, plan_created_at, total_tasks, completed_tasks, sum_progress, saved_amount, per_day, updated_at)
+    SELECT plans.plan_id, plans.customer_id, plans.created_at,
+           COALESCE(totals.total, 0), COALESCE(totals.completed, 0), COALESCE(totals.sum_progress, 0),
+           COALESCE(days.saved, 0), COALESCE(days.per_day, '[]'::jsonb), NOW()
+    FROM plans LEFT JOIN totals USING (plan_id) LEFT JOIN days USING (plan_id)
+    ON CONFLICT (plan_id) DO UPDATE SET
+        total_tasks = EXCLUDED.total_tasks,
+        completed_tasks = EXCLUDED.completed_tasks,
+        sum_progress = EXCLUDED.sum_progress,
+        saved_amount = EXCLUDED.saved_amount,
+        per_day = EXCLUDED.per_day,
+        updated_at = NOW()
+"""
+
+_PROGRESS_REFRESH_ONE = text(_PROGRESS_REFRESH_SQL.format(where="p.plan_id = ANY(CAST(:pids AS UUID[]))"))
+
+
+def refresh_plan_progress(conn: Connection, plan_ids: Optional[List[str]]):
+    """Recompute persona_plan_progress for the given plans (None = plans that have no summary yet)"""
+    if plan_ids is None:
+        conn.execute(text(_PROGRESS_REFRESH_SQL.format(where="NOT EXISTS (SELECT 1 FROM persona_plan_progress s WHERE s.plan_id = p.plan_id)")))
+    elif plan_ids:
+        conn.execute(_PROGRESS_REFRESH_ONE, {"pids": [str(x) for x in plan_ids]})
+
+
+_LOCK_PROGRESS_SQL = text("SELECT 1 FROM persona_plan_progress WHERE plan_id = CAST(:pid AS UUID) FOR UPDATE")
+# Cập nhật 1 task rồi cộng phần chênh (mới − cũ) vào dòng tổng hợp: O(số task của ngày đó), không tính lại cả plan.
+# Công thức khớp _PROGRESS_REFRESH_SQL: pct ngày = Σprogress/n, saved += Δ/(n·100)·target ngày.
+_UPDATE_TASK_DELTA_SQL = text(
+    """
+    WITH old AS (
+        SELECT COALESCE(progress, 0) AS p, status AS s
+        FROM persona_plan_day_tasks
+        WHERE plan_id = CAST(:pid AS UUID) AND day_index = :d AND task_index = :t
+        FOR UPDATE
+    ), upd AS (
+        UPDATE persona_plan_day_tasks t
+        SET progress = :p, status = :s, completed_at = CASE WHEN :p >= 100 THEN NOW() ELSE NULL END, updated_at = NOW()
+        FROM old
+        WHERE t.plan_id = CAST(:pid AS UUID) AND t.day_index = :d AND t.task_index = :t
+        RETURNING t.date, old.p AS old_p, t.progress AS new_p,
+                  COALESCE(old.p >= 100 OR old.s = 'done', FALSE)::int AS old_done,
+                  COALESCE(t.progress >= 100 OR t.status = 'done', FALSE)::int AS new_done
+    ), day_tasks AS (
+        SELECT COUNT(*) AS n FROM persona_plan_day_tasks t, upd
+        WHERE t.plan_id = CAST(:pid AS UUID) AND t.date = upd.date
+    ), day_target AS (
+        SELECT COALESCE(MAX(COALESCE(d.day_target_save, 0)), 0) AS amount FROM persona_plan_days d, upd
+        WHERE d.plan_id = CAST(:pid AS UUID) AND d.date = upd.date
+    )
+    UPDATE persona_plan_progress s SET
+        sum_progress = s.sum_progress + (upd.new_p - upd.old_p),
+        completed_tasks = s.completed_tasks + (upd.new_done - upd.old_done),
+        saved_amount = s.saved_amount + CASE WHEN upd.date IS NULL THEN 0
+                       ELSE (upd.new_p - upd.old_p)::numeric / (day_tasks.n * 100) * day_target.amount END,
+        per_day = COALESCE((
+            SELECT jsonb_agg(CASE WHEN e->>'date' = upd.date::text
+                                  THEN jsonb_set(e, '{pct}', to_jsonb((e->>'pct')::float8 + (upd.new_p - upd.old_p)::float8 / day_tasks.n))
+                                  ELSE e END ORDER BY i)
+            FROM jsonb_array_elements(s.per_day) WITH ORDINALITY AS x(e, i)
+        ), s.per_day),
+        updated_at = NOW()
+    FROM upd, day_tasks, day_target
+    WHERE s.plan_id = CAST(:pid AS UUID)
+    RETURNING 1 AS applied
+    """
+)
+_LOG_TASK_SQL = text(
+    """
+    INSERT INTO persona_task_updates(plan_id, day_index, task_index, progress, note)
+    VALUES (:pid, :d, :t, :p, :note)
+    """
+)
+
+
+def update_task_progress(engine: Optional[Engine], plan_id: str, day_index: int, task_index: int, progress: int, status: str, note: str = ""):
+    """Update one task, log it and apply the progress delta to the plan summary in one transaction"""
+    if engine is None:
+        raise RuntimeError("DB engine not available")
+    with engine.begin() as conn:
+        # khóa dòng tổng hợp trước để các update song song cùng plan đi tuần tự (summary không bị lệch)
+        conn.execute(_LOCK_PROGRESS_SQL, {"pid": plan_id})
+        params = {"p": progress, "s": status, "pid": plan_id, "d": day_index, "t": task_index}
+        applied = conn.execute(_UPDATE_TASK_DELTA_SQL, params).mappings().first()
+        conn.execute(_LOG_TASK_SQL, {"pid": plan_id, "d": day_index, "t": task_index, "p": progress, "note": note or ''})
+        if applied is None:
+            # plan chưa có dòng tổng hợp (hoặc task không tồn tại) → tính đủ 1 lần cho plan này
+            refresh_plan_progress(conn, [plan_id])
+
+
+# Đi từ persona_plans + LEFT JOIN bảng tổng hợp: plan chưa có dòng progress (ghi ngoài persist_plan_and_tasks,
+# chưa chạy migrate backfill) vẫn hiện, fetch_dashboard tính dòng tổng hợp cho nó rồi đọc lại
+_DASHBOARD_SQL = """
+    SELECT p.plan_id, s.plan_id IS NULL AS summary_missing,
+           COALESCE(s.total_tasks, 0) AS total_tasks,
+           COALESCE(s.completed_tasks, 0) AS completed_tasks,
+           COALESCE(s.sum_progress, 0) AS sum_progress,
+           COALESCE(s.saved_amount, 0) AS saved_amount,
+           COALESCE(s.per_day, '[]'::jsonb) AS per_day,
+           p.weekly_cap_save, p.recommended_weekly_save,
+           p.meta->'proposal'->>'target_amount' AS target_amount,
+           {tasks_sql} AS tasks
+    FROM persona_plans p
+    LEFT JOIN persona_plan_progress s ON s.plan_id = p.plan_id
+    WHERE p.customer_id = :cid
+    ORDER BY p.created_at DESC
+    LIMIT 1
+"""
+_DASHBOARD_TASKS_SQL = """
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'dayIndex', t.day_index, 'taskIndex', t.task_index, 'date', t.date::text, 'text', t.task_text,
+            'progress', COALESCE(t.progress, 0), 'status', t.status, 'completedAt', t.completed_at::text
+        ) ORDER BY t.day_index, t.task_index)
+        FROM persona_plan_day_tasks t WHERE t.plan_id = p.plan_id
+    ), '[]'::json)"""
+_DASHBOARD_WITH_TASKS = text(_DASHBOARD_SQL.format(tasks_sql=_DASHBOARD_TASKS_SQL))
+_DASHBOARD_SUMMARY_ONLY = text(_DASHBOARD_SQL.format(tasks_sql="'[]'::json"))
+
+
+def fetch_dashboard(engine: Optional[Engine], customer_id: str, include_tasks: bool = True) -> Optional[Dict[str, Any]]:
+    """Latest plan's header + summary row (+ task rows as JSON) in one query.
+    A plan without a summary row gets it computed once (same SQL as the write path), then is re-read."""
+    if engine is None:
+        raise RuntimeError("DB engine not available")
+    stmt = _DASHBOARD_WITH_TASKS if include_tasks else _DASHBOARD_SUMMARY_ONLY
+    with engine.connect() as conn:
+        row = conn.execute(stmt, {"cid": str(customer_id)}).mappings().first()
+    if row is not None and row.get("summary_missing"):
+        with engine.begin() as conn:
+            refresh_plan_progress(conn, [str(row["plan_id"])])
+            row = conn.execute(stmt, {"cid": str(customer_id)}).mappings().first()
+    if row is None:
+        return None
+    out = dict(row)
+    out.pop("summary_missing", None)
+    return out
+
+
+_PLAN_HEADER_SQL = text(
+    """
+    SELECT plan_id, created_at, weekly_cap_save, recommended_weekly_save,
+           meta->'proposal'->>'target_amount' AS target_amount
+    FROM persona_plans
+    WHERE customer_id = :cid
+    ORDER BY created_at DESC
+    LIMIT 1
+    """
+)
+
+
+def fetch_plan_header(engine: Optional[Engine], customer_id: str) -> Optional[Dict[str, Any]]:
+    """Latest plan header only (no task rows)"""
+    if engine is None:
+        raise RuntimeError("DB engine not available")
+    with engine.connect() as conn:
+        row = conn.execute(_PLAN_HEADER_SQL, {"cid": str(customer_id)}).mappings().first()
+    return dict(row) if row else None
+
+
+def db_log_chat(engine: Optional[Engine], customer_id: str, persona: str, role: str, message: str):
+    if engine is None:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                """
+                INSERT INTO persona_chat_logs(customer_id, persona, role, message, meta)
+                VALUES (:cid, :ps, :role, :msg, '{}'::jsonb)
+                """
+            ), {"cid": str(customer_id), "ps": persona, "role": role, "msg": message})
+    except Exception as e:
+        print("[Cảnh báo] Ghi chat lỗi:", e)
+
+
+def ingest_spend(engine: Optional[Engine], events: List[Dict[str, Any]]) -> int:
+    """Write spend events (spend.make_event) + daily/weekly totals now, in one statement"""
+    if engine is None:
+        raise RuntimeError("DB engine not available")
+    with engine.begin() as conn:
+        return ingest(conn, events)
+
+
+def db_insert_spend(engine: Optional[Engine], customer_id: str, spend_date: str, amount: float, category: str, note: str = ""):
+    ingest_spend(engine, [make_event(customer_id, spend_date, amount, category, note)])
@@ -0,0 +1,167 @@
+"""
+Intent fast path: one compiled regex over the diacritic-folded message, plus
+persona templates for turns that need no generation (chào, cảm ơn, "mình vừa
+chi X", hỏi tiến độ). Those turns answer from the plan summary / today's and this
+week's spend totals without Gemini.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from .nlu import fold_vi, format_vnd
+
+# Pattern viết trên text đã bỏ dấu; từ ngắn dễ trùng khi bỏ dấu (đổi/đói/đợi, sửa/sữa) phải đi kèm ngữ cảnh
+INTENT_PATTERNS: Dict[str, List[str]] = {
+    "accept": [r"dong y", r"chap nhan", r"\bok(e|ay|ie)?\b", r"\baccept", r"duoc do", r"hay do", r"\bchot\b"],
+    "change": [
+        # "lai" phải đi kèm đối tượng: "cân đối lại" (cuối mọi tin /trigger/spend) không phải đổi plan
+        r"ke hoach (khac|moi)", r"(doi|sua|thay) (ke hoach|plan|muc tieu|phuong an|cach khac)",
+        r"(doi|sua|thay|lam|lap) lai (ke hoach|plan|muc tieu|phuong an)", r"^lam lai\b", r"\blam lai tu dau\b",
+        r"dieu chinh", r"tinh chinh", r"khac di", r"\bregen\b",
+    ],
+    "greeting": [r"^(xin )?(chao|hi|hello|helo|alo|hey)( (ban|gau|cashybear|bot|em|anh|chi|nhe|nha|a|oi))*[\s!.?]*$"],
+    "who": [r"\b(ban|gau|cau|em) la ai\b", r"\bgioi thieu\b"],
+    "thanks": [r"^(cam on|thanks?|thank you|tks)\b.{0,30}$"],
+    "progress": [
+        r"\btien do\b", r"ke hoach (cua )?(minh|toi|em) (sao|the nao|den dau)",
+        r"(tiet kiem|de danh) duoc (bao nhieu|bn)", r"con (thieu )?bao nhieu",
+    ],
+    "spend": [
+        # cần mốc quá khứ + động từ: "chi tiêu của mình tháng này", "hôm nay mua gì" không phải khoản chi
+        r"\b(vua|da|moi) (chi tieu|chi|tieu|mua|tra|quet the)\b",
+        r"^(mua|an|uong|tra) .*\d", r"\btieu( het)? \d",
+    ],
+    # mục tiêu / câu hỏi: "muốn giảm chi tiêu 2 triệu", "... được không?" → không ghi khoản chi
+    "goal": [r"tiet kiem", r"de danh", r"\bgiam\b", r"\bmuon\b", r"muc tieu", r"\?", r"duoc khong\b"],
+}
+
+# Intent trả lời bằng template (không gọi LLM)
+FAST_INTENTS = ("spend", "progress", "greeting", "who", "thanks")
+
+
+class IntentMatcher:
+    """All intents in one alternation of named groups; finditer = one pass over the folded text"""
+
+    def __init__(self, patterns: Dict[str, List[str]]):
+        self._names: Dict[str, str] = {}
+        parts = []
+        for intent, alts in patterns.items():
+            for i, alt in enumerate(alts):
+                group = f"{intent}_{i}"
+                self._names[group] = intent
+                # lookahead rỗng: các match không tiêu thụ ký tự → pattern chồng lên nhau vẫn thấy hết
+                parts.append(f"(?=(?P<{group}>{alt}))")
+        self._re = re.compile("|".join(parts))
+
+    def match(self, text: str) -> Set[str]:
+        folded = fold_vi(text)
+        found: Set[str] = set()
+        for m in self._re.finditer(folded):
+            found.add(self._names[m.lastgroup])
+        return found
+
+
+INTENTS = IntentMatcher(INTENT_PATTERNS)
+
+
+def fast_intent(found: Set[str], amount: Optional[float], spend_logged: bool = False) -> Optional[str]:
+    """Intent nào (nếu có) trả lời được bằng template; accept/change để state machine xử lý.
+    spend chỉ khi chắc chắn (có số tiền, không lẫn mục tiêu/câu hỏi/tiến độ), vì fast path ghi khoản chi thật;
+    spend_logged: bridge đã ghi khoản chi qua /spend/log, tin của nó luôn là spend"""
+    if found & {"accept", "change"}:
+        return None
+    if "spend" in found:
+        if amount is None:
+            return None
+        return "spend" if spend_logged or not found & {"goal", "progress"} else None
+    for intent in FAST_INTENTS:
+        if intent in found:
+            return intent
+    return None
+
+
+# Cùng key với llm.STYLEBOOK; persona lạ → Mentor
+PERSONA_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "Mentor": {
+        "greeting": "Chào bạn! Mình là CashyBear, trợ lý tiết kiệm của bạn.",
+        "who": "Mình là CashyBear – Gấu nhắc tiết kiệm, ví bạn thêm xịn. Mình xem thu/chi của bạn, lập kế hoạch 7 hoặc 14 ngày và theo dõi tiến độ cùng bạn.",
+        "thanks": "Không có gì đâu, mình luôn ở đây để đồng hành cùng bạn.",
+        "spend_ok": "Mình đã ghi khoản chi {amount}, hôm nay bạn chi tổng {today} (tuần này {week}). So với mức ~{daily}/ngày theo kế hoạch vẫn trong giới hạn (còn dư ~{diff}). Giữ nhịp này nhé!",
+        "spend_over": "Mình đã ghi khoản chi {amount}, hôm nay bạn chi tổng {today} (tuần này {week}), vượt mức ~{daily}/ngày theo kế hoạch khoảng {diff}. Bạn có thể bù lại bằng cách cắt bớt một khoản linh hoạt trong 1–2 ngày tới.",
+        "spend_noplan": "Mình đã ghi khoản chi {amount} (hôm nay tổng {today}). Bạn chưa có kế hoạch tiết kiệm, mình lập một kế hoạch 7 hoặc 14 ngày để theo dõi chi tiêu nhé?",
+        "progress": "Tiến độ kế hoạch: hoàn thành {done}/{total} nhiệm vụ ({pct}), đã tiết kiệm ~{saved}{remaining}.",
+        "progress_noplan": "Bạn chưa có kế hoạch nào đang chạy.",
+    },
+    "Angry Mom": {
+        "greeting": "Chào con! Mẹ đây, CashyBear. Hôm nay lại định tiêu gì đấy?",
+        "who": "Mẹ là CashyBear – Gấu nhắc tiết kiệm, ví con thêm xịn. Mẹ xem con tiêu gì, lập kế hoạch 7 hoặc 14 ngày và canh con làm cho đủ.",
+        "thanks": "Cảm ơn thì lo mà giữ tiền cho tử tế vào nhé con.",
+        "spend_ok": "Khoản {amount} mẹ ghi rồi, hôm nay con tiêu tổng {today} (tuần này {week}). Còn trong mức ~{daily}/ngày (dư ~{diff}), lần này mẹ tha. Đừng có được đà mà tiêu tiếp đấy!",
+        "spend_over": "Lại {amount}! Hôm nay con tiêu tổng {today} (tuần này {week}), vượt mức ~{daily}/ngày mất {diff} rồi đấy. Mai tự nấu cơm ở nhà, dừng quẹt thẻ vô tội vạ, nghe rõ chưa?",
+        "spend_noplan": "Tiêu {amount}, hôm nay tổng {today} rồi mà chưa có kế hoạch gì cả à? Lập ngay kế hoạch 7 hoặc 14 ngày với mẹ!",
+        "progress": "Con mới xong {done}/{total} nhiệm vụ ({pct}), để dành được ~{saved}{remaining}. Cố lên, đừng để mẹ phải nhắc!",
+        "progress_noplan": "Có kế hoạch nào đâu mà hỏi tiến độ hả con?",
+    },
+    "Banter": {
+        "greeting": "Yo! CashyBear đây 🐻 Ví hôm nay còn khỏe không đó?",
+        "who": "Tui là CashyBear – Gấu nhắc tiết kiệm, ví bạn thêm xịn 😎 Tui soi thu chi, lên plan 7/14 ngày rồi bám đuôi bạn tới khi đạt thì thôi.",
+        "thanks": "Khách sáo ghê 😆 Giữ ví dày là cảm ơn tui rồi đó!",
+        "spend_ok": "Đã note {amount} nha 📝 Hôm nay tổng {today}, tuần này {week}. Vẫn dưới mức ~{daily}/ngày (dư ~{diff}), ổn áp đó bestie 👌",
+        "spend_over": "Ơ kìa {amount} 💸 hôm nay tổng {today} (tuần này {week}), lố ~{daily}/ngày mất {diff} rồi nha. Mai nhịn trà sữa một bữa là huề 😏",
+        "spend_noplan": "Đã note {amount} 📝 (hôm nay tổng {today}) Mà chưa có plan gì hết trơn, lên plan 7 hay 14 ngày liền không? 😎",
+        "progress": "Plan đang ở {done}/{total} nhiệm vụ ({pct}), gom được ~{saved}{remaining} rồi nè 🔥",
+        "progress_noplan": "Chưa có plan nào để check đâu nè 😅",
+    },
+}
+
+# Gợi ý bước tiếp theo theo phase (giống hướng dẫn trong CHAT_SYSTEM_PROMPT)
+NEXT_STEP = {
+    "awaiting_goal": "Bạn muốn tiết kiệm bao nhiêu và trong mấy tháng?",
+    "awaiting_horizon": "Bạn chọn kế hoạch 7 hay 14 ngày?",
+    "proposed": "Bạn đồng ý kế hoạch này chứ?",
+    "accepted": "Theo dõi tiến độ ở Dashboard To‑do nhé.",
+}
+
+
+def _num(x: Any) -> Optional[float]:
+    try:
+        return float(x) if x is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def render_fast_reply(
+    intent: str,
+    persona: str,
+    phase: Optional[str],
+    amount: Optional[float] = None,
+    summary: Optional[Dict[str, Any]] = None,
+    spend: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Template reply cho intent nhanh; summary = dòng db.fetch_dashboard (None khi chưa có plan),
+    spend = tổng chi ngày/tuần đã gồm khoản vừa ghi (api._spend_totals: todaySpend, weekSpend, dailyTarget)"""
+    tpl = PERSONA_TEMPLATES.get(persona) or PERSONA_TEMPLATES["Mentor"]
+    if intent == "spend":
+        spend = spend or {}
+        today = _num(spend.get("todaySpend"))
+        today = float(amount or 0.0) if today is None else today
+        fields = {"amount": format_vnd(amount), "today": format_vnd(today), "week": format_vnd(_num(spend.get("weekSpend")) or today)}
+        daily = _num(spend.get("dailyTarget"))
+        if daily is None:
+            return tpl["spend_noplan"].format(**fields)
+        # so TỔNG chi hôm nay với mức/ngày, không phải riêng khoản vừa chi
+        over = today - daily
+        key = "spend_over" if over > 0 else "spend_ok"
+        return tpl[key].format(daily=format_vnd(daily), diff=format_vnd(abs(over)), **fields)
+    if intent == "progress":
+        if not summary:
+            return tpl["progress_noplan"] + " " + NEXT_STEP["awaiting_goal"]
+        total = int(summary.get("total_tasks") or 0)
+        pct = (int(summary.get("sum_progress") or 0) / (total * 100) * 100.0) if total else 0.0
+        saved = _num(summary.get("saved_amount")) or 0.0
+        target = _num(summary.get("target_amount"))
+        remaining = f", còn ~{format_vnd(max(target - saved, 0.0))} tới mục tiêu" if target is not None else ""
+        return tpl["progress"].format(done=int(summary.get("completed_tasks") or 0), total=total, pct=f"{pct:.0f}%", saved=format_vnd(saved), remaining=remaining)
+    reply = tpl[intent]
+    step = NEXT_STEP.get(phase or "awaiting_goal")
+    return f"{reply} {step}" if step and intent in ("greeting", "who") else reply
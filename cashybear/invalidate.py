@@ -0,0 +1,118 @@
+"""
+Coalesced plan-summary invalidations for the Zalo bridge.
+
+The bridge caches each customer's plan summary; CashyBear tells it to drop an
+entry when a plan is accepted or a spend is logged. Instead of one thread and
+one blocking POST per request, customer ids go into a pending set (a burst for
+the same customer collapses to one id) and a single background thread posts
+them as `{"customerIds": [...]}` over one keep-alive client. Best-effort: the
+bridge's TTL bounds staleness if a post fails.
+"""
+
+import threading
+from typing import Any, Dict, Optional, Set
+
+import httpx
+
+
+class SummaryInvalidator:
+    """Pending customer ids → one POST per batch, from one thread per worker"""
+
+    def __init__(
+        self,
+        url: str,
+        debounce_secs: float = 0.2,
+        timeout_secs: float = 2.0,
+        max_batch: int = 1000,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        self.url = url
+        self._transport = transport
+        self.debounce_secs = debounce_secs
+        self.timeout_secs = timeout_secs
+        self.max_batch = max_batch
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.requested = 0
+        self.sent = 0
+        self.posts = 0
+        self.failed_posts = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="plan-summary-invalidate", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the thread after posting what is pending"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify(self, customer_id: Any):
+        """Queue one customer (non-blocking); starts the thread on first use"""
+        with self._lock:
+            self._pending.add(int(customer_id))
+            self.requested += 1
+        if not self.running and not self._stop.is_set():
+            self.start()
+        self._wake.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self, client: httpx.Client) -> int:
+        """Post one batch of pending ids; returns how many were taken"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            if len(self._pending) <= self.max_batch:
+                batch, self._pending = self._pending, set()
+            else:
+                batch = {self._pending.pop() for _ in range(self.max_batch)}
+        try:
+            client.post(self.url, json={"customerIds": sorted(batch)}).raise_for_status()
+            self.sent += len(batch)
+            self.posts += 1
+        except Exception as e:
+            # không retry: cache bên bridge có TTL
+            self.failed_posts += 1
+            self.last_error = str(e)
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "requested": self.requested,
+            "sent": self.sent,
+            "posts": self.posts,
+            "failed_posts": self.failed_posts,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        with httpx.Client(timeout=self.timeout_secs, transport=self._transport) as client:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+                stopping = self._stop.is_set()
+                if not stopping:
+                    # gom các invalidation đến dồn dập trong debounce_secs vào một lần gửi
+                    self._stop.wait(self.debounce_secs)
+                while self.flush(client):
+                    pass
+                if stopping or self._stop.is_set():
+                    return
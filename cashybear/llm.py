@@ -0,0 +1,211 @@
+"""Gemini wrappers: JSON plan generation (cached, with fallback) and persona chat reply."""
+
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import config
+from .llm_cache import LLMCache
+from .metrics import LLM_CALLS, LLM_FALLBACKS, TRACER
+from .planner import DayItem, PlanProposal, affordability_from_context, deterministic_plan, parse_plan_json, plan_to_dict
+
+try:
+    import google.generativeai as genai
+    if config.GEMINI_API_ENDPOINT:
+        genai.configure(api_key=config.GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": config.GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=config.GEMINI_API_KEY)
+except Exception as e:
+    genai = None
+    print("[Cảnh báo] Không thể khởi tạo Gemini:", e)
+
+SYSTEM_PROMPT = (
+    "Bạn là CashyBear — trợ lý tài chính cá nhân hóa. Tông giọng Gen Z, gần gũi nhưng thực tế, tôn trọng, tránh jargon. "
+    "Dựa đúng dữ liệu thu/chi trong context (income/fixed/variable/loan) và affordability để lập luận; không bịa. "
+    "Nhiệm vụ: tạo kế hoạch tiết kiệm 7/14 ngày phù hợp mục tiêu và khả thi. "
+    "Luôn trả về JSON đúng schema: {feasibility, weekly_cap_save, recommended_weekly_save, reasons[], proposal{target_amount,target_date,horizon_days}, week_plan[{date,tasks[],day_target_save}], supervision_note, confirm_question}. "
+    "Mỗi ngày 2–4 nhiệm vụ, đo lường được, ngắn gọn đời thường; tổng mục tiêu ngày khớp tổng tuần/horizon. "
+    "Không gom ngày kiểu 'Ngày 1–7'; phải liệt kê từng ngày với 'date', 'tasks', 'day_target_save'. Nhiệm vụ cần cụ thể, tránh lặp lại rập khuôn giữa các ngày. "
+    "Nếu 'adjust' thì nêu 1–2 lý do rõ ràng; gợi ý kéo dài thời gian/giảm mục tiêu hợp lý. "
+    "Nếu có previous_plan + feedback thì tạo phương án KHÁC, phản ánh feedback, tránh lặp nhiệm vụ/phân bổ. "
+    "Ngày bắt đầu là hôm nay."
+)
+
+CHAT_SYSTEM_PROMPT = (
+    "Bạn là CashyBear — trợ lý tài chính cá nhân hóa (slogan: 'CashyBear – Gấu nhắc tiết kiệm, ví bạn thêm xịn.'). "
+    "Tông giọng Gen Z, gần gũi nhưng thực tế, tôn trọng, tránh jargon; điều chỉnh theo persona. "
+    "Luôn bám theo ý người dùng và dữ liệu trong context; không bịa. Nếu user chỉ chào/ hỏi 'bạn là ai', hãy giới thiệu ngắn về vai trò và gợi mở bước tiếp theo (mục tiêu, 7 hay 14 ngày). "
+    "Theo phase: awaiting_goal → hỏi số tiền & số tháng; awaiting_horizon → BẮT ĐẦU bằng: 'Mình đã xem hồ sơ: thu nhập {income}, chi cố định {fixed}, chi linh hoạt {variable}.' (dùng profile_summary và định dạng VND), sau đó tóm tắt 1 dòng khả thi (cần ~X/tuần; dư địa ~Y/tuần; thiếu ~Z/tuần nếu có), rồi hỏi '7 hay 14 ngày?' và thêm lời nhắc: 'Mình sẽ đưa kế hoạch cho 7 hoặc 14 ngày để bạn thực hiện trước, mình sẽ theo dõi và giám sát; đạt → tiếp tục; không đạt → mình tinh chỉnh kế hoạch.'; proposed → nếu có 'plan' trong context, trình bày ngắn gọn theo ngày và kết bằng câu giám sát. "
+    "Không trình bày chi tiết kế hoạch trong hội thoại; kế hoạch sẽ được hiển thị theo định dạng chuẩn bởi module kế hoạch sau khi người dùng chọn 7/14 ngày."
+)
+
+STYLEBOOK = {
+    "Mentor": "Lịch sự, chuyên nghiệp, giải thích từng bước rõ ràng, định hướng hành động, tối ưu tài chính.",
+    "Angry Mom": "Người mẹ giận dữ, hay càu nhàu nhưng đầy quan tâm. Luôn nói thẳng và trách móc mỗi khi con chi tiêu hoang phí. Giọng điệu nghiêm khắc, đôi lúc gắt gỏng, nhưng mục tiêu cuối cùng là bảo vệ ví và lo cho tương lai của con.",
+    "Banter": "Một người bạn thân Gen Z thích cà khịa. Giọng điệu vui vẻ, hài hước, đôi khi mỉa mai nhẹ nhàng. Hay dùng emoji, ngôn ngữ trend, trêu chọc để người kia thấy vui mà vẫn ý thức thay đổi thói quen tiền bạc. Luôn giữ vibe thân thiện của một người bạn cà khịa nhưng ủng hộ."
+}
+
+# Dùng chung giữa các worker và qua restart (SQLite), LRU trong RAM phía trước
+LLM_CACHE = LLMCache(config.LLM_CACHE_DB_PATH or None, max_entries=config.LLM_CACHE_SIZE, default_ttl_secs=config.LLM_PLAN_TTL_SECS)
+
+
+def llm_available() -> bool:
+    return genai is not None and bool(config.GEMINI_API_KEY)
+
+
+def _normalize_plan_start_today(plan: PlanProposal) -> PlanProposal:
+    today = date.today()
+    plan.week_plan = [
+        DayItem(date=(today + timedelta(days=i)).isoformat(), tasks=d.tasks, day_target_save=d.day_target_save)
+        for i, d in enumerate(plan.week_plan or [])
+    ]
+    return plan
+
+
+def llm_generate_plan(ctx: dict, goal_amount: float, months: int, horizon_days: int, persona: str, feedback: str = "", allow_fallback: bool = True, prev_plan: Optional[dict] = None) -> PlanProposal:
+    # affordability tham chiếu
+    aff = affordability_from_context(ctx, goal_amount, months)
+    payload = {
+        "system": SYSTEM_PROMPT,
+        "style": STYLEBOOK.get(persona, STYLEBOOK["Mentor"]),
+        "context": ctx,
+        "goal_amount": goal_amount,
+        "months": months,
+        "horizon_days": horizon_days,
+        "affordability": aff,
+        "feedback": feedback,
+        "prev_plan": prev_plan or {},
+        "allow_fallback": allow_fallback,
+    }
+    if not llm_available():
+        if not allow_fallback:
+            raise RuntimeError("GEMINI không sẵn sàng")
+        return deterministic_plan(ctx, goal_amount, months, horizon_days)
+
+    used_llm = [True]
+
+    def _call_model(model_name: str) -> str:
+        mdl = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=SYSTEM_PROMPT,
+            generation_config={"temperature": 0.7, "top_p": 0.9, "top_k": 40, "response_mime_type": "application/json"}
+        )
+        prev_str = json.dumps(prev_plan, ensure_ascii=False) if prev_plan else "{}"
+        prompt = (
+            f"Persona: {persona}\n"
+            f"Style: {STYLEBOOK.get(persona, STYLEBOOK['Mentor'])}\n"
+            f"Context: {json.dumps(ctx, ensure_ascii=False)}\n"
+            f"Affordability: {json.dumps(aff, ensure_ascii=False)}\n"
+            f"Goal amount: {goal_amount}; Months: {months}; Horizon: {horizon_days} days\n"
+            f"Feedback (nếu có): {feedback}\n"
+            f"Previous plan (JSON, nếu có): {prev_str}\n"
+            "Hãy trả về JSON đúng schema và tạo phương án KHÁC nếu có feedback yêu cầu thay đổi."
+        )
+        with TRACER.span("llm.plan", model=model_name):
+            try:
+                resp = mdl.generate_content(prompt)
+            except Exception:
+                LLM_CALLS.inc(op="plan", model=model_name, outcome="error")
+                raise
+        LLM_CALLS.inc(op="plan", model=model_name, outcome="ok")
+        return resp.candidates[0].content.parts[0].text if resp and resp.candidates else "{}"
+
+    def _generate() -> Dict[str, Any]:
+        try:
+            return plan_to_dict(parse_plan_json(_call_model(config.GEMINI_MODEL_PRIMARY)))
+        except Exception:
+            if not allow_fallback:
+                raise
+        LLM_FALLBACKS.inc(op="plan", to="fallback_model")
+        try:
+            return plan_to_dict(parse_plan_json(_call_model(config.GEMINI_MODEL_FALLBACK)))
+        except Exception:
+            # deterministic cuối cùng (không cache để lần sau thử lại LLM)
+            used_llm[0] = False
+            LLM_FALLBACKS.inc(op="plan", to="deterministic")
+            return plan_to_dict(deterministic_plan(ctx, goal_amount, months, horizon_days, ["Fallback deterministic do LLM không sẵn sàng."]))
+
+    plan_dict = LLM_CACHE.get_or_compute("plan", payload, _generate, ttl_secs=config.LLM_PLAN_TTL_SECS, should_cache=lambda _: used_llm[0])
+    # Ngày luôn tính từ hôm nay, kể cả khi lấy từ cache của hôm trước
+    return _normalize_plan_start_today(PlanProposal(**plan_dict))
+
+
+def _chat_prompt(ctx: dict, persona: str, text: str, phase: str, goal_amount, months, horizon, aff: Optional[dict], history: List[Dict[str, Any]], plan: Optional[dict]) -> Tuple[Any, str, Dict[str, Any]]:
+    """(model, prompt, cache payload) cho một lượt chat"""
+    mdl = genai.GenerativeModel(
+        model_name=config.GEMINI_MODEL_PRIMARY,
+        system_instruction=CHAT_SYSTEM_PROMPT,
+        generation_config={"temperature": 0.75, "top_p": 0.9, "top_k": 40}
+    )
+    hist_lines = [f"{m.get('role', 'user')}: {m.get('text', '')}" for m in history[-6:]]
+    context_obj = {
+        "persona_style": STYLEBOOK.get(persona, ""),
+        "phase": phase,
+        "goal_amount": goal_amount,
+        "months": months,
+        "horizon": horizon,
+        "affordability": aff or {},
+        "profile_summary": {
+            "income_net_month": ctx.get("income_net_month", 0.0),
+            "fixed_bills_month": ctx.get("fixed_bills_month", 0.0),
+            "variable_spend_month": ctx.get("variable_spend_month", 0.0),
+        },
+        "plan": plan or {}
+    }
+    prompt = (
+        f"Persona: {persona}\n"
+        f"Context: {json.dumps(context_obj, ensure_ascii=False)}\n"
+        f"Conversation so far:\n{chr(10).join(hist_lines)}\n"
+        f"User: {text}\n"
+        "Trả lời bằng tiếng Việt, ngắn gọn, tự nhiên, phù hợp persona."
+    )
+    return mdl, prompt, {"model": config.GEMINI_MODEL_PRIMARY, "system": CHAT_SYSTEM_PROMPT, "prompt": prompt}
+
+
+def llm_chat_reply(ctx: dict, persona: str, text: str, phase: str, goal_amount, months, horizon, aff: Optional[dict], history: List[Dict[str, Any]], plan: Optional[dict] = None) -> str:
+    """LLM chat reply nhẹ: để model tự quyết câu chữ theo ngữ cảnh"""
+    if not llm_available():
+        return "Tôi không thể xác minh điều này."
+    mdl, prompt, payload = _chat_prompt(ctx, persona, text, phase, goal_amount, months, horizon, aff, history, plan)
+
+    def _generate() -> str:
+        with TRACER.span("llm.chat", model=config.GEMINI_MODEL_PRIMARY):
+            try:
+                resp = mdl.generate_content(prompt)
+            except Exception:
+                LLM_CALLS.inc(op="chat", model=config.GEMINI_MODEL_PRIMARY, outcome="error")
+                raise
+        LLM_CALLS.inc(op="chat", model=config.GEMINI_MODEL_PRIMARY, outcome="ok")
+        return resp.text if hasattr(resp, "text") else resp.candidates[0].content.parts[0].text
+
+    return LLM_CACHE.get_or_compute("chat", payload, _generate, ttl_secs=config.LLM_CHAT_TTL_SECS, should_cache=bool)
+
+
+def llm_chat_reply_stream(ctx: dict, persona: str, text: str, phase: str, goal_amount, months, horizon, aff: Optional[dict], history: List[Dict[str, Any]], plan: Optional[dict] = None) -> Iterator[str]:
+    """Như llm_chat_reply nhưng yield từng đoạn text ngay khi model sinh ra (cache hit → 1 đoạn)"""
+    if not llm_available():
+        yield "Tôi không thể xác minh điều này."
+        return
+    mdl, prompt, payload = _chat_prompt(ctx, persona, text, phase, goal_amount, months, horizon, aff, history, plan)
+    found, cached = LLM_CACHE.lookup("chat", payload)
+    if found:
+        yield cached
+        return
+    parts: List[str] = []
+    outcome = "error"
+    try:
+        with TRACER.span("llm.chat", model=config.GEMINI_MODEL_PRIMARY, stream=True):
+            for chunk in mdl.generate_content(prompt, stream=True):
+                piece = getattr(chunk, "text", "") or ""
+                if piece:
+                    parts.append(piece)
+                    yield piece
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        LLM_CALLS.inc(op="chat_stream", model=config.GEMINI_MODEL_PRIMARY, outcome=outcome)
+    # Chỉ cache khi stream chạy hết (client ngắt giữa chừng → GeneratorExit, không lưu)
+    if parts:
+        LLM_CACHE.store("chat", payload, "".join(parts), ttl_secs=config.LLM_CHAT_TTL_SECS)
@@ -0,0 +1,201 @@
+"""
+LLM response cache: in-memory LRU (size + TTL bounded) in front of a
+content-addressed SQLite store shared by every worker and kept across restarts.
+
+Entries are keyed by sha256 of the canonical JSON payload (namespace + prompt
+inputs). Concurrent identical requests inside a process are coalesced: one
+thread calls the model, the others wait for its result.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DDL = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_llm_cache_expires ON llm_cache(expires_at);
+"""
+
+
+def cache_key(namespace: str, payload: Dict[str, Any]) -> str:
+    raw = json.dumps({"ns": namespace, "p": payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Inflight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LLMCache:
+    """Two-level (memory → SQLite) cache with per-namespace stats and request coalescing"""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 2000, default_ttl_secs: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.default_ttl_secs = default_ttl_secs
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, _Inflight] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._puts = 0
+
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(DDL)
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        payload: Dict[str, Any],
+        compute: Callable[[], Any],
+        ttl_secs: Optional[float] = None,
+        should_cache: Callable[[Any], bool] = lambda v: True,
+    ) -> Any:
+        """Cached value for payload, else compute() once (JSON-able result) and store it."""
+        key = cache_key(namespace, payload)
+        st = self._ns(namespace)
+        found, value = self._get(key)
+        if found:
+            st["hits"] += 1
+            return value
+
+        with self._lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = self._inflight[key] = _Inflight()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            st["coalesced"] += 1
+            waiter.done.wait()
+            if waiter.error is not None:
+                raise waiter.error
+            return waiter.value
+
+        try:
+            # leader trước vừa ghi cache và rời _inflight giữa _get() và lock ở trên → dùng luôn kết quả đó
+            found, value = self._get(key)
+            if found:
+                st["hits"] += 1
+                waiter.value = value
+                return value
+            st["misses"] += 1
+            t0 = time.perf_counter()
+            try:
+                value = compute()
+            except BaseException as e:
+                st["errors"] += 1
+                waiter.error = e
+                raise
+            finally:
+                elapsed = time.perf_counter() - t0
+                st["compute_secs"] += elapsed
+                st["compute_max_secs"] = max(st["compute_max_secs"], elapsed)
+            waiter.value = value
+            # ghi cache TRƯỚC khi rời _inflight: request đến lúc nào cũng thấy cache hoặc in-flight, không gọi lại model
+            try:
+                if should_cache(value):
+                    self._put(key, namespace, value, ttl_secs or self.default_ttl_secs)
+            except Exception as e:
+                print("[Cảnh báo] Ghi LLM cache lỗi:", e)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter.done.set()
+
+    def lookup(self, namespace: str, payload: Dict[str, Any]) -> Tuple[bool, Any]:
+        """(found, value) without computing; for callers that produce the value incrementally (streaming)."""
+        found, value = self._get(cache_key(namespace, payload))
+        self._ns(namespace)["hits" if found else "misses"] += 1
+        return found, value
+
+    def store(self, namespace: str, payload: Dict[str, Any], value: Any, ttl_secs: Optional[float] = None):
+        self._put(cache_key(namespace, payload), namespace, value, ttl_secs or self.default_ttl_secs)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"memory_entries": len(self._mem), "max_entries": self.max_entries, "persistent": self._db is not None}
+        for ns, st in self._stats.items():
+            calls = st["hits"] + st["misses"] + st["coalesced"]
+            out[ns] = {
+                **{k: (round(v, 4) if isinstance(v, float) else v) for k, v in st.items()},
+                "hit_rate": round((st["hits"] + st["coalesced"]) / calls, 4) if calls else 0.0,
+                "avg_compute_secs": round(st["compute_secs"] / st["misses"], 4) if st["misses"] else 0.0,
+            }
+        return out
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._lock:
+            self._mem.clear()
+        if self._db is not None:
+            with self._db_lock:
+                if namespace is None:
+                    self._db.execute("DELETE FROM llm_cache")
+                else:
+                    self._db.execute("DELETE FROM llm_cache WHERE namespace = ?", (namespace,))
+
+    # ---------- internals ----------
+
+    def _ns(self, namespace: str) -> Dict[str, float]:
+        st = self._stats.get(namespace)
+        if st is None:
+            st = self._stats[namespace] = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "compute_secs": 0.0, "compute_max_secs": 0.0}
+        return st
+
+    def _get(self, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._mem.move_to_end(key)
+                    return True, entry[1]
+                del self._mem[key]
+        if self._db is None:
+            return False, None
+        with self._db_lock:
+            row = self._db.execute("SELECT namespace, value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return False, None
+        value = json.loads(row[1])
+        self._ns(row[0])["disk_hits"] += 1
+        self._remember(key, value, row[2])
+        return True, value
+
+    def _put(self, key: str, namespace: str, value: Any, ttl_secs: float):
+        now = time.time()
+        self._remember(key, value, now + ttl_secs)
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, namespace, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, json.dumps(value, ensure_ascii=False, default=str), now, now + ttl_secs),
+            )
+            self._puts += 1
+            if self._puts % 500 == 0:
+                self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._mem[key] = (expires_at, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
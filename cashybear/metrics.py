@@ -0,0 +1,11 @@
+"""Metrics registry + tracer of the CashyBear API (scraped at GET /metrics, slow requests at GET /debug/slow)."""
+
+from telemetry import Registry, Tracer
+
+REGISTRY = Registry()
+TRACER = Tracer("cashybear", REGISTRY)
+
+LLM_CALLS = REGISTRY.counter("cashybear_llm_calls_total", "Gemini calls by operation, model and outcome", ["op", "model", "outcome"])
+LLM_FALLBACKS = REGISTRY.counter("cashybear_llm_fallback_total", "Plan generation falling back (primary → fallback model → deterministic)", ["op", "to"])
+FAST_REPLIES = REGISTRY.counter("cashybear_intent_fast_replies_total", "Chat turns answered from templates without Gemini", ["intent"])
+HOOK_POSTS = REGISTRY.counter("cashybear_hook_direct_posts_total", "Hooks posted directly (outbox disabled or unavailable)", ["outcome"])
@@ -0,0 +1,88 @@
+"""Parse số tiền / số tháng / horizon từ tin nhắn tiếng Việt + format VND."""
+
+import re
+import unicodedata
+from typing import Optional
+
+
+def format_vnd(x: float) -> str:
+    try:
+        return f"{x:,.0f} VNĐ"
+    except Exception:
+        return str(x)
+
+
+_DEF_UNITS = [
+    (r"triệu|tr\b|\bm\b", 1_000_000),
+    (r"nghìn|ngàn|ngan|k\b", 1_000),
+    (r"vnđ|vnd|đồng|dong\b|đ\b", 1),
+]
+
+_GROUPED = r"\d{1,3}(?:[.,]\d{3})+"
+_NUM = rf"({_GROUPED}|\d+(?:[.,]\d+)?)"
+# Số không đơn vị: có dấu phân cách nghìn (50.000) hoặc từ 5 chữ số (45000) mới coi là VND; "2025", "50" thì không
+_BARE_MIN = 10_000
+
+# Regex dựng một lần khi import (trước đây re.search(pattern chuỗi) mỗi lượt chat)
+_TIME_RE = re.compile(r"\b\d+\s*(tháng|thang|thg|tuần|tuan|ngày|ngay)\b")
+_UNIT_RES = [(re.compile(_NUM + rf"\s*({pat})"), mul) for pat, mul in _DEF_UNITS]
+_NUM_RE = re.compile(_NUM)
+_GROUPED_RE = re.compile(_GROUPED + "$")
+_MONTHS_RE = re.compile(r"(\d+)\s*(tháng|thang|thg|months|month)\b")
+_H14_RE = re.compile(r"(14\s*ngày|2\s*tuần)")
+_H7_RE = re.compile(r"(7\s*ngày|1\s*tuần)")
+_FOLD = str.maketrans({"đ": "d", "Đ": "D"})
+
+
+def fold_vi(text: str) -> str:
+    """lowercase, bỏ dấu tiếng Việt (đ → d), gộp khoảng trắng: 'Đồng Ý  nhé' → 'dong y nhe'"""
+    t = unicodedata.normalize("NFD", text.lower().translate(_FOLD))
+    return " ".join("".join(ch for ch in t if not unicodedata.combining(ch)).split())
+
+
+def parse_amount_vi(text: str) -> Optional[float]:
+    t = text.lower()
+    # Loại bỏ cụm thời gian để tránh nhầm số tháng là tiền
+    t_wo_time = _TIME_RE.sub(" ", t)
+    # có đơn vị tiền
+    for unit_re, mul in _UNIT_RES:
+        m = unit_re.search(t_wo_time)
+        if m:
+            raw = m.group(1)
+            # 150.000 / 150,000 = nhóm nghìn; 1,5 / 1.5 = thập phân
+            num = raw.replace(".", "").replace(",", "") if _GROUPED_RE.match(raw) else raw.replace(",", ".")
+            try:
+                return float(num) * mul
+            except Exception:
+                pass
+    # số không đơn vị: 50.000 / 150,000 / 45000 coi là VND
+    m2 = _NUM_RE.search(t_wo_time)
+    if m2:
+        raw = m2.group(1)
+        grouped = bool(_GROUPED_RE.match(raw))
+        if "," in raw and "." in raw:
+            raw = raw.replace(",", "")
+        else:
+            raw = raw.replace(".", "").replace(",", "")
+        try:
+            val = float(raw)
+            return val if grouped or val >= _BARE_MIN else None
+        except Exception:
+            return None
+    return None
+
+
+def parse_months_vi(text: str) -> Optional[int]:
+    m = _MONTHS_RE.search(text.lower())
+    if m:
+        return max(1, int(m.group(1)))
+    return None
+
+
+def parse_horizon_vi(text: str) -> Optional[int]:
+    t = text.lower()
+    if _H14_RE.search(t):
+        return 14
+    if _H7_RE.search(t):
+        return 7
+    return None
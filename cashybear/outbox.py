@@ -0,0 +1,183 @@
+"""
+Transactional outbox for the AdviceLog chain hooks (server/index.js, :4000).
+
+Hook events are INSERTed into `hook_outbox` in the same transaction as the
+data they describe (e.g. persist_plan_and_tasks), so an accepted plan can
+never lose its hook and the request never waits for the node. A background
+HookDispatcher in every worker claims due events with FOR UPDATE SKIP LOCKED,
+posts them over one keep-alive connection, and reschedules failures with
+exponential backoff until `max_attempts`.
+"""
+
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+HookEvent = Tuple[str, Dict[str, Any]]  # (path trên HOOKS_BASE, body)
+
+OUTBOX_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS hook_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        path TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        attempts INT NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        delivered_at TIMESTAMP NULL,
+        last_error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_hook_outbox_due ON hook_outbox(next_attempt_at) WHERE delivered_at IS NULL",
+]
+
+
+def enqueue(conn: Connection, events: Iterable[HookEvent]) -> int:
+    """INSERT hook events using the caller's connection/transaction"""
+    rows = [{"path": path, "payload": json.dumps(body, ensure_ascii=False, default=str)} for path, body in events]
+    if rows:
+        conn.execute(text("INSERT INTO hook_outbox(path, payload) VALUES (:path, CAST(:payload AS JSONB))"), rows)
+    return len(rows)
+
+
+class HookDispatcher:
+    """Background drainer of hook_outbox (one thread per worker, safe to run in many)"""
+
+    def __init__(
+        self,
+        get_engine: Callable[[], Optional[Engine]],
+        base_url: str,
+        batch_size: int = 50,
+        poll_secs: float = 1.0,
+        max_attempts: int = 20,
+        timeout_secs: float = 10.0,
+        lease_secs: float = 120.0,
+    ):
+        self._get_engine = get_engine
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.poll_secs = poll_secs
+        self.max_attempts = max_attempts
+        self.timeout_secs = timeout_secs
+        self.lease_secs = lease_secs
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.delivered = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hook-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Gọi sau khi enqueue để gửi ngay, không chờ hết poll_secs"""
+        self._wake.set()
+
+    def drain_once(self, client: httpx.Client) -> int:
+        """Claim + deliver one batch; returns how many events were claimed."""
+        engine = self._get_engine()
+        if engine is None:
+            return 0
+        batch = self._claim(engine)
+        ok_ids: List[int] = []
+        failed: List[Dict[str, Any]] = []
+        for ev in batch:
+            try:
+                resp = client.post(f"{self.base_url}{ev['path']}", json=ev["payload"])
+                resp.raise_for_status()
+                ok_ids.append(ev["id"])
+            except Exception as e:
+                # backoff 2^attempts giây, tối đa 10 phút
+                failed.append({"id": ev["id"], "err": str(e)[:500], "delay": min(2 ** ev["attempts"], 600)})
+                self.last_error = str(e)
+        with engine.begin() as conn:
+            if ok_ids:
+                conn.execute(text("UPDATE hook_outbox SET delivered_at = NOW(), attempts = attempts + 1, last_error = NULL WHERE id = ANY(:ids)"), {"ids": ok_ids})
+            if failed:
+                conn.execute(text(
+                    """
+                    UPDATE hook_outbox
+                    SET attempts = attempts + 1, last_error = :err,
+                        next_attempt_at = NOW() + make_interval(secs => :delay)
+                    WHERE id = :id
+                    """
+                ), failed)
+        self.delivered += len(ok_ids)
+        self.failed += len(failed)
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "delivered": self.delivered,
+            "failed_attempts": self.failed,
+            "last_error": self.last_error,
+        }
+        engine = self._get_engine()
+        if engine is None:
+            return out
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                """
+                SELECT COUNT(*) FILTER (WHERE attempts < :max) AS pending,
+                       COUNT(*) FILTER (WHERE attempts >= :max) AS dead,
+                       EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE attempts < :max)) AS oldest_pending_secs
+                FROM hook_outbox
+                WHERE delivered_at IS NULL
+                """
+            ), {"max": self.max_attempts}).mappings().first()
+        out.update({
+            "pending": int(row["pending"] or 0),
+            "dead": int(row["dead"] or 0),
+            "oldest_pending_secs": float(row["oldest_pending_secs"] or 0.0),
+        })
+        return out
+
+    # ---------- internals ----------
+
+    def _claim(self, engine: Engine) -> List[Dict[str, Any]]:
+        # Lease: đẩy next_attempt_at ra sau để worker khác không lấy trùng trong lúc đang gửi
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                """
+                UPDATE hook_outbox SET next_attempt_at = NOW() + make_interval(secs => :lease)
+                WHERE id IN (
+                    SELECT id FROM hook_outbox
+                    WHERE delivered_at IS NULL AND attempts < :max AND next_attempt_at <= NOW()
+                    ORDER BY id
+                    LIMIT :lim
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, path, payload, attempts
+                """
+            ), {"lease": float(self.lease_secs), "max": self.max_attempts, "lim": self.batch_size}).mappings().all()
+        return sorted((dict(r) for r in rows), key=lambda r: r["id"])
+
+    def _run(self):
+        with httpx.Client(timeout=self.timeout_secs) as client:
+            while not self._stop.is_set():
+                try:
+                    n = self.drain_once(client)
+                except Exception as e:
+                    print("[Cảnh báo] Hook outbox lỗi:", e)
+                    self.last_error = str(e)
+                    n = 0
+                if n >= self.batch_size:
+                    continue  # còn backlog → lấy batch tiếp ngay
+                self._wake.wait(self.poll_secs)
+                self._wake.clear()
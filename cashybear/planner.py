@@ -0,0 +1,165 @@
+"""Affordability, deterministic 7/14-day planner, plan schema and diff."""
+
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, ValidationError
+
+
+class DayItem(BaseModel):
+    date: str
+    tasks: List[str]
+    day_target_save: float
+
+
+class PlanProposal(BaseModel):
+    feasibility: str
+    weekly_cap_save: float
+    recommended_weekly_save: float
+    reasons: List[str]
+    proposal: dict
+    week_plan: List[DayItem]
+    supervision_note: str
+    confirm_question: str
+
+
+def plan_to_dict(plan: Any) -> Any:
+    if hasattr(plan, "model_dump"):
+        return plan.model_dump()
+    if hasattr(plan, "dict"):
+        return plan.dict()
+    return plan
+
+
+def parse_plan_json(raw: str) -> PlanProposal:
+    """Parser an toàn cho output JSON của LLM"""
+    try:
+        return PlanProposal(**json.loads(raw))
+    except (ValueError, TypeError, ValidationError) as e:
+        raise ValueError(f"Invalid plan JSON: {e}") from e
+
+
+def affordability_from_context(ctx: dict, goal_amount: float, months: int) -> dict:
+    income = max(0.0, ctx.get("income_net_month", 0.0))
+    fixed = max(0.0, ctx.get("fixed_bills_month", 0.0))
+    variable = max(0.0, ctx.get("variable_spend_month", 0.0))
+    loan_raw = max(0.0, ctx.get("loan_month", 0.0))
+
+    # Ước lượng trả nợ hàng tháng nếu 'loan' có vẻ là dư nợ (quá lớn so với thu nhập)
+    # Giả định: nếu loan_raw > 1.5 * income => coi là dư nợ, ước lượng trả tối thiểu ~4%/tháng, trần 30% thu nhập
+    if loan_raw > income * 1.5:
+        loan_pay = min(round(loan_raw * 0.04, 2), round(income * 0.3, 2))
+        loan_reason = "Ước lượng trả nợ tối thiểu ~4%/tháng (trần 30% thu nhập)."
+    else:
+        loan_pay = loan_raw
+        loan_reason = ""
+
+    free_month_naive = income - fixed - variable - loan_pay
+
+    # Nếu phần dư âm/≈0, giả định có thể cắt giảm 15% chi linh hoạt làm dư địa
+    if free_month_naive <= 0:
+        potential_cut = round(variable * 0.15, 2)
+        free_month = max(0.0, free_month_naive + potential_cut)
+        cut_reason = "Giả định cắt giảm chi linh hoạt ~15% để tạo dư địa." if potential_cut > 0 else ""
+    else:
+        free_month = free_month_naive
+        cut_reason = ""
+
+    weekly_cap = max(0.0, free_month / 4.0)
+    # đề xuất mặc định: 75% của trần để có biên an toàn
+    recommended_weekly = round(weekly_cap * 0.75, 2)
+
+    total_weeks = max(1, months * 4)
+    required_weekly = round(goal_amount / total_weeks, 2) if goal_amount > 0 else 0.0
+
+    feas = "ok" if required_weekly <= weekly_cap + 1e-6 else "adjust"
+    reasons = []
+    if loan_reason:
+        reasons.append(loan_reason)
+    if cut_reason:
+        reasons.append(cut_reason)
+    if feas == "ok":
+        reasons.append("Mục tiêu nằm trong khả năng theo dư địa đã tính.")
+    else:
+        gap = max(0.0, required_weekly - weekly_cap)
+        reasons.append(f"Thiếu khoảng ~{round(gap,2)} mỗi tuần so với mục tiêu tuần.")
+    return {
+        "weekly_cap_save": round(weekly_cap, 2),
+        "recommended_weekly_save": recommended_weekly,
+        "required_weekly_save": required_weekly,
+        "feasibility": feas,
+        "reasons": reasons,
+    }
+
+
+# Mẫu nhiệm vụ đa dạng theo ngày trong tuần
+_TASK_TEMPLATES = [
+    ["Chuẩn bị bữa ăn ở nhà", "Giảm đồ uống có đường", "Rà soát subscriptions"],
+    ["Mang cơm trưa", "Đi bộ thay vì xe", "Hạn chế mua vặt"],
+    ["Nấu ăn theo plan", "Giảm đặt đồ ăn", "Tắt dịch vụ không dùng"],
+    ["Ăn tối ở nhà", "Uống nước lọc thay đồ uống", "So sánh giá trước khi mua"],
+    ["Tự pha cà phê", "Đi xe buýt/ghép xe", "Ưu tiên đồ sẵn có"],
+    ["Không mua bốc đồng", "Lập danh sách mua", "Kiểm soát giải trí trả phí"],
+    ["Nấu ăn cuối tuần", "Hoạt động miễn phí", "Chuẩn bị bữa cho tuần tới"],
+]
+
+
+def propose_week_plan_deterministic(start_date: date, horizon_days: int, weekly_save: float) -> list:
+    days = []
+    per_day = weekly_save / (7.0 if horizon_days == 7 else 14.0)
+    for i in range(horizon_days):
+        d = start_date + timedelta(days=i)
+        base = _TASK_TEMPLATES[d.weekday()]
+        # chia nhỏ mục tiêu theo 3 nhiệm vụ ~ 50%/30%/20%
+        s1 = round(per_day * 0.5)
+        s2 = round(per_day * 0.3)
+        s3 = round(per_day * 0.2)
+        tasks = [
+            f"{base[0]} (tiết kiệm ~{int(s1):,} VNĐ).",
+            f"{base[1]} (tiết kiệm ~{int(s2):,} VNĐ).",
+            f"{base[2]} (tiết kiệm ~{int(s3):,} VNĐ).",
+        ]
+        days.append({"date": d.isoformat(), "tasks": tasks, "day_target_save": round(per_day)})
+    return days
+
+
+def deterministic_plan(ctx: dict, goal_amount: float, months: int, horizon_days: int, extra_reasons: List[str] = ()) -> PlanProposal:
+    """Kế hoạch không cần LLM, dựa trên affordability"""
+    aff = affordability_from_context(ctx, goal_amount, months)
+    weekly = aff["recommended_weekly_save"] if aff["feasibility"] == "ok" else min(aff["recommended_weekly_save"], aff["weekly_cap_save"])
+    return PlanProposal(
+        feasibility=aff["feasibility"],
+        weekly_cap_save=aff["weekly_cap_save"],
+        recommended_weekly_save=aff["recommended_weekly_save"],
+        reasons=aff["reasons"] + list(extra_reasons),
+        proposal={"target_amount": goal_amount, "target_date": None, "horizon_days": horizon_days},
+        week_plan=propose_week_plan_deterministic(date.today(), horizon_days, weekly),
+        supervision_note="Tôi sẽ giám sát tuần này. Đạt → lặp lại; Không đạt → điều chỉnh.",
+        confirm_question="Bạn đồng ý kế hoạch này không?",
+    )
+
+
+def diff_plans(prev: Any, curr: Any) -> List[str]:
+    """Simple diff theo ngày; nhận list ngày hoặc cả dict kế hoạch (tự lấy week_plan)"""
+    def _days(x: Any) -> List[Dict[str, Any]]:
+        x = plan_to_dict(x)
+        if isinstance(x, dict):
+            x = x.get("week_plan", [])
+        return [plan_to_dict(d) for d in (x or [])]
+
+    prev_map = {d.get("date"): d for d in _days(prev)}
+    curr_map = {d.get("date"): d for d in _days(curr)}
+    changes = []
+    for dt in sorted(set(prev_map) | set(curr_map)):
+        a, b = prev_map.get(dt), curr_map.get(dt)
+        if a is None:
+            changes.append(f"+ {dt}: thêm {len(b.get('tasks', []))} nhiệm vụ, mục tiêu {b.get('day_target_save')}")
+        elif b is None:
+            changes.append(f"- {dt}: xóa {len(a.get('tasks', []))} nhiệm vụ")
+        else:
+            if a.get("day_target_save") != b.get("day_target_save"):
+                changes.append(f"~ {dt}: day_target_save {a.get('day_target_save')} → {b.get('day_target_save')}")
+            if a.get("tasks") != b.get("tasks"):
+                changes.append(f"~ {dt}: cập nhật nhiệm vụ")
+    return changes
@@ -0,0 +1,113 @@
+"""
+In-process cache of normalized customer contexts (features_monthly → build_context).
+
+Keyed by (customer_id, year_month), LRU-bounded, with an optional TTL as a
+safety net. Invalidation is explicit: `invalidate()` drops entries locally and
+bumps a shared epoch file, which every worker checks before serving a hit, so
+a features_monthly reload reaches all workers on the host.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+Key = Tuple[int, str]
+LoadFn = Callable[[int, str], Optional[Dict[str, Any]]]
+
+
+class ProfileCache:
+    """LRU of customer contexts with shared-epoch invalidation"""
+
+    def __init__(self, load: LoadFn, max_entries: int = 20_000, ttl_secs: Optional[float] = None, epoch_path: Optional[str] = None):
+        self._load = load
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        self.epoch_path = epoch_path
+        self._entries: "OrderedDict[Key, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = self._read_epoch()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, customer_id: int, year_month: str) -> Optional[Dict[str, Any]]:
+        """Context for the customer as of `year_month` (None when no profile row exists)."""
+        key = (int(customer_id), str(year_month))
+        self._check_epoch()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl_secs is None or time.monotonic() - entry[0] < self.ttl_secs):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+        self.misses += 1
+        ctx = self._load(*key)
+        if ctx is not None:
+            self.put(key[0], key[1], ctx)
+        return dict(ctx) if ctx is not None else None
+
+    def put(self, customer_id: int, year_month: str, ctx: Dict[str, Any]):
+        with self._lock:
+            key = (int(customer_id), str(year_month))
+            self._entries[key] = (time.monotonic(), ctx)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def warm_up(self, rows: Iterable[Tuple[int, str, Dict[str, Any]]]) -> int:
+        """Preload (customer_id, year_month, ctx) tuples; returns how many were loaded."""
+        n = 0
+        for customer_id, year_month, ctx in rows:
+            self.put(customer_id, year_month, ctx)
+            n += 1
+        return n
+
+    def invalidate(self, customer_id: Optional[int] = None) -> int:
+        """Drop one customer (all months) or everything, and signal other workers."""
+        with self._lock:
+            if customer_id is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k in self._entries if k[0] == int(customer_id)]
+                for k in keys:
+                    del self._entries[k]
+                dropped = len(keys)
+        self._bump_epoch()
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "max_entries": self.max_entries,
+            "ttl_secs": self.ttl_secs,
+            "epoch": self._epoch,
+        }
+
+    # ---------- shared epoch (file mtime) ----------
+
+    def _read_epoch(self) -> float:
+        if not self.epoch_path:
+            return 0.0
+        try:
+            return os.stat(self.epoch_path).st_mtime_ns / 1e9
+        except OSError:
+            return 0.0
+
+    def _bump_epoch(self):
+        if not self.epoch_path:
+            return
+        with open(self.epoch_path, "a"):
+            os.utime(self.epoch_path, None)
+        self._epoch = self._read_epoch()
+
+    def _check_epoch(self):
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            # Worker khác đã invalidate (vd. vừa nạp features_monthly mới): xóa toàn bộ
+            with self._lock:
+                self._entries.clear()
+            self._epoch = epoch
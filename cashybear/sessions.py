@@ -0,0 +1,170 @@
+"""
+Chat session stores for the CashyBear API.
+
+Sessions are plain JSON-able dicts keyed by sessionId (e.g. `zalo_{user_id}`
+from the Zalo bridge). Expiry is O(log n): the in-process store keeps a
+min-heap of deadlines, the SQLite store an index on `expires_at`. The SQLite
+backend is shared by every worker on the host, so any worker can continue a
+session another one started.
+"""
+
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import config
+
+
+def new_session() -> Dict[str, Any]:
+    return {
+        "history": [],
+        "ctx": None,
+        "goal_amount": None,
+        "months": None,
+        "horizon": None,
+        "phase": "awaiting_goal",
+        "plan_generated": False,
+        "last_plan": None,
+        "saved_plan_id": None,
+    }
+
+
+class SessionStore(ABC):
+    """Backend interface: load() returns a session dict (fresh if missing/expired), save() writes it back"""
+
+    def __init__(self, ttl_secs: float = 3600, history_limit: int = 40):
+        self.ttl_secs = ttl_secs
+        self.history_limit = history_limit
+
+    @abstractmethod
+    def load(self, session_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, st: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def _trim(self, st: Dict[str, Any]) -> Dict[str, Any]:
+        hist = st.get("history") or []
+        if len(hist) > self.history_limit:
+            st["history"] = hist[-self.history_limit:]
+        return st
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process dict + deadline heap (lazy deletion of superseded heap entries)"""
+
+    def __init__(self, ttl_secs: float = 3600, history_limit: int = 40):
+        super().__init__(ttl_secs, history_limit)
+        self._sessions: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._sessions.get(session_id)
+            return entry[1] if entry else new_session()
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._sessions.get(session_id)
+        return entry[1] if entry and entry[0] > time.time() else None
+
+    def save(self, session_id: str, st: Dict[str, Any]) -> None:
+        deadline = time.time() + self.ttl_secs
+        with self._lock:
+            self._sessions[session_id] = (deadline, self._trim(st))
+            heapq.heappush(self._heap, (deadline, session_id))
+            # Heap giữ cả deadline cũ của session được touch lại; dọn khi phình gấp đôi
+            if len(self._heap) > 2 * len(self._sessions) + 64:
+                self._heap = [(d, sid) for sid, (d, _) in self._sessions.items()]
+                heapq.heapify(self._heap)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "sessions": len(self._sessions), "heap": len(self._heap), "ttl_secs": self.ttl_secs}
+
+    def _expire(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            deadline, sid = heapq.heappop(self._heap)
+            entry = self._sessions.get(sid)
+            if entry is not None and entry[0] <= now:
+                del self._sessions[sid]
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite file (WAL) shared by all workers of the host"""
+
+    DDL = """
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        session_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_chat_sessions_expires ON chat_sessions(expires_at);
+    """
+
+    def __init__(self, db_path: str, ttl_secs: float = 3600, history_limit: int = 40, expire_every: float = 30.0):
+        super().__init__(ttl_secs, history_limit)
+        self.db_path = db_path
+        self.expire_every = expire_every
+        self._last_expire = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.DDL)
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        now = time.time()
+        if now - self._last_expire > self.expire_every:
+            self._expire(now)
+        st = self.peek(session_id)
+        return st if st is not None else new_session()
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM chat_sessions WHERE session_id = ? AND expires_at > ?",
+                (session_id, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, st: Dict[str, Any]) -> None:
+        data = json.dumps(self._trim(st), ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO chat_sessions(session_id, data, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                (session_id, data, time.time() + self.ttl_secs),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self._db.execute("SELECT COUNT(*) FROM chat_sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "sessions": n, "db_path": self.db_path, "ttl_secs": self.ttl_secs}
+
+    def _expire(self, now: float):
+        self._last_expire = now
+        with self._lock:
+            self._db.execute("DELETE FROM chat_sessions WHERE expires_at <= ?", (now,))
+
+
+def make_session_store() -> SessionStore:
+    """Backend theo config.SESSION_BACKEND ('sqlite' | 'memory')"""
+    if config.SESSION_BACKEND == "memory":
+        return MemorySessionStore(config.SESSION_TTL_SECS, config.SESSION_HISTORY_LIMIT)
+    if config.SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(config.SESSION_DB_PATH, config.SESSION_TTL_SECS, config.SESSION_HISTORY_LIMIT)
+    raise ValueError(f"Unknown CASHYBEAR_SESSION_BACKEND: {config.SESSION_BACKEND}")
@@ -0,0 +1,125 @@
+"""
+In-memory index of the latest prediction per (customer_id, year_month) from
+predictions_llm_with_facts, for /signals/offer and campaign-wide batch sweeps.
+
+The table is loaded once, then refreshed incrementally with a watermark on
+`created_at` (the scoring notebook's upsert sets created_at = now()). Refreshes
+run at most every `refresh_secs` on read, or on demand via refresh().
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+Key = Tuple[int, str]
+
+_COLUMNS = "customer_id, year_month, probability, decision, facts, created_at"
+
+# now() của upsert là thời điểm bắt đầu transaction → đọc lùi một khoảng để không sót dòng commit muộn
+_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+class PredictionIndex:
+    """Latest prediction row per (customer_id, year_month), watermark-refreshed"""
+
+    def __init__(self, get_engine: Callable[[], Optional[Engine]], refresh_secs: float = 60.0):
+        self._get_engine = get_engine
+        self.refresh_secs = refresh_secs
+        self._rows: Dict[Key, Dict[str, Any]] = {}
+        self._watermark: Optional[datetime] = None
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+
+    def load(self) -> int:
+        """Full (re)load; returns number of rows indexed."""
+        rows = self._query(f"SELECT {_COLUMNS} FROM predictions_llm_with_facts", {})
+        with self._lock:
+            self._rows = {}
+            self._watermark = None
+            self._apply(rows)
+            self._loaded = True
+            self._last_refresh = time.monotonic()
+        return len(rows)
+
+    def refresh(self) -> int:
+        """Pull rows newer than the watermark; returns how many changed."""
+        if not self._loaded:
+            return self.load()
+        since = (self._watermark - _WATERMARK_OVERLAP) if self._watermark is not None else datetime.min
+        rows = self._query(f"SELECT {_COLUMNS} FROM predictions_llm_with_facts WHERE created_at > :since ORDER BY created_at", {"since": since})
+        with self._lock:
+            n = self._apply(rows)
+            self._last_refresh = time.monotonic()
+            self.refreshes += 1
+        return n
+
+    def get(self, customer_id: int, year_month: str) -> Optional[Dict[str, Any]]:
+        self._maybe_refresh()
+        return self._rows.get((int(customer_id), str(year_month)))
+
+    def get_many(self, customer_ids: Iterable[int], year_month: str) -> List[Tuple[int, Optional[Dict[str, Any]]]]:
+        self._maybe_refresh()
+        ym = str(year_month)
+        rows = self._rows
+        return [(int(cid), rows.get((int(cid), ym))) for cid in customer_ids]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._loaded,
+            "entries": len(self._rows),
+            "watermark": (self._watermark.isoformat() if self._watermark is not None else None),
+            "refreshes": self.refreshes,
+            "refresh_secs": self.refresh_secs,
+        }
+
+    # ---------- internals ----------
+
+    def _maybe_refresh(self):
+        if self._loaded and time.monotonic() - self._last_refresh < self.refresh_secs:
+            return
+        # một thread refresh, các request khác đọc index hiện có (trừ lần nạp đầu)
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded or time.monotonic() - self._last_refresh >= self.refresh_secs:
+                self.refresh()
+        except Exception as e:
+            if not self._loaded:
+                raise
+            # DB chập chờn: vẫn phục vụ từ index hiện có
+            print("[Cảnh báo] Refresh predictions index lỗi:", e)
+            self._last_refresh = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _query(self, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        engine = self._get_engine()
+        if engine is None:
+            raise RuntimeError("DB engine not available")
+        with engine.connect() as conn:
+            return [dict(r) for r in conn.execute(text(sql), params).mappings().all()]
+
+    def _apply(self, rows: List[Dict[str, Any]]) -> int:
+        n = 0
+        for r in rows:
+            key = (int(r["customer_id"]), str(r["year_month"]))
+            cur = self._rows.get(key)
+            created = r.get("created_at")
+            if cur is None or created is None or cur.get("created_at") is None or created >= cur["created_at"]:
+                self._rows[key] = {
+                    "probability": (float(r["probability"]) if r["probability"] is not None else None),
+                    "decision": r["decision"],
+                    "facts": r["facts"],
+                    "created_at": created,
+                }
+                n += 1
+            if created is not None and (self._watermark is None or created > self._watermark):
+                self._watermark = created
+        return n
@@ -0,0 +1,302 @@
+"""
+Spend ingestion: /spend/log events are buffered in memory and flushed in
+micro-batches by a background SpendIngestor (one thread per worker).
+
+A flush is ONE statement. It does a multi-row INSERT into persona_spend_events
+(rows passed as JSONB). The same statement upserts the running per-customer
+totals in persona_spend_daily and persona_spend_weekly. Reading today's or this
+week's spend is a primary-key lookup, never a scan of the events table. Events
+carry a client-side event_id, so a flush retried after a lost commit is
+idempotent.
+"""
+
+import json
+import threading
+import uuid
+from collections import deque
+from datetime import date, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+SPEND_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS persona_spend_daily (
+        customer_id VARCHAR(64) NOT NULL,
+        date DATE NOT NULL,
+        amount NUMERIC NOT NULL DEFAULT 0,
+        events INT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (customer_id, date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS persona_spend_weekly (
+        customer_id VARCHAR(64) NOT NULL,
+        week_start DATE NOT NULL,
+        amount NUMERIC NOT NULL DEFAULT 0,
+        events INT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (customer_id, week_start)
+    )
+    """,
+    # Backfill một lần từ events có sẵn (chỉ khi bảng tổng hợp còn rỗng)
+    """
+    INSERT INTO persona_spend_daily(customer_id, date, amount, events)
+    SELECT customer_id, date, SUM(amount), COUNT(*) FROM persona_spend_events
+    WHERE NOT EXISTS (SELECT 1 FROM persona_spend_daily)
+    GROUP BY customer_id, date
+    """,
+    """
+    INSERT INTO persona_spend_weekly(customer_id, week_start, amount, events)
+    SELECT customer_id, CAST(date_trunc('week', date) AS DATE), SUM(amount), COUNT(*) FROM persona_spend_events
+    WHERE NOT EXISTS (SELECT 1 FROM persona_spend_weekly)
+    GROUP BY customer_id, CAST(date_trunc('week', date) AS DATE)
+    """,
+]
+
+# Events + tổng ngày + tổng tuần trong MỘT câu lệnh; aggregate chỉ cộng các dòng thật sự được INSERT
+# (ON CONFLICT (event_id) DO NOTHING) → flush lặp lại không cộng hai lần. ORDER BY = thứ tự khóa cố định, tránh deadlock giữa worker.
+_INGEST_SQL = text(
+    """
+    WITH ev AS (
+        INSERT INTO persona_spend_events(event_id, customer_id, date, amount, category, note)
+        SELECT r.event_id, r.customer_id, r.date, r.amount, r.category, r.note
+        FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+             AS r(event_id UUID, customer_id TEXT, date DATE, amount NUMERIC, category TEXT, note TEXT)
+        ORDER BY r.customer_id, r.date
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING customer_id, date, amount
+    ),
+    daily AS (
+        INSERT INTO persona_spend_daily AS d(customer_id, date, amount, events)
+        SELECT customer_id, date, SUM(amount), COUNT(*) FROM ev
+        GROUP BY customer_id, date
+        ORDER BY customer_id, date
+        ON CONFLICT (customer_id, date) DO UPDATE
+        SET amount = d.amount + EXCLUDED.amount, events = d.events + EXCLUDED.events, updated_at = NOW()
+        RETURNING 1
+    ),
+    weekly AS (
+        INSERT INTO persona_spend_weekly AS w(customer_id, week_start, amount, events)
+        SELECT customer_id, CAST(date_trunc('week', date) AS DATE), SUM(amount), COUNT(*) FROM ev
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (customer_id, week_start) DO UPDATE
+        SET amount = w.amount + EXCLUDED.amount, events = w.events + EXCLUDED.events, updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM ev) AS inserted, (SELECT COUNT(*) FROM daily) AS days, (SELECT COUNT(*) FROM weekly) AS weeks
+    """
+)
+
+_TOTALS_SQL = text(
+    """
+    SELECT
+        (SELECT amount FROM persona_spend_daily WHERE customer_id = :cid AND date = :day) AS day_amount,
+        (SELECT events FROM persona_spend_daily WHERE customer_id = :cid AND date = :day) AS day_events,
+        (SELECT amount FROM persona_spend_weekly WHERE customer_id = :cid AND week_start = :week) AS week_amount,
+        (SELECT events FROM persona_spend_weekly WHERE customer_id = :cid AND week_start = :week) AS week_events
+    """
+)
+
+
+def week_start(d: date) -> date:
+    """Monday of d's week (= date_trunc('week', d) in Postgres)"""
+    return d - timedelta(days=d.weekday())
+
+
+def make_event(customer_id: Any, spend_date: Any, amount: float, category: str = "", note: str = "") -> Dict[str, Any]:
+    """Normalized spend event; raises ValueError on a bad date/amount"""
+    d = spend_date if isinstance(spend_date, date) else date.fromisoformat(str(spend_date).strip()[:10])
+    amt = float(amount)
+    if amt != amt or amt in (float("inf"), float("-inf")):
+        raise ValueError(f"Invalid amount: {amount}")
+    return {
+        "event_id": str(uuid.uuid4()),
+        "customer_id": str(customer_id),
+        "date": d.isoformat(),
+        "amount": amt,
+        "category": str(category or ""),
+        "note": str(note or ""),
+    }
+
+
+def ingest(conn: Connection, events: List[Dict[str, Any]]) -> int:
+    """Write events + update daily/weekly totals using the caller's connection; returns rows inserted"""
+    if not events:
+        return 0
+    row = conn.execute(_INGEST_SQL, {"rows": json.dumps(events, ensure_ascii=False)}).mappings().first()
+    return int(row["inserted"] or 0)
+
+
+def fetch_totals(conn: Connection, customer_id: Any, day: date) -> Dict[str, Any]:
+    """Stored day/week totals of a customer (PK lookups on the aggregate tables)"""
+    row = conn.execute(_TOTALS_SQL, {"cid": str(customer_id), "day": day, "week": week_start(day)}).mappings().first()
+    return {
+        "day_amount": float(row["day_amount"] or 0.0),
+        "day_events": int(row["day_events"] or 0),
+        "week_amount": float(row["week_amount"] or 0.0),
+        "week_events": int(row["week_events"] or 0),
+    }
+
+
+Key = Tuple[str, str]  # (customer_id, ISO date | ISO week_start)
+
+
+class SpendIngestor:
+    """In-memory buffer of spend events, flushed in micro-batches by a background thread.
+
+    Buffered and in-flight events are also kept as per-customer day/week deltas, so
+    totals() includes them before they reach the DB (read-your-writes in this worker).
+    """
+
+    def __init__(
+        self,
+        get_engine: Callable[[], Optional[Engine]],
+        batch_size: int = 500,
+        flush_secs: float = 0.5,
+        max_buffer: int = 20000,
+    ):
+        self._get_engine = get_engine
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.max_buffer = max_buffer
+        self._buf: Deque[Dict[str, Any]] = deque()
+        self._pending_day: Dict[Key, List[float]] = {}
+        self._pending_week: Dict[Key, List[float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spend-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the thread and flush what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            print("[Cảnh báo] Flush spend buffer lúc tắt lỗi:", e)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, event: Dict[str, Any]) -> bool:
+        """Buffer one event (make_event); False when the buffer is full – caller writes it synchronously"""
+        with self._lock:
+            if len(self._buf) >= self.max_buffer:
+                self.rejected += 1
+                return False
+            self._buf.append(event)
+            self._add_pending(event, 1)
+            full = len(self._buf) >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    def pending(self, customer_id: Any, day: date) -> Tuple[float, int, float, int]:
+        """(day amount, day events, week amount, week events) not yet flushed by this worker"""
+        cid = str(customer_id)
+        d = self._pending_day.get((cid, day.isoformat()), (0.0, 0))
+        w = self._pending_week.get((cid, week_start(day).isoformat()), (0.0, 0))
+        return d[0], int(d[1]), w[0], int(w[1])
+
+    def totals(self, conn: Connection, customer_id: Any, day: date) -> Dict[str, Any]:
+        """fetch_totals + this worker's unflushed events"""
+        out = fetch_totals(conn, customer_id, day)
+        d_amt, d_n, w_amt, w_n = self.pending(customer_id, day)
+        out["day_amount"] += d_amt
+        out["day_events"] += d_n
+        out["week_amount"] += w_amt
+        out["week_events"] += w_n
+        return out
+
+    def flush(self) -> int:
+        """Write one batch; returns how many events were taken from the buffer"""
+        with self._flush_lock:
+            with self._lock:
+                n = min(len(self._buf), self.batch_size)
+                batch = [self._buf.popleft() for _ in range(n)]
+            if not batch:
+                return 0
+            engine = self._get_engine()
+            try:
+                if engine is None:
+                    raise RuntimeError("DB engine not available")
+                with engine.begin() as conn:
+                    ingest(conn, batch)
+            except Exception:
+                # trả lại đầu hàng đợi, giữ thứ tự; event_id giữ nguyên nên ghi lại không bị trùng
+                with self._lock:
+                    self._buf.extendleft(reversed(batch))
+                self.failed_flushes += 1
+                raise
+            with self._lock:
+                for ev in batch:
+                    self._add_pending(ev, -1)
+            self.flushed += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "buffered": len(self._buf),
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rejected": self.rejected,
+            "batch_size": self.batch_size,
+            "flush_secs": self.flush_secs,
+            "last_error": self.last_error,
+        }
+
+    # ---------- internals ----------
+
+    def _add_pending(self, ev: Dict[str, Any], sign: int):
+        d = date.fromisoformat(ev["date"])
+        for store, key in (
+            (self._pending_day, (ev["customer_id"], ev["date"])),
+            (self._pending_week, (ev["customer_id"], week_start(d).isoformat())),
+        ):
+            acc = store.setdefault(key, [0.0, 0])
+            acc[0] += sign * ev["amount"]
+            acc[1] += sign
+            if acc[1] <= 0:
+                del store[key]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                n = self.flush()
+            except Exception as e:
+                print("[Cảnh báo] Flush spend events lỗi:", e)
+                self.last_error = str(e)
+                n = 0
+                # DB lỗi: chờ hết chu kỳ rồi thử lại, không quay vòng liên tục
+                self._stop.wait(max(self.flush_secs, 1.0))
+                continue
+            if n >= self.batch_size:
+                continue  # còn backlog → ghi batch tiếp ngay
+            self._wake.wait(self.flush_secs)
+            self._wake.clear()
+
@@ -201,7 +201,7 @@ export interface TodoSummary {
 }
 
 export async function getTodo(customerId: number): Promise<{ planId: string | null; tasks: TodoTask[]; summary: TodoSummary }>{
-  const res = await fetch(`${NB_API}/dashboard/todo?customerId=${encodeURIComponent(customerId)}`);
+  const res = await fetch(`${NB_API}/dashboard/todo?customerId=${encodeURIComponent(customerId)}&includeTasks=true`);
   if (!res.ok) throw new Error('Không tải được Dashboard');
   return res.json();
 }
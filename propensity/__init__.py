@@ -0,0 +1,19 @@
+"""
+Customer propensity scoring (customer_propensity_model.joblib), packaged out of
+CustomerPotentialModel.ipynb for batch jobs and services.
+
+Batch scoring: `python -m propensity.batch --chunk-size 50000 --workers 4`.
+"""
+
+from .facts import FACT_CATALOG, FactExtractor
+from .scoring import classify_decision, classify_decisions, load_model, priority_send, score_frame
+
+__all__ = [
+    "FACT_CATALOG",
+    "FactExtractor",
+    "classify_decision",
+    "classify_decisions",
+    "load_model",
+    "priority_send",
+    "score_frame",
+]
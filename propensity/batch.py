@@ -0,0 +1,131 @@
+"""
+Batch scoring job: `python -m propensity.batch [--year-month 2025-08] [--workers 4]`.
+
+Streams features_monthly through a server-side cursor in fixed-size chunks,
+scores each chunk vectorized (predict_proba + decision + priority_send), and
+upserts it into `predictions` and/or appends it to a JSONL file. With
+--workers > 1 chunks are scored in a process pool; at most 2×workers chunks are
+in flight, so memory stays bounded by chunk size, not table size.
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from . import config
+from .db import ensure_prediction_tables, fetch_fingerprints, get_engine, iter_feature_chunks, upsert_predictions
+from .notify import notify_features_reloaded
+from .scoring import changed_mask, feature_fingerprints, load_model, model_version, score_frame
+
+_MODEL_PATH: Optional[str] = None
+
+
+def _init_worker(model_path: str):
+    global _MODEL_PATH
+    _MODEL_PATH = model_path
+    load_model(model_path)
+
+
+def _chunk_hashes(chunk: pd.DataFrame) -> Optional[np.ndarray]:
+    """feature_hash attached by only_changed (None → score_frame hashes the chunk itself)"""
+    return chunk["feature_hash"].to_numpy(dtype=np.int64) if "feature_hash" in chunk else None
+
+
+def _score_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    path = _MODEL_PATH or config.MODEL_FILE
+    return score_frame(load_model(path), chunk, model_version(path), _chunk_hashes(chunk))
+
+
+def score_chunks(chunks: Iterable[pd.DataFrame], model_path: str, workers: int = 1) -> Iterator[pd.DataFrame]:
+    """Scored frames in input order; process pool when workers > 1"""
+    if workers <= 1:
+        model, version = load_model(model_path), model_version(model_path)
+        for chunk in chunks:
+            yield score_frame(model, chunk, version, _chunk_hashes(chunk))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        inflight: Deque[Future] = deque()
+        for chunk in chunks:
+            inflight.append(pool.submit(_score_chunk, chunk))
+            if len(inflight) >= 2 * workers:
+                yield inflight.popleft().result()
+        while inflight:
+            yield inflight.popleft().result()
+
+
+def only_changed(
+    chunks: Iterable[pd.DataFrame], model_path: str, engine: Engine, year_month: Optional[str], counter: Counter
+) -> Iterator[pd.DataFrame]:
+    """Drop rows whose (feature_hash, model_version) already match `predictions`.
+
+    Stored fingerprints are fetched per chunk (only that chunk's customers), so memory stays
+    ~ one chunk; the hashes ride along as a feature_hash column so scoring does not rehash."""
+    model, version = load_model(model_path), model_version(model_path)
+    for chunk in chunks:
+        hashes = feature_fingerprints(model, chunk)
+        stored = fetch_fingerprints(engine, chunk["customer_id"], year_month)
+        mask = changed_mask(chunk, hashes, version, stored)
+        counter["unchanged"] += int((~mask).sum())
+        if mask.any():
+            yield chunk[mask].assign(feature_hash=hashes[mask])
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="propensity.batch", description="Chunked batch scoring of features_monthly")
+    ap.add_argument("--year-month", default=None, help="chỉ chấm tháng này (mặc định: toàn bảng)")
+    ap.add_argument("--chunk-size", type=int, default=config.CHUNK_SIZE)
+    ap.add_argument("--workers", type=int, default=1, help="số process chấm điểm")
+    ap.add_argument("--model", default=config.MODEL_FILE)
+    ap.add_argument("--out", default=None, help="ghi thêm JSONL (vd. predictions.jsonl)")
+    ap.add_argument("--no-db-write", action="store_true", help="không upsert bảng predictions")
+    ap.add_argument("--incremental", action="store_true", help="chỉ chấm KH có features/model đổi so với predictions")
+    ap.add_argument("--no-notify", action="store_true", help="không báo CashyBear API (/profiles/invalidate, /signals/refresh)")
+    args = ap.parse_args()
+
+    engine = get_engine()
+    if not args.no_db_write or args.incremental:
+        with engine.begin() as conn:
+            ensure_prediction_tables(conn)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    total = 0
+    decisions: Counter = Counter()
+    skipped: Counter = Counter()
+    t0 = time.perf_counter()
+    try:
+        chunks = iter_feature_chunks(engine, args.chunk_size, args.year_month)
+        if args.incremental:
+            print(f"  incremental: model {model_version(args.model)}")
+            chunks = only_changed(chunks, args.model, engine, args.year_month, skipped)
+        for scored in score_chunks(chunks, args.model, args.workers):
+            if not args.no_db_write:
+                with engine.begin() as conn:
+                    upsert_predictions(conn, scored)
+            if out is not None:
+                scored.to_json(out, orient="records", lines=True, force_ascii=False)
+            total += len(scored)
+            decisions.update(scored["decision"].tolist())
+            print(f"  scored {total} rows ({total / max(time.perf_counter() - t0, 1e-9):.0f} rows/s)", flush=True)
+    finally:
+        if out is not None:
+            out.close()
+
+    print(
+        f"✅ Done: {total} rows in {time.perf_counter() - t0:.1f}s | " + ", ".join(f"{k}={v}" for k, v in sorted(decisions.items()))
+        + (f" | unchanged={skipped['unchanged']}" if args.incremental else "")
+    )
+    if not args.no_notify and total:
+        # features vừa nạp/đổi → các worker CashyBear bỏ context cũ trong ProfileCache
+        notify_features_reloaded()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+NumPy-only export of customer_propensity_model.joblib for real-time scoring.
+
+The fitted Pipeline (StandardScaler + OneHotEncoder → CalibratedClassifierCV of
+LogisticRegression, isotonic, 5 folds) is flattened into one .npz: scaler
+means/scales, one-hot categories, each fold's LR coef/intercept and isotonic
+breakpoints. CompactScorer replays predict_proba with NumPy alone, so services
+score without unpickling scikit-learn (load in ms, small worker memory).
+
+Export + parity check against model.predict_proba:
+
+    python -m propensity.compact --model customer_propensity_model.joblib --out customer_propensity_model.npz --check
+"""
+
+import argparse
+import json
+import sys
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .scoring import OUTPUT_COLS, classify_decisions, priority_send
+
+FORMAT_VERSION = 1
+
+# Cùng ngưỡng với CalibratedClassifierCV: xác suất vượt 1 trong sai số làm tròn → 1
+_PROBA_EPS = 1e-5
+
+
+def export_compact(model: Any, path: str, source_version: Optional[str] = None) -> Dict[str, Any]:
+    """Flatten the fitted pipeline into `path` (.npz, no pickle); returns the metadata written"""
+    import sklearn
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    pre = model.named_steps["preprocess"]
+    clf = model.named_steps["clf"]
+    num_cols: List[str] = []
+    cat_cols: List[str] = []
+    scaler = encoder = None
+    for name, trans, cols in pre.transformers_:
+        if name == "remainder":
+            if trans != "drop":
+                raise ValueError("Compact export needs ColumnTransformer(remainder='drop')")
+            continue
+        step = trans.steps[-1][1] if hasattr(trans, "steps") else trans
+        if isinstance(step, StandardScaler) and scaler is None:
+            scaler, num_cols = step, list(cols)
+        elif isinstance(step, OneHotEncoder) and encoder is None:
+            encoder, cat_cols = step, list(cols)
+        else:
+            raise ValueError(f"Unsupported transformer in compact export: {name} ({type(step).__name__})")
+    if [t[0] for t in pre.transformers_ if t[0] != "remainder"] != ["num", "cat"]:
+        raise ValueError("Compact export expects transformers ordered num → cat")
+    if encoder.drop_idx_ is not None or encoder.handle_unknown != "ignore" or getattr(encoder, "_infrequent_enabled", False):
+        raise ValueError("Compact export supports OneHotEncoder(handle_unknown='ignore') without drop / infrequent categories")
+    if getattr(clf, "method", None) != "isotonic" or len(clf.classes_) != 2:
+        raise ValueError("Compact export supports binary CalibratedClassifierCV(method='isotonic') only")
+
+    n_num = len(num_cols)
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_num)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_num)
+    arrays: Dict[str, np.ndarray] = {
+        "mean": np.asarray(mean, dtype=np.float64),
+        "scale": np.asarray(scale, dtype=np.float64),
+    }
+    coefs, intercepts, bounds = [], [], []
+    for i, cc in enumerate(clf.calibrated_classifiers_):
+        iso = cc.calibrators[0]
+        coefs.append(np.asarray(cc.estimator.coef_, dtype=np.float64).ravel())
+        intercepts.append(float(np.ravel(cc.estimator.intercept_)[0]))
+        bounds.append((float(iso.X_min_), float(iso.X_max_)))
+        arrays[f"iso_x_{i}"] = np.asarray(iso.X_thresholds_, dtype=np.float64)
+        arrays[f"iso_y_{i}"] = np.asarray(iso.y_thresholds_, dtype=np.float64)
+    arrays["coef"] = np.vstack(coefs)
+    arrays["intercept"] = np.asarray(intercepts)
+    arrays["iso_bounds"] = np.asarray(bounds)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "source_version": source_version,
+        "sklearn_version": sklearn.__version__,
+        "feature_columns": list(pre.feature_names_in_),
+        "num_cols": num_cols,
+        "cat_cols": cat_cols,
+        # None là một category hợp lệ (giá trị NULL lúc train) → JSON null
+        "categories": [[(None if c is None else str(c)) for c in cats] for cats in encoder.categories_],
+        "folds": len(clf.calibrated_classifiers_),
+        "classes": [int(c) for c in clf.classes_],
+    }
+    if arrays["coef"].shape[1] != n_num + sum(len(c) for c in meta["categories"]):
+        raise ValueError("LR coefficient count does not match the transformed feature count")
+    arrays["meta"] = np.asarray(json.dumps(meta))
+    np.savez(path, **arrays)
+    return meta
+
+
+def _is_nan(v: Any) -> bool:
+    return isinstance(v, float) and v != v
+
+
+class CompactScorer:
+    """predict_proba of the exported pipeline, NumPy only"""
+
+    def __init__(self, arrays: Mapping[str, np.ndarray]):
+        self.meta: Dict[str, Any] = json.loads(str(arrays["meta"]))
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format: {self.meta.get('format')}")
+        self.version: Optional[str] = self.meta.get("source_version")
+        self.feature_columns: List[str] = list(self.meta["feature_columns"])
+        self.num_cols: List[str] = list(self.meta["num_cols"])
+        self.cat_cols: List[str] = list(self.meta["cat_cols"])
+        self._mean = arrays["mean"]
+        self._scale = arrays["scale"]
+        self._coef_t = np.ascontiguousarray(arrays["coef"].T)
+        self._intercept = arrays["intercept"]
+        self._bounds = arrays["iso_bounds"]
+        self._iso = [(arrays[f"iso_x_{i}"], arrays[f"iso_y_{i}"]) for i in range(int(self.meta["folds"]))]
+        # giá trị → vị trí cột one-hot; giá trị lạ / NaN → toàn 0 (handle_unknown='ignore')
+        self._cat_index: List[Dict[Any, int]] = []
+        offset = len(self.num_cols)
+        for cats in self.meta["categories"]:
+            self._cat_index.append({c: offset + j for j, c in enumerate(cats)})
+            offset += len(cats)
+        self.n_features = offset
+
+    @classmethod
+    def load(cls, path: str) -> "CompactScorer":
+        with np.load(path, allow_pickle=False) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def _design(self, n: int, column) -> np.ndarray:
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        k = len(self.num_cols)
+        for j, c in enumerate(self.num_cols):
+            X[:, j] = column(c)
+        X[:, :k] -= self._mean
+        X[:, :k] /= self._scale
+        for col, index in zip(self.cat_cols, self._cat_index):
+            for i, v in enumerate(column(col, numeric=False)):
+                if _is_nan(v):
+                    continue
+                j = index.get(v if v is None else str(v))
+                if j is not None:
+                    X[i, j] = 1.0
+        return X
+
+    def _proba(self, X: np.ndarray) -> np.ndarray:
+        if np.isnan(X).any():
+            raise ValueError("Input contains NaN in numeric features")
+        z = X @ self._coef_t + self._intercept
+        pos = np.zeros(len(X), dtype=np.float64)
+        for f, (xs, ys) in enumerate(self._iso):
+            lo, hi = self._bounds[f]
+            zf = np.clip(z[:, f], lo, hi)
+            p = np.full(len(X), ys[0]) if len(ys) == 1 else np.interp(zf, xs, ys)
+            p[(p > 1.0) & (p <= 1.0 + _PROBA_EPS)] = 1.0
+            pos += p
+        pos /= len(self._iso)
+        return np.column_stack([1.0 - pos, pos])
+
+    def predict_proba(self, df: pd.DataFrame) -> np.ndarray:
+        """Same as model.predict_proba(df[feature_columns]): (n, 2) array"""
+        missing = [c for c in self.feature_columns if c not in df]
+        if missing:
+            raise KeyError(f"Missing feature columns: {missing}")
+
+        def column(c: str, numeric: bool = True):
+            return pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) if numeric else df[c].tolist()
+
+        return self._proba(self._design(len(df), column))
+
+    def predict_records(self, rows: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """P(class 1) for dict rows (e.g. DB rows) without building a DataFrame"""
+        missing = [c for c in self.feature_columns if rows and c not in rows[0]]
+        if missing:
+            raise KeyError(f"Missing feature columns: {missing}")
+
+        def column(c: str, numeric: bool = True):
+            vals = [r.get(c) for r in rows]
+            return np.array([np.nan if v is None else float(v) for v in vals], dtype=np.float64) if numeric else vals
+
+        return self._proba(self._design(len(rows), column))[:, 1]
+
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """scoring.score_frame without scikit-learn: customer_id, year_month, probability, decision, priority_send"""
+        proba = self.predict_proba(df)[:, 1]
+        return pd.DataFrame({
+            "customer_id": df["customer_id"].astype(int).to_numpy(),
+            "year_month": df["year_month"].astype(str).to_numpy() if "year_month" in df else None,
+            "probability": proba,
+            "decision": classify_decisions(proba),
+            "priority_send": priority_send(df),
+        }, columns=OUTPUT_COLS)
+
+
+@lru_cache(maxsize=4)
+def load_compact(path: str) -> CompactScorer:
+    """CompactScorer loaded once per process"""
+    return CompactScorer.load(path)
+
+
+def sample_frame(model: Any, n: int = 2000, seed: int = 0) -> pd.DataFrame:
+    """Synthetic rows around the scaler's mean/std, incl. unknown / NULL categories (parity check)"""
+    rng = np.random.default_rng(seed)
+    pre = model.named_steps["preprocess"]
+    data: Dict[str, Any] = {}
+    for name, trans, cols in pre.transformers_:
+        if name == "num":
+            sc = trans.steps[-1][1] if hasattr(trans, "steps") else trans
+            data.update({c: rng.normal(sc.mean_[j], 3 * sc.scale_[j], n) for j, c in enumerate(cols)})
+        elif name == "cat":
+            enc = trans.steps[-1][1] if hasattr(trans, "steps") else trans
+            for c, cats in zip(cols, enc.categories_):
+                pool = list(cats) + ["__unknown__", None, np.nan]
+                data[c] = [pool[i] for i in rng.integers(0, len(pool), n)]
+    return pd.DataFrame(data)[list(pre.feature_names_in_)]
+
+
+def parity_check(model: Any, scorer: CompactScorer, df: pd.DataFrame) -> float:
+    """Max |model.predict_proba − scorer.predict_proba| over df"""
+    ref = model.predict_proba(df[scorer.feature_columns])
+    got = scorer.predict_proba(df)
+    return float(np.max(np.abs(ref - got))) if len(df) else 0.0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .scoring import load_model, model_version
+
+    ap = argparse.ArgumentParser(description="Export the propensity model to a NumPy-only .npz scorer")
+    ap.add_argument("--model", default=config.MODEL_FILE)
+    ap.add_argument("--out", default=config.COMPACT_MODEL_FILE)
+    ap.add_argument("--check", action="store_true", help="parity check against model.predict_proba")
+    ap.add_argument("--check-rows", type=int, default=5000)
+    ap.add_argument("--tolerance", type=float, default=1e-9)
+    args = ap.parse_args(argv)
+
+    model = load_model(args.model)
+    meta = export_compact(model, args.out, model_version(args.model))
+    t0 = time.perf_counter()
+    scorer = CompactScorer.load(args.out)
+    load_ms = (time.perf_counter() - t0) * 1000
+    print(f"Exported {args.out}: {len(meta['feature_columns'])} features, {meta['folds']} folds, load {load_ms:.1f} ms", file=sys.stderr)
+    if args.check:
+        diff = parity_check(model, scorer, sample_frame(model, args.check_rows))
+        print(f"Parity vs predict_proba ({args.check_rows} rows): max abs diff {diff:.3e}", file=sys.stderr)
+        if not diff <= args.tolerance:
+            print(f"[Lỗi] Sai lệch vượt tolerance {args.tolerance:g}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
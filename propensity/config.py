@@ -0,0 +1,39 @@
+"""Scoring configuration (env vars, defaults = notebook values)."""
+
+import os
+
+# Postgres (cùng biến môi trường với notebook / cashybear)
+PG_HOST = os.getenv("PG_HOST", "127.0.0.1")
+PG_PORT = int(os.getenv("PG_PORT", "5435"))
+PG_DB = os.getenv("PG_DB", "db_fin")
+PG_USER = os.getenv("PG_USER", "HiepData")
+PG_PASSWORD = os.getenv("PG_PASSWORD", "123456")
+
+MODEL_FILE = os.getenv("PROPENSITY_MODEL_FILE", "customer_propensity_model.joblib")
+# Bản NumPy-only của model (python -m propensity.compact), dùng cho chấm điểm real-time
+COMPACT_MODEL_FILE = os.getenv("PROPENSITY_COMPACT_MODEL_FILE", "customer_propensity_model.npz")
+
+# Ngưỡng quyết định (notebook: Hot ≥ 0.6, Warm ≥ 0.3)
+HOT_THRESHOLD = float(os.getenv("PROPENSITY_HOT_THRESHOLD", "0.6"))
+WARM_THRESHOLD = float(os.getenv("PROPENSITY_WARM_THRESHOLD", "0.3"))
+
+# Timing gate: ưu tiên khi vừa có large inflow hoặc đang mùa lễ
+PRIORITY_SEASONS = ("pre_holiday", "holiday_week")
+
+CHUNK_SIZE = int(os.getenv("PROPENSITY_CHUNK_SIZE", "50000"))
+
+# CashyBear API cần biết khi features/predictions đổi (propensity.notify); cùng biến môi trường với cashybear
+CASHYBEAR_API_BASE = os.getenv("CASHYBEAR_API_BASE", "http://127.0.0.1:8010")
+CASHYBEAR_PROFILE_EPOCH = os.getenv("CASHYBEAR_PROFILE_EPOCH", "cashybear_profiles.epoch")
+
+# LLM explanations (gộp theo decision + dải xác suất + facts, cache SQLite = checkpoint)
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+EXPLAIN_CACHE_DB = os.getenv("PROPENSITY_EXPLAIN_CACHE_DB", "propensity_explanations.db")
+EXPLAIN_CONCURRENCY = int(os.getenv("PROPENSITY_EXPLAIN_CONCURRENCY", "4"))
+EXPLAIN_RATE_PER_SEC = float(os.getenv("PROPENSITY_EXPLAIN_RATE_PER_SEC", "2.0"))
+EXPLAIN_PROB_BAND = float(os.getenv("PROPENSITY_EXPLAIN_PROB_BAND", "0.05"))
+
+
+def pg_url() -> str:
+    return f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
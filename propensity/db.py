@@ -0,0 +1,147 @@
+"""
+Postgres I/O for scoring: streamed features_monthly reads and COPY-based bulk writes.
+
+Upserts stream each chunk through `COPY ... FROM STDIN` (CSV) into a temp staging
+table (session-private, not WAL-logged, dropped at commit) and merge it with one
+INSERT ... SELECT ... ON CONFLICT DO UPDATE, instead of binding rows one by one.
+"""
+
+import io
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import config
+from .scoring import FINGERPRINT_COLS
+
+PREDICTIONS_DDL = """
+CREATE TABLE IF NOT EXISTS predictions (
+  customer_id INT NOT NULL,
+  year_month  VARCHAR(7) NOT NULL,
+  probability NUMERIC(9,6),
+  decision    TEXT,
+  priority_send BOOLEAN,
+  created_at  TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (customer_id, year_month)
+)
+"""
+
+PREDICTIONS_LLM_DDL = """
+CREATE TABLE IF NOT EXISTS predictions_llm_with_facts (
+  customer_id INT NOT NULL,
+  year_month  VARCHAR(7) NOT NULL,
+  probability NUMERIC(9,6),
+  decision    TEXT,
+  facts       TEXT,
+  explanation TEXT,
+  created_at  TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (customer_id, year_month)
+)
+"""
+
+# Fingerprint để chấm lại tăng dần: hash input của model + version file model
+PREDICTIONS_ALTER = [
+    "ALTER TABLE predictions ADD COLUMN IF NOT EXISTS feature_hash BIGINT",
+    "ALTER TABLE predictions ADD COLUMN IF NOT EXISTS model_version TEXT",
+]
+
+PREDICTION_COLS = ["customer_id", "year_month", "probability", "decision", "priority_send"]
+PREDICTION_LLM_COLS = ["customer_id", "year_month", "probability", "decision", "facts", "explanation"]
+PREDICTION_KEYS = ["customer_id", "year_month"]
+
+COPY_CHUNK_ROWS = 100_000
+
+
+def get_engine() -> Engine:
+    return create_engine(config.pg_url(), future=True)
+
+
+def iter_feature_chunks(engine: Engine, chunk_size: int, year_month: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """features_monthly in `chunk_size` frames through a server-side cursor (memory ~ one chunk)"""
+    sql = "SELECT * FROM features_monthly" + (" WHERE year_month = :ym" if year_month else "")
+    params = {"ym": year_month} if year_month else {}
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        for chunk in pd.read_sql(text(sql), conn, params=params, chunksize=chunk_size):
+            yield chunk
+
+
+def ensure_prediction_tables(conn: Connection):
+    conn.exec_driver_sql(PREDICTIONS_DDL)
+    for stmt in PREDICTIONS_ALTER:
+        conn.exec_driver_sql(stmt)
+
+
+def fetch_fingerprints(engine: Engine, customer_ids: Iterable[int], year_month: Optional[str] = None) -> pd.DataFrame:
+    """Stored (customer_id, year_month, feature_hash, model_version) of these customers (one chunk, PK lookups)"""
+    sql = (
+        "SELECT customer_id, year_month, feature_hash, model_version FROM predictions "
+        "WHERE customer_id = ANY(:cids) AND feature_hash IS NOT NULL"
+    )
+    params: Dict[str, Any] = {"cids": sorted({int(c) for c in customer_ids})}
+    if year_month:
+        sql += " AND year_month = :ym"
+        params["ym"] = year_month
+    if not params["cids"]:
+        return pd.DataFrame({"customer_id": [], "year_month": [], "feature_hash": pd.array([], dtype="Int64"), "model_version": []})
+    with engine.connect() as conn:
+        df = pd.read_sql(text(sql), conn, params=params)
+    return df.astype({"feature_hash": "Int64"})
+
+
+def _copy_frame(conn: Connection, table: str, df: pd.DataFrame, columns: Sequence[str]):
+    """COPY df[columns] into table over the connection's psycopg2 cursor (NaN/None → NULL)"""
+    buf = io.StringIO()
+    df.to_csv(buf, columns=list(columns), header=False, index=False, na_rep="\\N")
+    buf.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+
+
+def copy_insert(conn: Connection, table: str, df: pd.DataFrame, columns: Optional[Sequence[str]] = None, chunk_rows: int = COPY_CHUNK_ROWS) -> int:
+    """Append-only bulk insert (model_metrics, calibration_bins) via COPY, chunked"""
+    columns = list(columns or df.columns)
+    for start in range(0, len(df), chunk_rows):
+        _copy_frame(conn, table, df.iloc[start:start + chunk_rows], columns)
+    return len(df)
+
+
+def copy_upsert(
+    conn: Connection,
+    table: str,
+    df: pd.DataFrame,
+    keys: Sequence[str],
+    columns: Optional[Sequence[str]] = None,
+    chunk_rows: int = COPY_CHUNK_ROWS,
+    touch_created_at: bool = True,
+) -> int:
+    """COPY → temp staging table → INSERT ... SELECT ... ON CONFLICT (keys) DO UPDATE, chunk by chunk"""
+    columns = list(columns or df.columns)
+    updates: List[str] = [f"{c} = EXCLUDED.{c}" for c in columns if c not in keys]
+    if touch_created_at:
+        updates.append("created_at = now()")
+    stg = f"_stg_{table}"
+    conn.exec_driver_sql(f"CREATE TEMP TABLE IF NOT EXISTS {stg} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    merge = (
+        f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {stg} "
+        f"ON CONFLICT ({', '.join(keys)}) "
+        + (f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING")
+    )
+    for start in range(0, len(df), chunk_rows):
+        # ON CONFLICT không cho cập nhật 1 key 2 lần trong cùng câu → giữ dòng cuối như executemany
+        part = df.iloc[start:start + chunk_rows].drop_duplicates(subset=list(keys), keep="last")
+        conn.exec_driver_sql(f"TRUNCATE {stg}")
+        _copy_frame(conn, stg, part, columns)
+        conn.exec_driver_sql(merge)
+    return len(df)
+
+
+def upsert_predictions(conn: Connection, scored: pd.DataFrame) -> int:
+    cols = PREDICTION_COLS + [c for c in FINGERPRINT_COLS if c in scored.columns]
+    return copy_upsert(conn, "predictions", scored.astype({"probability": float, "priority_send": bool}), PREDICTION_KEYS, cols)
+
+
+def upsert_predictions_llm(conn: Connection, df: pd.DataFrame) -> int:
+    return copy_upsert(conn, "predictions_llm_with_facts", df.astype({"probability": float}), PREDICTION_KEYS, PREDICTION_LLM_COLS)
@@ -0,0 +1,321 @@
+"""
+LLM explanations for scored customers, deduplicated by fact signature.
+
+Customers sharing (decision, probability band, sorted facts) get the same
+explanation, so a run costs one model call per unique signature, not per
+customer. Results live in a SQLite cache that doubles as the checkpoint: each
+explanation is committed as soon as it returns, and a re-run (after a crash,
+quota error or Ctrl-C) only calls the model for signatures still missing.
+Calls go through a bounded thread pool behind a token-bucket rate limiter.
+
+    python -m propensity.explain --in predictions_facts.csv --out predictions_llm_with_facts.csv [--stub]
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+from . import config
+from .facts import FACT_FALLBACK
+
+NO_LLM_FALLBACK = "Tôi không có quyền truy cập thông tin đó."
+
+Signature = Tuple[str, float, Tuple[str, ...]]
+ExplainModel = Callable[[str], str]  # prompt -> text
+
+DDL = """
+CREATE TABLE IF NOT EXISTS explanations (
+    key TEXT PRIMARY KEY,
+    decision TEXT NOT NULL,
+    prob_band REAL NOT NULL,
+    facts TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    model TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def signature(decision: str, probability: float, facts: Iterable[str], band: float = config.EXPLAIN_PROB_BAND) -> Signature:
+    """Canonical dedup key: (decision, probability rounded to band, sorted unique facts)"""
+    clean = sorted({f.strip() for f in (facts or []) if isinstance(f, str) and f.strip()})
+    p = round(round(float(probability) / band) * band, 4) if band > 0 else round(float(probability), 4)
+    return str(decision), p, tuple(clean)
+
+
+def signature_key(sig: Signature) -> str:
+    raw = json.dumps(list(sig), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def build_prompt(sig: Signature) -> Optional[str]:
+    """Prompt của notebook (≤ 2 câu, chỉ dùng facts); None khi không đủ facts"""
+    decision, probability, facts = sig
+    facts = [f for f in facts if f != FACT_FALLBACK]
+    if not facts:
+        return None
+    return (
+        "Chỉ dùng các facts sau để giải thích ngắn gọn (≤ 2 câu), không thêm thông tin mới.\n"
+        f"- Quyết định: {decision}\n"
+        f"- Xác suất: {probability:.2f}\n"
+        "Facts:\n- " + "\n- ".join(facts)
+    )
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` calls/second on average, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait_secs = (1.0 - self._tokens) / self.rate
+            time.sleep(wait_secs)
+
+
+class ExplanationStore:
+    """SQLite cache of explanations by signature key (also the run checkpoint)"""
+
+    def __init__(self, db_path: str = config.EXPLAIN_CACHE_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(DDL)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = list(keys[i:i + 500])
+                q = f"SELECT key, explanation FROM explanations WHERE key IN ({','.join('?' * len(part))})"
+                out.update(self._db.execute(q, part).fetchall())
+        return out
+
+    def put(self, key: str, sig: Signature, explanation: str, model: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO explanations(key, decision, prob_band, facts, explanation, model, created_at) VALUES (?,?,?,?,?,?,?)",
+                (key, sig[0], sig[1], json.dumps(list(sig[2]), ensure_ascii=False), explanation, model, time.time()),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def stub_model(prompt: str) -> str:
+    """Offline model for tests/dry runs: deterministic text built from the prompt's facts"""
+    lines = prompt.splitlines()
+    decision = next((l.split(":", 1)[1].strip() for l in lines if l.startswith("- Quyết định:")), "")
+    facts = [l[2:] for l in lines[lines.index("Facts:") + 1:]] if "Facts:" in lines else []
+    return f"[stub] {decision}: " + "; ".join(facts)
+
+
+def gemini_model(model_name: str = config.GEMINI_MODEL, api_key: str = config.GEMINI_API_KEY, retries: int = 4) -> Optional[ExplainModel]:
+    """Gemini generate_content wrapped with the notebook's 429 retry/backoff; None if not configured"""
+    try:
+        import google.generativeai as genai
+    except Exception:
+        return None
+    if not api_key:
+        return None
+    genai.configure(api_key=api_key)
+    mdl = genai.GenerativeModel(model_name=model_name, generation_config={"temperature": 0.2, "max_output_tokens": 128})
+
+    def generate(prompt: str) -> str:
+        for attempt in range(retries):
+            try:
+                resp = mdl.generate_content(prompt)
+                return (getattr(resp, "text", "") or "").strip()
+            except Exception as e:
+                if "429" in str(e) and attempt < retries - 1:
+                    time.sleep(1.5 * (attempt + 1))
+                    continue
+                raise
+        return ""
+
+    generate.model_name = model_name  # type: ignore[attr-defined]
+    return generate
+
+
+class ExplanationPipeline:
+    """Dedup → cache lookup → rate-limited concurrent model calls for the missing signatures"""
+
+    def __init__(
+        self,
+        model: Optional[ExplainModel],
+        store: Optional[ExplanationStore] = None,
+        concurrency: int = config.EXPLAIN_CONCURRENCY,
+        rate_per_sec: float = config.EXPLAIN_RATE_PER_SEC,
+        band: float = config.EXPLAIN_PROB_BAND,
+        progress_every: int = 50,
+        max_consecutive_failures: int = 10,
+    ):
+        self.model = model
+        self.model_name = getattr(model, "model_name", getattr(model, "__name__", None))
+        self.store = store if store is not None else ExplanationStore()
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = TokenBucket(rate_per_sec, burst=self.concurrency)
+        self.band = band
+        self.progress_every = progress_every
+        self.max_consecutive_failures = max_consecutive_failures
+        self.stats: Dict[str, int] = {}
+        # theo từng dòng của lần explain() gần nhất: True = lỗi/bỏ qua/không có LLM (không cache, lần sau gọi lại)
+        self.row_failed: List[bool] = []
+        self._failed_keys: Set[str] = set()
+
+    def explain(self, decisions: Sequence[str], probabilities: Sequence[float], facts: Sequence[Sequence[str]]) -> List[str]:
+        """One explanation per input row (same order)"""
+        sigs = [signature(d, p, f, self.band) for d, p, f in zip(decisions, probabilities, facts)]
+        keys = [signature_key(s) for s in sigs]
+        unique: Dict[str, Signature] = dict(zip(keys, sigs))
+
+        results: Dict[str, str] = {}
+        self._failed_keys.clear()
+        todo: List[Tuple[str, Signature, str]] = []
+        for key, sig in unique.items():
+            prompt = build_prompt(sig)
+            if prompt is None:
+                results[key] = FACT_FALLBACK
+            elif self.model is None:
+                results[key] = NO_LLM_FALLBACK
+                self._failed_keys.add(key)
+            else:
+                todo.append((key, sig, prompt))
+
+        cached = self.store.get_many([k for k, _, _ in todo])
+        results.update(cached)
+        todo = [t for t in todo if t[0] not in cached]
+        self.stats = {"rows": len(sigs), "unique": len(unique), "cached": len(cached), "called": 0, "failed": 0, "skipped": 0}
+        print(f"Explain: {len(sigs)} rows → {len(unique)} unique signatures, {len(cached)} cached, {len(todo)} to call")
+
+        if todo:
+            results.update(self._call_all(todo))
+        self.row_failed = [k in self._failed_keys for k in keys]
+        return [results[k] for k in keys]
+
+    # ---------- internals ----------
+
+    def _call_one(self, key: str, sig: Signature, prompt: str) -> str:
+        self.limiter.acquire()
+        text = (self.model(prompt) or "").strip()  # type: ignore[misc]
+        if not text:
+            raise ValueError("empty model response")
+        self.store.put(key, sig, text, self.model_name)  # checkpoint ngay khi có kết quả
+        return text
+
+    def _call_all(self, todo: List[Tuple[str, Signature, str]]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        t0 = time.perf_counter()
+        pending = iter(todo)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="explain") as pool:
+            inflight: Dict[Future, str] = {}
+
+            def submit_next() -> bool:
+                item = next(pending, None)
+                if item is None:
+                    return False
+                inflight[pool.submit(self._call_one, *item)] = item[0]
+                return True
+
+            # giữ tối đa 2×concurrency việc trong hàng đợi, không submit cả danh sách
+            for _ in range(2 * self.concurrency):
+                if not submit_next():
+                    break
+            done_n = 0
+            streak = 0
+            while inflight:
+                done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key = inflight.pop(fut)
+                    try:
+                        out[key] = fut.result()
+                        self.stats["called"] += 1
+                        streak = 0
+                    except Exception as e:
+                        # không cache lỗi → lần chạy sau sẽ thử lại signature này
+                        print("[Cảnh báo] Explain lỗi:", e)
+                        out[key] = FACT_FALLBACK
+                        self._failed_keys.add(key)
+                        self.stats["failed"] += 1
+                        streak += 1
+                    done_n += 1
+                    if self.progress_every and done_n % self.progress_every == 0:
+                        print(f"  explained {done_n}/{len(todo)} ({done_n / max(time.perf_counter() - t0, 1e-9):.1f}/s)", flush=True)
+                    if not (self.max_consecutive_failures and streak >= self.max_consecutive_failures):
+                        submit_next()
+        # Lỗi liên tiếp (hết quota, mất mạng) → dừng sớm; phần còn lại chạy tiếp ở lần sau từ cache
+        for key, _, _ in pending:
+            out[key] = FACT_FALLBACK
+            self._failed_keys.add(key)
+            self.stats["skipped"] += 1
+        if self.stats["skipped"]:
+            print(f"[Cảnh báo] Dừng sau {streak} lỗi liên tiếp, bỏ qua {self.stats['skipped']} signature (chạy lại để tiếp tục)")
+        return out
+
+
+def _split_facts(v: Any) -> List[str]:
+    if isinstance(v, (list, tuple)):
+        return [str(x) for x in v]
+    if not isinstance(v, str) or not v.strip():
+        return []
+    return [f.strip() for f in v.split(";") if f.strip()]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="propensity.explain", description="Deduplicated, rate-limited LLM explanations")
+    ap.add_argument("--in", dest="inp", required=True, help="CSV/JSONL có customer_id, probability, decision, facts ('; ')")
+    ap.add_argument("--out", required=True, help="CSV đầu ra (thêm cột explanation)")
+    ap.add_argument("--cache", default=config.EXPLAIN_CACHE_DB)
+    ap.add_argument("--concurrency", type=int, default=config.EXPLAIN_CONCURRENCY)
+    ap.add_argument("--rate", type=float, default=config.EXPLAIN_RATE_PER_SEC, help="số request/giây tối đa")
+    ap.add_argument("--band", type=float, default=config.EXPLAIN_PROB_BAND, help="độ rộng dải xác suất khi gộp")
+    ap.add_argument("--stub", action="store_true", help="dùng stub model cục bộ (không gọi Gemini)")
+    args = ap.parse_args()
+
+    df = pd.read_json(args.inp, lines=True) if args.inp.endswith(".jsonl") else pd.read_csv(args.inp)
+    model = stub_model if args.stub else gemini_model()
+    if model is None:
+        print("[Cảnh báo] Gemini chưa cấu hình (thiếu package hoặc GEMINI_API_KEY) → dùng câu fallback")
+
+    store = ExplanationStore(args.cache)
+    try:
+        pipe = ExplanationPipeline(model, store, args.concurrency, args.rate, args.band)
+        t0 = time.perf_counter()
+        df["explanation"] = pipe.explain(df["decision"].astype(str).tolist(), df["probability"].astype(float).tolist(), [_split_facts(v) for v in df["facts"]])
+    finally:
+        store.close()
+    df.to_csv(args.out, index=False)
+    print(f"✅ Done in {time.perf_counter() - t0:.1f}s: " + ", ".join(f"{k}={v}" for k, v in pipe.stats.items()) + f" → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Top-k factor → fact extraction from a surrogate linear model (batch, vectorized).
+
+Contribution of feature j for customer i is w_j · x_ij in the preprocessed space
+(ColumnTransformer của pipeline chính). FactExtractor transforms the whole frame
+once, takes the k largest |w·x| per row with argpartition and maps feature
+indices to pos/neg sentences precomputed from FACT_CATALOG.
+"""
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+FACT_FALLBACK = "Tôi không thể xác minh điều này."
+
+# Mỗi feature có 2 câu: khi đóng góp dương (+) và khi đóng góp âm (-)
+# Quy ước: nếu contribution = (w * x) >= 0 ⇒ dùng 'pos'; ngược lại dùng 'neg'.
+FACT_CATALOG = {
+    # tài chính cốt lõi
+    "surplus": {
+        "pos": "Dư thặng cao hỗ trợ khả năng chi trả",
+        "neg": "Dư thặng thấp làm hạn chế khả năng chi trả"
+    },
+    "spend_ratio": {  # spend / income — thấp thì tốt
+        "pos": "Tỷ lệ chi tiêu/thu nhập thấp cho thấy kỷ luật chi tiêu",
+        "neg": "Tỷ lệ chi tiêu/thu nhập cao làm giảm dư địa tài chính"
+    },
+    "dti": {  # loan / income — thấp thì tốt
+        "pos": "DTI thấp (nợ/thu nhập) phản ánh rủi ro trả nợ thấp",
+        "neg": "DTI cao (nợ/thu nhập) làm tăng rủi ro tài chính"
+    },
+    "balance_ratio": {
+        "pos": "Tỷ lệ số dư/thu nhập tốt",
+        "neg": "Tỷ lệ số dư/thu nhập yếu"
+    },
+    "cashflow_volatility": {  # thấp thì tốt
+        "pos": "Biến động dòng tiền thấp, ổn định",
+        "neg": "Biến động dòng tiền cao, thiếu ổn định"
+    },
+    "failed_payments_90d": {  # thấp thì tốt
+        "pos": "Ít giao dịch thất bại trong 90 ngày qua",
+        "neg": "Nhiều giao dịch thất bại trong 90 ngày qua"
+    },
+    "liquidity_buffer": {
+        "pos": "Đệm thanh khoản tốt",
+        "neg": "Đệm thanh khoản mỏng"
+    },
+    "balance_trend_90d": {
+        "pos": "Xu hướng số dư 3 tháng gần đây tích cực",
+        "neg": "Xu hướng số dư 3 tháng gần đây suy giảm"
+    },
+
+    # hành vi giao dịch / digital
+    "digital_index": {
+        "pos": "Mức độ tương tác kênh số cao",
+        "neg": "Mức độ tương tác kênh số thấp"
+    },
+    "digital_logins_30d": {
+        "pos": "Tần suất đăng nhập ứng dụng ngân hàng số cao",
+        "neg": "Tần suất đăng nhập ứng dụng ngân hàng số thấp"
+    },
+    "incoming_tx_cnt_30d": {
+        "pos": "Nhiều giao dịch tiền vào gần đây",
+        "neg": "Ít giao dịch tiền vào gần đây"
+    },
+    "outgoing_tx_cnt_30d": {
+        "pos": "Hoạt động chi tiêu sôi động gần đây",
+        "neg": "Hoạt động chi tiêu trầm gần đây"
+    },
+
+    # tín hiệu thời điểm
+    "large_inflow_flag_7d": {
+        "pos": "Vừa có khoản tiền vào lớn trong 7 ngày",
+        "neg": "Gần đây không có khoản tiền vào lớn"
+    },
+    "max_inflow_z_30d": {
+        "pos": "Có giao dịch tiền vào lớn bất thường gần đây",
+        "neg": "Không có giao dịch tiền vào nổi bật gần đây"
+    },
+    "max_inflow_pct_30d": {
+        "pos": "Tỷ lệ khoản tiền vào lớn so với trung bình cao",
+        "neg": "Tỷ lệ khoản tiền vào lớn so với trung bình thấp"
+    },
+    "inflow_baseline_90d": {
+        "pos": "Nền tiền vào 90 ngày tốt",
+        "neg": "Nền tiền vào 90 ngày yếu"
+    },
+
+    # season one-hot (categorical)
+    "season_flag_pre_holiday": {
+        "pos": "Đang cận kỳ nghỉ lễ (nhu cầu tăng)",
+        "neg": "Không cận kỳ nghỉ lễ"
+    },
+    "season_flag_holiday_week": {
+        "pos": "Đang trong tuần nghỉ lễ (nhu cầu tăng)",
+        "neg": "Không trong tuần nghỉ lễ"
+    },
+
+    # ví dụ thêm (tuỳ schema bạn có)
+    "spend_travel": {
+        "pos": "Chi tiêu cho du lịch gần đây đáng kể",
+        "neg": "Chi tiêu cho du lịch gần đây hạn chế"
+    },
+}
+
+
+def normalize_feat_name(name: str) -> str:
+    """Bỏ prefix 'num__'/'cat__' của ColumnTransformer để tra FACT_CATALOG"""
+    if "__" in name:
+        return name.split("__", 1)[1]
+    return name
+
+
+class FactExtractor:
+    """Batch top-k |w·x| factors + facts; pos/neg sentences resolved per feature index once"""
+
+    def __init__(self, preprocess: Any, coef: Sequence[float], feat_names: Optional[Sequence[str]] = None, catalog: Optional[dict] = None):
+        self.preprocess = preprocess
+        self.coef = np.asarray(coef, dtype=float).ravel()
+        names = feat_names if feat_names is not None else preprocess.get_feature_names_out()
+        self.feat_names = np.asarray(list(names), dtype=object)
+        if len(self.feat_names) != len(self.coef):
+            raise ValueError(f"coef has {len(self.coef)} entries, preprocess yields {len(self.feat_names)} features")
+        catalog = FACT_CATALOG if catalog is None else catalog
+        entries = [catalog.get(normalize_feat_name(n)) or {} for n in self.feat_names]
+        self.pos_facts = np.array([e.get("pos") for e in entries], dtype=object)
+        self.neg_facts = np.array([e.get("neg") for e in entries], dtype=object)
+        # id câu fact cho từng feature (-1 = không có trong catalog) để loại trùng bằng NumPy
+        texts = list(dict.fromkeys(f for f in np.concatenate([self.pos_facts, self.neg_facts]) if f))
+        ids = {t: i for i, t in enumerate(texts)}
+        self._fact_texts = np.array(texts + [None], dtype=object)
+        self._pos_ids = np.array([ids.get(f, -1) for f in self.pos_facts], dtype=np.int64)
+        self._neg_ids = np.array([ids.get(f, -1) for f in self.neg_facts], dtype=np.int64)
+
+    @classmethod
+    def from_surrogate(cls, preprocess: Any, surrogate: Any, catalog: Optional[dict] = None) -> "FactExtractor":
+        """From a fitted LogisticRegression trained on preprocess.transform(X)"""
+        return cls(preprocess, surrogate.coef_.ravel(), catalog=catalog)
+
+    def contributions(self, X_raw: pd.DataFrame) -> np.ndarray:
+        """(n_rows, n_features) matrix of w·x, one transform for the whole frame"""
+        Xt = np.asarray(self.preprocess.transform(X_raw), dtype=float)
+        return Xt * self.coef
+
+    def top_k(self, X_raw: pd.DataFrame, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """(idx, contrib), both (n_rows, k), ordered by |w·x| descending within each row"""
+        contrib = self.contributions(X_raw)
+        k = max(1, min(int(k), contrib.shape[1]))
+        mag = np.abs(contrib)
+        idx = np.argpartition(-mag, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(mag, idx, axis=1), axis=1, kind="stable")
+        idx = np.take_along_axis(idx, order, axis=1)
+        return idx, np.take_along_axis(contrib, idx, axis=1)
+
+    def facts_matrix(self, X_raw: pd.DataFrame, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """(idx, facts) with facts an (n_rows, k) object array; None where the feature has no catalog entry"""
+        idx, top = self.top_k(X_raw, k)
+        return idx, np.where(top >= 0, self.pos_facts[idx], self.neg_facts[idx])
+
+    def explain(self, X_raw: pd.DataFrame, k: int = 3) -> Tuple[List[List[str]], List[List[str]]]:
+        """(top_feature_names, facts) per row, same output as the notebook's top_factors_and_facts"""
+        idx, top = self.top_k(X_raw, k)
+        ids = np.where(top >= 0, self._pos_ids[idx], self._neg_ids[idx])
+        facts = self._fact_texts[ids].tolist()  # id -1 → None (phần tử cuối)
+        # Chỉ các dòng thiếu fact hoặc trùng câu mới cần xử lý bằng Python
+        srt = np.sort(ids, axis=1)
+        irregular = (srt[:, 0] < 0) | (np.diff(srt, axis=1) == 0).any(axis=1)
+        for i in np.flatnonzero(irregular).tolist():
+            facts[i] = list(dict.fromkeys(f for f in facts[i] if f)) or [FACT_FALLBACK]
+        return self.feat_names[idx].tolist(), facts
+
+    def facts_joined(self, X_raw: pd.DataFrame, k: int = 3, sep: str = "; ") -> List[str]:
+        """facts per row joined into one string (cột `facts` của predictions_llm_with_facts)"""
+        return [sep.join(f) for f in self.explain(X_raw, k)[1]]
@@ -0,0 +1,53 @@
+"""
+Tell a running CashyBear API that features / predictions were reloaded.
+
+After features_monthly is (re)loaded and scored, the API's per-worker profile
+cache must be dropped (POST /profiles/invalidate bumps the shared epoch file,
+so every worker on the host clears) and the offer index re-read
+(POST /signals/refresh). Best-effort: when the API is unreachable and the epoch
+file is local, it is touched directly so workers still clear on their next read.
+"""
+
+import json
+import os
+import urllib.request
+from typing import Dict, Optional
+
+from . import config
+
+
+def _post(path: str, payload: Dict, timeout: float) -> None:
+    req = urllib.request.Request(
+        f"{config.CASHYBEAR_API_BASE.rstrip('/')}{path}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"content-type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=timeout):
+        pass
+
+
+def bump_profile_epoch(path: Optional[str] = None) -> bool:
+    """Touch the API's profile epoch file (same host only); False when there is no such file"""
+    path = path or config.CASHYBEAR_PROFILE_EPOCH
+    if not path or not os.path.exists(path):
+        return False
+    os.utime(path, None)
+    return True
+
+
+def notify_features_reloaded(customer_id: Optional[int] = None, refresh_signals: bool = True, timeout: float = 5.0) -> Dict[str, bool]:
+    """Invalidate cached profiles (one customer or all) and refresh offer signals; never raises"""
+    out = {"profiles": False, "signals": False}
+    try:
+        _post("/profiles/invalidate", {} if customer_id is None else {"customerId": int(customer_id)}, timeout)
+        out["profiles"] = True
+    except Exception as e:
+        out["profiles"] = bump_profile_epoch()
+        print("ℹ️ Không báo được CashyBear /profiles/invalidate:", e, "(đã bump epoch file)" if out["profiles"] else "")
+    if refresh_signals:
+        try:
+            _post("/signals/refresh", {}, timeout)
+            out["signals"] = True
+        except Exception as e:
+            print("ℹ️ Không báo được CashyBear /signals/refresh:", e)
+    return out
@@ -0,0 +1,108 @@
+"""Vectorized scoring: predict_proba per frame, Hot/Warm/Cold decision and priority_send gate."""
+
+import hashlib
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import config
+
+ID_COLS = ["customer_id", "year_month"]
+OUTPUT_COLS = ["customer_id", "year_month", "probability", "decision", "priority_send"]
+FINGERPRINT_COLS = ["feature_hash", "model_version"]
+
+
+@lru_cache(maxsize=4)
+def load_model(path: str = config.MODEL_FILE) -> Any:
+    """Fitted sklearn Pipeline (preprocess + calibrated LR), loaded once per process"""
+    return joblib.load(path)
+
+
+def feature_columns(model: Any) -> List[str]:
+    """Input columns the fitted pipeline expects, in training order"""
+    return list(model.named_steps["preprocess"].feature_names_in_)
+
+
+@lru_cache(maxsize=4)
+def model_version(path: str = config.MODEL_FILE) -> str:
+    """Content hash of the model artifact (đổi khi train lại / thay file .joblib)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def feature_fingerprints(model: Any, df: pd.DataFrame) -> np.ndarray:
+    """int64 hash per row of the model input columns (NUM_COLS + CAT_COLS), dtype-normalized"""
+    pre = model.named_steps["preprocess"]
+    cat_cols = {c for name, _, cols in pre.transformers_ if name == "cat" for c in cols}
+    X = pd.DataFrame({
+        c: (df[c].astype(str) if c in cat_cols else pd.to_numeric(df[c], errors="coerce").astype("float64"))
+        for c in feature_columns(model)
+    })
+    return pd.util.hash_pandas_object(X, index=False).to_numpy().view(np.int64)
+
+
+def classify_decision(p: float) -> str:
+    if p >= config.HOT_THRESHOLD:
+        return "Hot"
+    if p >= config.WARM_THRESHOLD:
+        return "Warm"
+    return "Cold"
+
+
+def classify_decisions(p: np.ndarray) -> np.ndarray:
+    """classify_decision over an array"""
+    p = np.asarray(p, dtype=float)
+    return np.select([p >= config.HOT_THRESHOLD, p >= config.WARM_THRESHOLD], ["Hot", "Warm"], default="Cold")
+
+
+def priority_send(df: pd.DataFrame) -> np.ndarray:
+    """Timing gate: large_inflow_flag_7d == 1 or season_flag in PRIORITY_SEASONS"""
+    inflow = df["large_inflow_flag_7d"].to_numpy() == 1 if "large_inflow_flag_7d" in df else np.zeros(len(df), dtype=bool)
+    season = df["season_flag"].isin(config.PRIORITY_SEASONS).to_numpy() if "season_flag" in df else np.zeros(len(df), dtype=bool)
+    return inflow | season
+
+
+def score_frame(model: Any, df: pd.DataFrame, version: Optional[str] = None, hashes: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """features_monthly rows → customer_id, year_month, probability, decision, priority_send
+    (+ feature_hash, model_version when `version` is given, for incremental rescoring;
+    `hashes` = feature_fingerprints already computed for df, e.g. by changed_mask's caller)"""
+    X = df[feature_columns(model)]
+    proba = model.predict_proba(X)[:, 1]
+    out = pd.DataFrame({
+        "customer_id": df["customer_id"].astype(int).to_numpy(),
+        "year_month": df["year_month"].astype(str).to_numpy() if "year_month" in df else None,
+        "probability": proba,
+        "decision": classify_decisions(proba),
+        "priority_send": priority_send(df),
+    }, columns=OUTPUT_COLS)
+    if version is not None:
+        out["feature_hash"] = feature_fingerprints(model, df) if hashes is None else np.asarray(hashes, dtype=np.int64)
+        out["model_version"] = version
+    return out
+
+
+def changed_mask(df: pd.DataFrame, hashes: np.ndarray, version: str, stored: pd.DataFrame) -> np.ndarray:
+    """True where (customer_id, year_month) has no stored fingerprint, or its feature_hash/model_version differ.
+
+    `stored` should hold only df's customers (fetch_fingerprints per chunk): it is indexed once and
+    looked up by key, so the cost is O(len(df) + len(stored))."""
+    keys = pd.MultiIndex.from_arrays(
+        [df["customer_id"].astype(int).to_numpy(), df["year_month"].astype(str).to_numpy()],
+        names=["customer_id", "year_month"],
+    )
+    # Int64 (nullable) để hash 64-bit không bị ép sang float khi có key không tìm thấy
+    old = (
+        stored.astype({"customer_id": int, "year_month": str, "feature_hash": "Int64"})
+        .drop_duplicates(["customer_id", "year_month"], keep="last")
+        .set_index(["customer_id", "year_month"])
+        .reindex(keys)
+    )
+    same_hash = (old["feature_hash"].array == pd.array(hashes, dtype="Int64")).fillna(False)
+    same = same_hash.to_numpy(dtype=bool) & (old["model_version"].to_numpy() == version)
+    return ~same
@@ -0,0 +1,15 @@
+"""Prometheus-format metrics + per-request stage tracing shared by CashyBear and the Zalo bridge."""
+
+from .metrics import CONTENT_TYPE, CallbackMetric, Counter, Histogram, Registry
+from .tracing import Trace, TraceMiddleware, Tracer
+
+__all__ = [
+    "CONTENT_TYPE",
+    "CallbackMetric",
+    "Counter",
+    "Histogram",
+    "Registry",
+    "Trace",
+    "TraceMiddleware",
+    "Tracer",
+]
@@ -0,0 +1,176 @@
+"""
+Per-request stage timing: one Trace per HTTP request (or background job),
+spans for the slow stages inside it, tags for correlation (session_id, chat_id).
+
+Every span also feeds `<service>_stage_seconds{stage}`; finished traces go to a
+ring buffer that `/debug/slow` sorts by duration. The current trace lives in a
+ContextVar, so it follows the request into run_in_threadpool and sync
+generators iterated by StreamingResponse.
+"""
+
+import contextvars
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .metrics import Registry
+
+_CURRENT: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("telemetry_trace", default=None)
+_IDS = itertools.count(1)
+
+
+class Trace:
+    __slots__ = ("id", "name", "started_at", "t0", "duration", "status", "tags", "spans", "_depth")
+
+    def __init__(self, name: str, tags: Optional[Dict[str, Any]] = None):
+        self.id = next(_IDS)
+        self.name = name
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+        self.tags: Dict[str, Any] = dict(tags or {})
+        self.spans: List[Dict[str, Any]] = []  # list.append là atomic → span từ thread khác vẫn an toàn
+        self._depth = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        total = self.duration if self.duration is not None else time.perf_counter() - self.t0
+        by_stage: Dict[str, float] = {}
+        top_level = 0.0
+        for s in self.spans:
+            by_stage[s["stage"]] = by_stage.get(s["stage"], 0.0) + s["duration_ms"]
+            if s["depth"] == 0:
+                top_level += s["duration_ms"]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duration_ms": round(total * 1000, 2),
+            "tags": self.tags,
+            "by_stage_ms": {k: round(v, 2) for k, v in sorted(by_stage.items(), key=lambda kv: -kv[1])},
+            "untracked_ms": round(max(total * 1000 - top_level, 0.0), 2),
+            "spans": self.spans,
+        }
+
+
+class Tracer:
+    """Stage spans + request histograms for one service; finished traces kept in a ring buffer"""
+
+    def __init__(self, service: str, registry: Registry, keep: int = 500):
+        self.service = service
+        self.stage_seconds = registry.histogram(f"{service}_stage_seconds", "Time spent per stage (profile load, LLM, DB, outbound HTTP)", ["stage"])
+        self.stage_errors = registry.counter(f"{service}_stage_errors_total", "Stages that raised", ["stage"])
+        self.request_seconds = registry.histogram(f"{service}_request_seconds", "HTTP request latency", ["route", "method", "status"])
+        self._recent: Deque[Trace] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def current() -> Optional[Trace]:
+        return _CURRENT.get()
+
+    def tag(self, **tags: Any):
+        """Gắn tag (session_id, chat_id, customer_id...) vào trace hiện tại"""
+        tr = _CURRENT.get()
+        if tr is not None:
+            tr.tags.update({k: v for k, v in tags.items() if v is not None})
+
+    @contextmanager
+    def span(self, stage: str, **tags: Any) -> Iterator[None]:
+        """Time one stage; recorded in the histogram even outside a trace"""
+        tr = _CURRENT.get()
+        depth = 0
+        if tr is not None:
+            depth = tr._depth
+            tr._depth += 1
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            self.stage_seconds.observe(dt, stage=stage)
+            if error is not None and error != "GeneratorExit":
+                self.stage_errors.inc(stage=stage)
+            if tr is not None:
+                tr._depth = depth
+                rec: Dict[str, Any] = {"stage": stage, "offset_ms": round((t0 - tr.t0) * 1000, 2), "duration_ms": round(dt * 1000, 2), "depth": depth}
+                if tags:
+                    rec["tags"] = tags
+                if error is not None:
+                    rec["error"] = error
+                tr.spans.append(rec)
+
+    @contextmanager
+    def trace(self, name: str, **tags: Any) -> Iterator[Trace]:
+        """Root trace cho job nền (send queue, ...); nếu đã có trace thì chỉ là một span trong đó"""
+        parent = _CURRENT.get()
+        if parent is not None:
+            self.tag(**tags)
+            with self.span(name):
+                yield parent
+            return
+        tr = Trace(name, {k: v for k, v in tags.items() if v is not None})
+        token = _CURRENT.set(tr)
+        try:
+            with self.span(name):
+                yield tr
+        finally:
+            _CURRENT.reset(token)
+            self.finish(tr)
+
+    def start(self, name: str) -> Trace:
+        return Trace(name)
+
+    def finish(self, tr: Trace, status: Optional[int] = None):
+        tr.duration = time.perf_counter() - tr.t0
+        tr.status = status
+        with self._lock:
+            self._recent.append(tr)
+
+    def slowest(self, limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Slowest traces among the last `keep` finished ones, with stage breakdown"""
+        with self._lock:
+            traces = [t for t in self._recent if name is None or name in t.name]
+        traces.sort(key=lambda t: t.duration or 0.0, reverse=True)
+        return [t.as_dict() for t in traces[: max(int(limit), 0)]]
+
+
+class TraceMiddleware:
+    """Pure ASGI middleware: one trace per HTTP request, labelled by route template"""
+
+    def __init__(self, app, tracer: Tracer, skip_paths=("/metrics", "/debug/slow", "/health")):
+        self.app = app
+        self.tracer = tracer
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        tr = self.tracer.start(f"{scope['method']} {scope['path']}")
+        token = _CURRENT.set(tr)
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _CURRENT.reset(token)
+            route = scope.get("route")
+            # route template (/webhook-test/{test_id}) để label không nổ cardinality
+            template = getattr(route, "path", None) or "unmatched"
+            tr.name = f"{scope['method']} {template}"
+            tr.tags.setdefault("path", scope["path"])
+            self.tracer.finish(tr, status[0])
+            self.tracer.request_seconds.observe(tr.duration, route=template, method=scope["method"], status=str(status[0]))
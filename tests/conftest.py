@@ -0,0 +1,66 @@
+"""Shared fixtures: repo root on sys.path, CashyBear/Zalo bridge SQLite files in temp dirs, fake SQLAlchemy engine."""
+
+import atexit
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# cashybear.config đọc env lúc import (test module import cashybear.api ở đầu file) → đặt trước, không ghi ra repo root
+_TMP = tempfile.mkdtemp(prefix="cashybear-tests-")
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ["CASHYBEAR_LLM_CACHE_DB"] = os.path.join(_TMP, "cashybear_llm_cache.db")
+os.environ["CASHYBEAR_SESSION_DB"] = os.path.join(_TMP, "cashybear_sessions.db")
+os.environ["CASHYBEAR_PROFILE_EPOCH"] = os.path.join(_TMP, "cashybear_profiles.epoch")
+
+
+class FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self._row
+
+    def all(self):
+        return self._row if isinstance(self._row, list) else [self._row]
+
+
+class FakeEngine:
+    """Engine/connection stand-in: records (sql, params); execute() returns `handle(sql, params)` or `row`"""
+
+    def __init__(self, row=None, handle=None):
+        self.row = row
+        self.handle = handle
+        self.calls = []
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    begin = connect
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.calls.append((sql, params))
+        return FakeResult(self.handle(sql, params) if self.handle else self.row)
+
+
+@pytest.fixture
+def bridge(tmp_path, monkeypatch):
+    """Fresh zalo_bot_integration module whose outbox / conversations / dedup DBs live in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    sys.modules.pop("zalo_bot_integration", None)
+    mod = importlib.import_module("zalo_bot_integration")
+    yield mod
+    sys.modules.pop("zalo_bot_integration", None)
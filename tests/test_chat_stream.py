@@ -0,0 +1,53 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from cashybear import api
+from cashybear.sessions import MemorySessionStore
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def _post(message="xin chào bạn nhé hôm nay thế nào"):
+    return TestClient(api.app).post("/chat/reply/stream", json={"customerId": 1, "persona": "Mentor", "sessionId": "s", "message": message})
+
+
+def test_unexpected_error_ends_stream_with_error_event_and_saves_session(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(api, "SESSIONS", store)
+
+    def db_down(cid):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(api, "_fetch_profile_latest", db_down)
+    r = _post()
+    assert r.status_code == 200
+    events = _events(r.text)
+    assert [e for e, _ in events] == ["error"]
+    assert events[0][1]["status"] == 500 and "db down" in events[0][1]["detail"]
+    assert store.peek("s") is not None
+
+
+def test_session_store_failure_is_an_error_event(monkeypatch):
+    class Broken(MemorySessionStore):
+        def load(self, session_id):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(api, "SESSIONS", Broken())
+    assert [e for e, _ in _events(_post().text)] == ["error"]
+
+
+def test_stream_ends_with_done(monkeypatch):
+    monkeypatch.setattr(api, "SESSIONS", MemorySessionStore())
+    monkeypatch.setattr(api, "_fetch_profile_latest", lambda cid: {"customer_id": cid})
+    monkeypatch.setattr(api, "_hook_chat_reply", lambda *a: None)
+    monkeypatch.setattr(api, "llm_chat_reply_stream", lambda **kw: iter(["Chào ", "bạn"]))
+    events = _events(_post().text)
+    assert [e for e, _ in events] == ["delta", "delta", "done"]
+    assert events[-1][1]["reply"] == "Chào bạn"
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from propensity import scoring
+from propensity.compact import CompactScorer, export_compact, parity_check, sample_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(ROOT, "customer_propensity_model.joblib")
+COMPACT = os.path.join(ROOT, "customer_propensity_model.npz")
+TOL = 1e-9
+
+
+@pytest.fixture(scope="module")
+def model():
+    return scoring.load_model(MODEL)
+
+
+@pytest.fixture(scope="module")
+def sample(model):
+    # cố định seed: gồm cả category lạ / None / NaN
+    return sample_frame(model, 500, seed=0)
+
+
+def test_shipped_npz_matches_joblib(model, sample):
+    scorer = CompactScorer.load(COMPACT)
+    assert scorer.feature_columns == scoring.feature_columns(model)
+    assert parity_check(model, scorer, sample) <= TOL
+
+
+def test_fresh_export_matches(model, sample, tmp_path):
+    path = str(tmp_path / "m.npz")
+    meta = export_compact(model, path, "test")
+    scorer = CompactScorer.load(path)
+    assert scorer.version == "test" and meta["folds"] == len(scorer._iso)
+    ref = model.predict_proba(sample[scorer.feature_columns])
+    got = scorer.predict_proba(sample)
+    assert got.shape == ref.shape
+    np.testing.assert_allclose(got, ref, rtol=0, atol=TOL)
+
+
+def test_records_and_score_frame(model, sample):
+    scorer = CompactScorer.load(COMPACT)
+    head = sample.head(50)
+    # dict rows: null = category None (như JSON / DB NULL), nên bản tham chiếu cũng dùng None thay NaN
+    ref_df = head.astype(object).where(head.notna(), None)
+    got_rows = scorer.predict_records(ref_df.to_dict("records"))
+    np.testing.assert_allclose(got_rows, model.predict_proba(ref_df[scorer.feature_columns])[:, 1], atol=TOL)
+
+    df = head.assign(customer_id=range(50), year_month="2025-08")
+    ref = scoring.score_frame(model, df)
+    got = scorer.score_frame(df)
+    assert list(got.columns) == list(ref.columns)
+    np.testing.assert_allclose(got["probability"], ref["probability"], atol=TOL)
+    assert (got["decision"] == ref["decision"]).all() and (got["priority_send"] == ref["priority_send"]).all()
+
+
+def test_missing_feature_column_raises(sample):
+    scorer = CompactScorer.load(COMPACT)
+    with pytest.raises(KeyError):
+        scorer.predict_proba(sample.drop(columns=[scorer.feature_columns[0]]))
@@ -0,0 +1,59 @@
+from zalo_bridge import ConversationStore
+
+
+def _conv(user, chat, i):
+    return {"user_id": user, "chat_id": chat, "user_message": f"m{i}", "timestamp": 1000.0 + i}
+
+
+def test_indexes_and_bounds():
+    store = ConversationStore(per_user_limit=3, max_users=2)
+    for i in range(5):
+        store.add(_conv("u1", "c1", i))
+    assert [c["user_message"] for c in store.for_user("u1")] == ["m2", "m3", "m4"]
+    assert store.latest_for_user("u1")["user_message"] == "m4"
+    assert [c["user_message"] for c in store.for_chat("c1", limit=2)] == ["m3", "m4"]
+    assert store.stats()["pending"] == 3
+
+    store.add(_conv("u2", "c2", 0))
+    store.add(_conv("u3", "c3", 0))  # max_users=2 → u1 (LRU) bị loại
+    assert store.for_user("u1") == [] and store.for_chat("c1") == []
+    assert store.stats()["users"] == 2
+
+
+def test_update_clears_pending():
+    store = ConversationStore()
+    conv = store.add(_conv("u1", "c1", 0))
+    store.update(conv, manual_reply_sent=True)
+    assert store.pending() == []
+    assert store.get(conv["id"])["manual_reply_sent"] is True
+
+
+def test_warm_up_loads_full_history_of_recent_users(tmp_path):
+    path = str(tmp_path / "conv.db")
+    store = ConversationStore(per_user_limit=10, db_path=path)
+    for i in range(8):
+        store.add(_conv("old", "c-old", i))
+    for i in range(8):
+        store.add(_conv("new", "c-new", i))
+
+    # recent_limit=3 chỉ thấy 3 record mới nhất của "new", nhưng ring phải đầy đủ lịch sử
+    warm = ConversationStore(per_user_limit=10, recent_limit=3, db_path=path)
+    assert [c["user_message"] for c in warm.for_user("new")] == [f"m{i}" for i in range(8)]
+    assert [c["user_message"] for c in warm.recent()] == ["m5", "m6", "m7"]
+    # user không được warm vẫn nạp lười từ SQLite
+    assert len(warm.for_user("old")) == 8
+    assert len(warm.for_chat("c-old")) == 8
+
+
+def test_get_reloads_from_disk(tmp_path):
+    path = str(tmp_path / "conv.db")
+    store = ConversationStore(per_user_limit=2, db_path=path)
+    first = store.add(_conv("u", "c", 0))
+    for i in range(1, 4):
+        store.add(_conv("u", "c", i))
+    fresh = ConversationStore(per_user_limit=2, recent_limit=0, db_path=path)
+    # cũ hơn ring → bản đọc từ disk, update() vẫn ghi xuống
+    old = fresh.get(first["id"])
+    assert old["user_message"] == "m0"
+    fresh.update(old, manual_reply_sent=True)
+    assert ConversationStore(db_path=path).get(first["id"])["manual_reply_sent"] is True
@@ -0,0 +1,96 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from propensity import db
+
+
+class FakeCursor:
+    def __init__(self, copies):
+        self.copies = copies
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, buf):
+        self.copies.append((sql, list(csv.reader(io.StringIO(buf.read())))))
+
+
+class FakeConn:
+    """SQLAlchemy Connection stand-in: records driver SQL and COPY payloads"""
+
+    def __init__(self):
+        self.sql = []
+        self.copies = []
+        outer = self
+
+        class _Dbapi:
+            def cursor(self):
+                return FakeCursor(outer.copies)
+
+        class _Proxy:
+            dbapi_connection = _Dbapi()
+
+        self.connection = _Proxy()
+
+    def exec_driver_sql(self, sql):
+        self.sql.append(sql)
+
+
+def test_copy_upsert_stages_and_merges_per_chunk():
+    conn = FakeConn()
+    df = pd.DataFrame({
+        "customer_id": [1, 2, 1, 3],
+        "year_month": ["2025-08"] * 4,
+        "probability": [0.1, np.nan, 0.7, 0.4],
+        "decision": ["Cold", None, "Hot", "Warm"],
+    })
+    n = db.copy_upsert(conn, "predictions", df, db.PREDICTION_KEYS, chunk_rows=3)
+    assert n == 4
+    assert conn.sql[0].startswith("CREATE TEMP TABLE IF NOT EXISTS _stg_predictions (LIKE predictions")
+    assert "ON COMMIT DROP" in conn.sql[0]
+    # mỗi chunk: TRUNCATE staging → COPY → 1 câu merge
+    assert [s.split()[0] for s in conn.sql[1:]] == ["TRUNCATE", "INSERT", "TRUNCATE", "INSERT"]
+    merge = conn.sql[2]
+    assert "ON CONFLICT (customer_id, year_month) DO UPDATE SET" in merge
+    assert "probability = EXCLUDED.probability" in merge and "created_at = now()" in merge
+    assert "customer_id = EXCLUDED" not in merge
+
+    sql, rows = conn.copies[0]
+    assert sql.startswith("COPY _stg_predictions (customer_id, year_month, probability, decision) FROM STDIN")
+    # key (1, 2025-08) trùng trong chunk → giữ dòng cuối; NaN/None → \N
+    assert rows == [["2", "2025-08", "\\N", "\\N"], ["1", "2025-08", "0.7", "Hot"]]
+    assert conn.copies[1][1] == [["3", "2025-08", "0.4", "Warm"]]
+
+
+def test_copy_upsert_keys_only_does_nothing_on_conflict():
+    conn = FakeConn()
+    df = pd.DataFrame({"customer_id": [1], "year_month": ["2025-08"]})
+    db.copy_upsert(conn, "predictions", df, db.PREDICTION_KEYS, touch_created_at=False)
+    assert conn.sql[-1].endswith("ON CONFLICT (customer_id, year_month) DO NOTHING")
+
+
+def test_copy_insert_chunks_without_merge():
+    conn = FakeConn()
+    df = pd.DataFrame({"run_id": ["r"] * 5, "n": range(5)})
+    assert db.copy_insert(conn, "calibration_bins", df, chunk_rows=2) == 5
+    assert conn.sql == []
+    assert [len(rows) for _, rows in conn.copies] == [2, 2, 1]
+    assert all(sql.startswith("COPY calibration_bins (run_id, n)") for sql, _ in conn.copies)
+
+
+def test_upsert_predictions_includes_fingerprints():
+    conn = FakeConn()
+    scored = pd.DataFrame({
+        "customer_id": [5], "year_month": ["2025-08"], "probability": [0.5], "decision": ["Warm"],
+        "priority_send": [1], "feature_hash": [123], "model_version": ["abc"],
+    })
+    db.upsert_predictions(conn, scored)
+    sql, rows = conn.copies[0]
+    assert "(customer_id, year_month, probability, decision, priority_send, feature_hash, model_version)" in sql
+    assert rows == [["5", "2025-08", "0.5", "Warm", "True", "123", "abc"]]
@@ -0,0 +1,89 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from cashybear import api, db
+from conftest import FakeEngine
+
+
+def test_fetch_dashboard_reads_plan_with_left_joined_summary():
+    eng = FakeEngine({"plan_id": "p1", "summary_missing": False})
+    assert db.fetch_dashboard(eng, 42) == {"plan_id": "p1"}
+    assert len(eng.calls) == 1
+    sql, params = eng.calls[0]
+    assert params == {"cid": "42"}
+    # plan là bảng gốc, progress chỉ LEFT JOIN → plan chưa có dòng tổng hợp vẫn được trả về
+    assert "FROM persona_plans p" in sql
+    assert "LEFT JOIN persona_plan_progress s" in sql
+    assert "WHERE p.customer_id = :cid" in sql
+
+
+def test_fetch_dashboard_builds_missing_summary_then_rereads():
+    eng = FakeEngine({"plan_id": "p1", "summary_missing": True})
+    db.fetch_dashboard(eng, 42)
+    # dòng tổng hợp (saved_amount, per_day) tính bằng cùng SQL với đường ghi, chỉ cho plan đó, rồi đọc lại
+    assert len(eng.calls) == 3
+    refresh_sql, refresh_params = eng.calls[1]
+    assert "INSERT INTO persona_plan_progress" in refresh_sql and "per_day" in refresh_sql
+    assert refresh_params == {"pids": ["p1"]}
+    assert eng.calls[2] == eng.calls[0]
+
+
+def test_fetch_dashboard_summary_only_skips_tasks():
+    eng = FakeEngine(None)
+    assert db.fetch_dashboard(eng, 1, include_tasks=False) is None
+    assert "json_agg" not in eng.calls[0][0]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    eng = FakeEngine()
+    monkeypatch.setattr(api, "_engine_or_500", lambda: eng)
+    return TestClient(api.app), eng
+
+
+def test_dashboard_todo_plan_with_live_counts(client):
+    c, eng = client
+    eng.row = {
+        "plan_id": "p1", "total_tasks": 4, "completed_tasks": 1, "sum_progress": 150,
+        "saved_amount": 0, "per_day": "[]", "weekly_cap_save": 300000, "recommended_weekly_save": 200000,
+        "target_amount": "1000000", "tasks": "[]",
+    }
+    body = c.get("/dashboard/todo", params={"customerId": 42}).json()
+    assert body["planId"] == "p1"
+    s = body["summary"]
+    assert s["totalTasks"] == 4 and s["completedTasks"] == 1
+    assert s["completionPct"] == pytest.approx(37.5)
+    assert s["perDay"] == [] and s["savedAmount"] == 0.0
+    assert s["remainingAmount"] == 1_000_000.0
+
+
+def test_dashboard_todo_no_plan(client):
+    c, _ = client
+    body = c.get("/dashboard/todo", params={"customerId": 7}).json()
+    assert body["planId"] is None and body["summary"]["totalTasks"] == 0
+
+
+def test_dashboard_todo_defaults_to_summary_only(client):
+    c, eng = client
+    c.get("/dashboard/todo", params={"customerId": 42})
+    assert "json_agg" not in eng.calls[-1][0]
+    c.get("/dashboard/todo", params={"customerId": 42, "includeTasks": "true"})
+    assert "json_agg" in eng.calls[-1][0]
+
+
+def test_task_update_applies_delta_without_recomputing_plan():
+    eng = FakeEngine(handle=lambda sql, params: {"applied": 1} if "RETURNING 1 AS applied" in sql else None)
+    db.update_task_progress(eng, "p1", 0, 1, 75, "in_progress", "ok")
+    sqls = [sql for sql, _ in eng.calls]
+    assert len(sqls) == 3 and "FOR UPDATE" in sqls[0] and "INSERT INTO persona_task_updates" in sqls[2]
+    # chỉ cộng chênh lệch vào dòng tổng hợp, không chạy lại aggregate của cả plan
+    assert "sum_progress = s.sum_progress + (upd.new_p - upd.old_p)" in sqls[1]
+    assert not any("INSERT INTO persona_plan_progress" in sql for sql in sqls)
+    assert eng.calls[1][1] == {"p": 75, "s": "in_progress", "pid": "p1", "d": 0, "t": 1}
+
+
+def test_task_update_without_summary_row_recomputes_that_plan():
+    eng = FakeEngine(None)
+    db.update_task_progress(eng, "p1", 0, 1, 100, "done")
+    refresh_sql, refresh_params = eng.calls[-1]
+    assert "INSERT INTO persona_plan_progress" in refresh_sql and refresh_params == {"pids": ["p1"]}
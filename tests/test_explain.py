@@ -0,0 +1,106 @@
+import time
+
+from propensity.explain import (
+    NO_LLM_FALLBACK,
+    ExplanationPipeline,
+    ExplanationStore,
+    TokenBucket,
+    signature,
+    signature_key,
+    stub_model,
+)
+from propensity.facts import FACT_FALLBACK
+
+
+def _pipe(model, **kw):
+    kw.setdefault("rate_per_sec", 0)
+    kw.setdefault("progress_every", 0)
+    return ExplanationPipeline(model, ExplanationStore(":memory:"), **kw)
+
+
+def test_row_failed_marks_only_failed_rows():
+    def flaky(prompt):
+        if "bad" in prompt:
+            raise RuntimeError("quota")
+        return stub_model(prompt)
+
+    pipe = _pipe(flaky, concurrency=1)
+    out = pipe.explain(["Hot", "Hot", "Warm"], [0.9, 0.9, 0.4], [["good"], ["bad"], []])
+    assert out[0].startswith("[stub]") and out[1] == FACT_FALLBACK and out[2] == FACT_FALLBACK
+    # dòng không có facts là kết quả cuối, không phải lỗi
+    assert pipe.row_failed == [False, True, False]
+
+    none = _pipe(None)
+    assert none.explain(["Hot"], [0.9], [["good"]]) == [NO_LLM_FALLBACK] and none.row_failed == [True]
+
+
+def test_signature_dedup_one_call_per_signature():
+    prompts = []
+
+    def model(prompt):
+        prompts.append(prompt)
+        return stub_model(prompt)
+
+    pipe = _pipe(model)
+    # 0.61/0.62 cùng dải 0.05, facts khác thứ tự/khoảng trắng → cùng signature
+    out = pipe.explain(
+        ["Hot", "Hot", "Hot", "Warm"],
+        [0.61, 0.62, 0.61, 0.61],
+        [["a", "b"], [" b", "a", "a"], ["c"], ["a", "b"]],
+    )
+    assert len(prompts) == 3
+    assert out[0] == out[1] != out[2]
+    assert pipe.stats == {"rows": 4, "unique": 3, "cached": 0, "called": 3, "failed": 0, "skipped": 0}
+    assert signature("Hot", 0.61, ["a", "b"]) == signature("Hot", 0.62, ["b", "a"])
+    assert signature_key(signature("Hot", 0.61, ["a"])) != signature_key(signature("Warm", 0.61, ["a"]))
+
+
+def test_rerun_resumes_from_cache(tmp_path):
+    db = str(tmp_path / "explain.db")
+    calls = []
+
+    def model(prompt):
+        calls.append(prompt)
+        return stub_model(prompt)
+
+    rows = (["Hot", "Warm"], [0.9, 0.4], [["a"], ["b"]])
+    first = ExplanationPipeline(model, ExplanationStore(db), rate_per_sec=0, progress_every=0).explain(*rows)
+    # lần chạy sau (process mới, cùng file cache) không gọi lại model
+    pipe = ExplanationPipeline(model, ExplanationStore(db), rate_per_sec=0, progress_every=0)
+    assert pipe.explain(*rows) == first and len(calls) == 2
+    assert pipe.stats["cached"] == 2 and pipe.stats["called"] == 0
+
+
+def test_consecutive_failures_stop_early_and_are_not_cached():
+    calls = []
+
+    def down(prompt):
+        calls.append(prompt)
+        raise RuntimeError("429 quota")
+
+    store = ExplanationStore(":memory:")
+    pipe = ExplanationPipeline(down, store, concurrency=1, rate_per_sec=0, progress_every=0, max_consecutive_failures=3)
+    out = pipe.explain(["Hot"] * 10, [0.9] * 10, [[f"f{i}"] for i in range(10)])
+    assert out == [FACT_FALLBACK] * 10
+    # concurrency=1 → tối đa 2 việc đã submit trước; sau 3 lỗi liên tiếp không submit thêm
+    assert len(calls) <= 4
+    assert pipe.stats["failed"] + pipe.stats["skipped"] == 10 and pipe.stats["skipped"] >= 6
+    assert store.count() == 0 and all(pipe.row_failed)
+
+    ok = ExplanationPipeline(stub_model, store, rate_per_sec=0, progress_every=0)
+    ok.explain(["Hot"] * 10, [0.9] * 10, [[f"f{i}"] for i in range(10)])
+    assert ok.stats["cached"] == 0 and ok.stats["called"] == 10 and store.count() == 10
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(rate=20, burst=2)
+    t0 = time.perf_counter()
+    for _ in range(6):
+        bucket.acquire()
+    # 2 token sẵn có, 4 lần còn lại chờ ~1/20 s mỗi lần
+    assert time.perf_counter() - t0 >= 4 / 20 * 0.9
+    free = TokenBucket(rate=0)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        free.acquire()
+    assert time.perf_counter() - t0 < 0.05
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import set_config
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from propensity.facts import FACT_CATALOG, FACT_FALLBACK, FactExtractor, normalize_feat_name
+
+NUM = ["surplus", "dti", "digital_index", "large_inflow_flag_7d", "unknown_metric", "other_metric"]
+
+
+def _catalog():
+    cat = dict(FACT_CATALOG)
+    # 2 feature cùng câu fact → nhánh loại trùng
+    cat["other_metric"] = {"pos": FACT_CATALOG["surplus"]["pos"], "neg": FACT_CATALOG["surplus"]["neg"]}
+    return cat
+
+
+@pytest.fixture(scope="module")
+def setup():
+    rng = np.random.default_rng(7)
+    n = 120
+    X = pd.DataFrame(rng.normal(size=(n, len(NUM))), columns=NUM)
+    X["season_flag"] = rng.choice(["pre_holiday", "holiday_week", "normal"], size=n)
+    pre = ColumnTransformer([("num", StandardScaler(), NUM), ("cat", OneHotEncoder(sparse_output=False), ["season_flag"])])
+    set_config(transform_output="pandas")
+    try:
+        pre.fit(X)
+        names = list(pre.get_feature_names_out())
+        coef = rng.normal(size=len(names))
+        # "unknown_metric" (không có trong catalog) nặng nhất → có dòng thiếu fact
+        coef[NUM.index("unknown_metric")] = 5.0
+        yield pre, coef, names, X
+    finally:
+        set_config(transform_output="default")
+
+
+def _reference(pre, coef, names, catalog, x_raw, columns, k):
+    """Bản per-row cũ của notebook (top_factors_and_facts)"""
+    xt = pd.DataFrame(pre.transform(pd.DataFrame([x_raw], columns=columns)), columns=names).iloc[0]
+    contrib = pd.Series(xt.values * coef, index=names)
+    top = list(contrib.abs().sort_values(ascending=False).head(k).index)
+    facts = []
+    for f in top:
+        entry = catalog.get(normalize_feat_name(f))
+        if entry:
+            facts.append(entry["pos"] if contrib.loc[f] >= 0 else entry["neg"])
+    facts = list(dict.fromkeys(facts))
+    return top, facts or [FACT_FALLBACK]
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_explain_matches_per_row_reference(setup, k):
+    pre, coef, names, X = setup
+    catalog = _catalog()
+    fx = FactExtractor(pre, coef, names, catalog=catalog)
+    got_names, got_facts = fx.explain(X, k=k)
+    for i in range(len(X)):
+        ref_names, ref_facts = _reference(pre, coef, names, catalog, X.iloc[i], X.columns, k)
+        assert got_names[i] == ref_names
+        assert got_facts[i] == ref_facts
+    # nhánh bất thường (thiếu fact → fallback, trùng câu) phải thực sự được kiểm
+    if k == 1:
+        assert any(f == [FACT_FALLBACK] for f in got_facts)
+    assert k < 5 or any(sum(n in ("num__surplus", "num__other_metric") for n in row) == 2 for row in got_names)
+    assert fx.facts_joined(X.head(3), k=k) == ["; ".join(f) for f in got_facts[:3]]
+
+
+def test_coef_length_mismatch(setup):
+    pre, coef, names, _ = setup
+    with pytest.raises(ValueError):
+        FactExtractor(pre, coef[:-1], names)
@@ -0,0 +1,30 @@
+import asyncio
+
+
+def test_http_client_is_shared_per_pool(bridge):
+    async def run():
+        a = bridge.get_http_client("cashybear")
+        b = bridge.get_http_client("cashybear")
+        z = bridge.get_http_client("zalo")
+        insecure = bridge.get_http_client("zalo", verify=False)
+        assert a is b
+        assert z is not a and insecure is not z
+        await bridge.close_http_clients()
+        assert a.is_closed and z.is_closed and insecure.is_closed
+        # client đã đóng → tạo mới lần gọi sau
+        c = bridge.get_http_client("cashybear")
+        assert c is not a and not c.is_closed
+        await bridge.close_http_clients()
+
+    asyncio.run(run())
+
+
+def test_pool_limits_come_from_config(bridge):
+    async def run():
+        client = bridge.get_http_client("zalo")
+        pool = client._transport._pool
+        assert pool._max_connections == bridge.HTTP_POOLS["zalo"]["max_connections"]
+        assert pool._max_keepalive_connections == bridge.HTTP_POOLS["zalo"]["max_keepalive"]
+        await bridge.close_http_clients()
+
+    asyncio.run(run())
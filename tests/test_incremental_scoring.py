@@ -0,0 +1,99 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from propensity import batch, db, scoring
+from propensity.compact import sample_frame
+
+MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "customer_propensity_model.joblib")
+
+
+@pytest.fixture(scope="module")
+def model():
+    return scoring.load_model(MODEL)
+
+
+@pytest.fixture(scope="module")
+def frame(model):
+    df = sample_frame(model, 12, seed=3)
+    df.insert(0, "year_month", "2025-08")
+    df.insert(0, "customer_id", np.arange(100, 112))
+    return df
+
+
+def _stored(df, hashes, version):
+    return pd.DataFrame({
+        "customer_id": df["customer_id"].to_numpy(),
+        "year_month": df["year_month"].to_numpy(),
+        "feature_hash": pd.array(hashes, dtype="Int64"),
+        "model_version": version,
+    })
+
+
+def test_fingerprints_are_stable_and_sensitive(model, frame):
+    h = scoring.feature_fingerprints(model, frame)
+    assert h.dtype == np.int64 and len(h) == len(frame)
+    assert np.array_equal(h, scoring.feature_fingerprints(model, frame.copy()))
+    num_col = scoring.feature_columns(model)[0]
+    changed = frame.copy()
+    changed.loc[3, num_col] = changed.loc[3, num_col] + 1.0
+    diff = h != scoring.feature_fingerprints(model, changed)
+    assert diff.tolist() == [i == 3 for i in range(len(frame))]
+
+
+def test_changed_mask(model, frame):
+    h = scoring.feature_fingerprints(model, frame)
+    empty = _stored(frame.iloc[:0], h[:0], "v1")
+    assert scoring.changed_mask(frame, h, "v1", empty).all()
+
+    stored = _stored(frame, h, "v1")
+    assert not scoring.changed_mask(frame, h, "v1", stored).any()
+    assert scoring.changed_mask(frame, h, "v2", stored).all()  # model mới → chấm lại hết
+
+    stored.loc[2, "feature_hash"] = 12345
+    partial = stored.drop(index=[5])
+    mask = scoring.changed_mask(frame, h, "v1", partial)
+    assert np.flatnonzero(mask).tolist() == [2, 5]
+
+    # bản ghi trùng key: dòng cuối thắng
+    dup = pd.concat([_stored(frame.iloc[[0]], [1], "v1"), _stored(frame.iloc[[0]], h[:1], "v1")], ignore_index=True)
+    assert not scoring.changed_mask(frame.iloc[[0]], h[:1], "v1", dup).any()
+
+
+def test_only_changed_fetches_per_chunk_and_reuses_hashes(model, frame, monkeypatch):
+    version = scoring.model_version(MODEL)
+    h = scoring.feature_fingerprints(model, frame)
+    stored = _stored(frame, h, version)
+    stored.loc[[1, 8], "feature_hash"] = 0  # 2 KH đổi features
+    fetched = []
+
+    def fake_fetch(engine, customer_ids, year_month=None):
+        ids = [int(c) for c in customer_ids]
+        fetched.append(ids)
+        return stored[stored["customer_id"].isin(ids)]
+
+    monkeypatch.setattr(batch, "fetch_fingerprints", fake_fetch)
+    chunks = [frame.iloc[:6], frame.iloc[6:]]
+    skipped = Counter()
+    out = list(batch.only_changed(chunks, MODEL, object(), "2025-08", skipped))
+    assert fetched == [list(range(100, 106)), list(range(106, 112))]
+    assert skipped["unchanged"] == 10
+    assert [c["customer_id"].tolist() for c in out] == [[101], [108]]
+    assert out[0]["feature_hash"].tolist() == [h[1]]
+
+    # score_frame dùng lại hash đã tính, không hash lại chunk
+    def no_rehash(*a, **k):
+        raise AssertionError("chunk hashed twice")
+
+    monkeypatch.setattr(scoring, "feature_fingerprints", no_rehash)
+    scored = pd.concat(batch.score_chunks(out, MODEL))
+    assert scored["feature_hash"].tolist() == [h[1], h[8]]
+    assert (scored["model_version"] == version).all()
+
+
+def test_fetch_fingerprints_without_ids_skips_query():
+    df = db.fetch_fingerprints(None, [])
+    assert df.empty and list(df.columns) == ["customer_id", "year_month", "feature_hash", "model_version"]
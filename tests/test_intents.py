@@ -0,0 +1,142 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from cashybear import api
+from cashybear.intents import INTENTS, fast_intent, render_fast_reply
+from cashybear.nlu import parse_amount_vi
+from cashybear.sessions import MemorySessionStore
+
+# Đúng khuôn tin nhắn zalo_bot_integration.trigger_spend gửi sang /chat/reply
+TRIGGER_TAIL = "\nNhờ nhắc nếu mình lệch kế hoạch và gợi ý cách cân đối lại cho ngày/tuần này nhé."
+TRIGGER_MESSAGES = [
+    "Mình vừa chi tiêu 150.000 VND cho ăn trưa. Cập nhật giúp nhé.",
+    "Mình vừa chi tiêu 150.000 VND cho ăn trưa. Cập nhật giúp nhé.\n"
+    "Theo kế hoạch ~700.000 VND/tuần (~100.000 VND/ngày). Hôm nay mình đã chi tổng 150.000 VND (1 khoản), tuần này 150.000 VND."
+    " Hôm nay mình đang vượt khoảng 50.000 VND."
+    "\n\n[Chế độ Angry Mom] Này này! Chi tiêu kiểu này là đi sai plan rồi đó nha. Cắt bớt ăn uống, dừng quẹt thẻ vô tội vạ,"
+    " ưu tiên tự nấu ở nhà và hoàn thành nhiệm vụ ngày hôm nay. Nghe rõ chưa?" + TRIGGER_TAIL,
+    "Mình vừa chi tiêu 50.000 VND. Cập nhật giúp nhé.\n"
+    "Theo kế hoạch ~700.000 VND/tuần (~100.000 VND/ngày). Hôm nay vẫn trong mức (dư 50.000 VND)." + TRIGGER_TAIL,
+]
+
+
+@pytest.mark.parametrize("msg", TRIGGER_MESSAGES)
+def test_trigger_spend_message_is_spend_not_change(msg):
+    found = INTENTS.match(msg)
+    assert "spend" in found
+    assert "change" not in found
+    # bridge gửi kèm spendLogged khi đã ghi qua /spend/log (tin có totals)
+    assert fast_intent(found, parse_amount_vi(msg), spend_logged="Theo kế hoạch" in msg) == "spend"
+
+
+@pytest.mark.parametrize("msg", [
+    "Mình muốn giảm chi tiêu 2 triệu mỗi tháng",
+    "chi tiêu của mình tháng này khoảng 5 triệu, lập kế hoạch giúp",
+    "hôm nay mua gì 1 triệu được không",
+    "mình vừa mua xe 500 triệu, tiết kiệm lại thế nào?",
+    "mục tiêu: vừa chi 2 triệu mỗi tuần",
+])
+def test_goal_or_question_is_not_a_spend(msg):
+    amount = parse_amount_vi(msg)
+    assert amount is not None
+    assert fast_intent(INTENTS.match(msg), amount) != "spend"
+
+
+@pytest.mark.parametrize("msg", [
+    "đổi lại kế hoạch giúp mình", "làm lại kế hoạch nhé", "Làm lại đi", "cho mình kế hoạch khác",
+    "sửa mục tiêu thành 10 triệu", "thay phương án khác", "điều chỉnh chút nha", "lập lại plan",
+])
+def test_change_requests(msg):
+    assert "change" in INTENTS.match(msg)
+
+
+@pytest.mark.parametrize("msg", [
+    "cân đối lại giúp mình", "mình đói lại rồi", "đợi lại chút", "uống sữa lại", "gửi lại tin nhắn",
+])
+def test_not_change(msg):
+    assert "change" not in INTENTS.match(msg)
+
+
+@pytest.mark.parametrize("msg,intent", [
+    ("chào bạn", "greeting"), ("bạn là ai", "who"), ("cảm ơn nhé", "thanks"),
+    ("tiến độ thế nào rồi", "progress"), ("ok chốt", "accept"),
+])
+def test_other_intents(msg, intent):
+    assert intent in INTENTS.match(msg)
+
+
+@pytest.mark.parametrize("text,amount", [
+    ("Mình vừa chi tiêu 150.000 VND cho ăn trưa", 150_000), ("vừa chi 50.000", 50_000), ("chi 45000", 45_000),
+    ("ăn sáng 30.000đ", 30_000), ("150,000 VND", 150_000), ("200k", 200_000), ("1,5 triệu", 1_500_000),
+    ("tiết kiệm 5 triệu trong 6 tháng", 5_000_000), ("chi 50", None), ("kế hoạch năm 2025", None), ("6 tháng", None),
+])
+def test_parse_amount(text, amount):
+    assert parse_amount_vi(text) == amount
+
+
+def _totals(today, week, daily):
+    return {"todaySpend": today, "weekSpend": week, "dailyTarget": daily}
+
+
+def test_spend_reply_uses_running_day_total():
+    # khoản 40k nhỏ hơn mức ngày, nhưng tổng hôm nay 140k đã vượt
+    reply = render_fast_reply("spend", "Mentor", "accepted", amount=40_000, spend=_totals(140_000, 300_000, 100_000))
+    assert "40,000 VNĐ" in reply and "140,000 VNĐ" in reply and "300,000 VNĐ" in reply
+    assert "vượt" in reply and "40,000 VNĐ" in reply.split("khoảng")[-1]
+
+    ok = render_fast_reply("spend", "Banter", "accepted", amount=40_000, spend=_totals(60_000, 60_000, 100_000))
+    assert "dư ~40,000 VNĐ" in ok
+
+    noplan = render_fast_reply("spend", "Angry Mom", "awaiting_goal", amount=40_000, spend=_totals(90_000, 90_000, None))
+    assert "90,000 VNĐ" in noplan and "kế hoạch" in noplan
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    calls = {"stored": [], "notified": []}
+    monkeypatch.setattr(api, "SESSIONS", MemorySessionStore())
+    monkeypatch.setattr(api, "_fetch_profile_latest", lambda cid: {"customer_id": cid})
+    monkeypatch.setattr(api, "_engine_or_500", lambda: object())
+    monkeypatch.setattr(api, "_store_spend", lambda engine, ev, buffered=True: calls["stored"].append(ev) or True)
+    monkeypatch.setattr(api, "_notify_plan_summary_changed", lambda cid: calls["notified"].append(cid))
+    monkeypatch.setattr(api, "_spend_totals", lambda engine, cid, day: _totals(130_000 + sum(e["amount"] for e in calls["stored"]), 400_000, 100_000))
+    monkeypatch.setattr(api, "_hook_chat_reply", lambda *a: None)
+
+    def no_llm(**kw):
+        raise AssertionError("fast path must not call the LLM")
+
+    monkeypatch.setattr(api, "llm_chat_reply", no_llm)
+    return TestClient(api.app), calls
+
+
+def test_chat_spend_records_and_replies_with_totals(chat):
+    client, calls = chat
+    r = client.post("/chat/reply", json={"customerId": 9, "persona": "Mentor", "sessionId": "s", "message": "mình vừa chi 20.000 ăn sáng"})
+    body = r.json()
+    assert [e["amount"] for e in calls["stored"]] == [20_000.0] and calls["notified"] == [9]
+    assert "150,000 VNĐ" in body["reply"] and "vượt" in body["reply"]
+    assert body["phase"] == "awaiting_goal"
+
+
+def test_chat_trigger_spend_already_logged(chat):
+    client, calls = chat
+    st = api.SESSIONS.load("s2")
+    st.update(plan_generated=True, phase="accepted", horizon=7)
+    api.SESSIONS.save("s2", st)
+    r = client.post("/chat/reply", json={
+        "customerId": 9, "persona": "Angry Mom", "sessionId": "s2", "message": TRIGGER_MESSAGES[1], "spendLogged": True,
+    })
+    body = r.json()
+    assert calls["stored"] == [] and calls["notified"] == []
+    assert "150,000 VNĐ" in body["reply"] and "130,000 VNĐ" in body["reply"]
+    # không bị coi là "đổi kế hoạch": session giữ nguyên plan
+    st = api.SESSIONS.peek("s2")
+    assert st["plan_generated"] and st["phase"] == "accepted" and st["horizon"] == 7
+
+
+def test_chat_goal_message_keeps_amount_and_stores_nothing(chat, monkeypatch):
+    client, calls = chat
+    monkeypatch.setattr(api, "llm_chat_reply", lambda **kw: "ok")
+    client.post("/chat/reply", json={"customerId": 9, "persona": "Mentor", "sessionId": "s3", "message": "Mình muốn giảm chi tiêu 2 triệu mỗi tháng"})
+    assert calls["stored"] == [] and calls["notified"] == []
+    assert api.SESSIONS.peek("s3")["goal_amount"] == 2_000_000
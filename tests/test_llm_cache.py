@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from cashybear.llm_cache import LLMCache
+
+
+def test_concurrent_identical_requests_compute_once(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"plan": len(calls)}
+
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(cache.get_or_compute("plan", {"a": 1}, compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [1] and out == [{"plan": 1}] * 8
+    assert cache.get_or_compute("plan", {"a": 1}, compute) == {"plan": 1}
+    st = cache.stats()["plan"]
+    assert st["misses"] == 1 and st["hits"] + st["coalesced"] == 8
+    # SQLite dùng chung: cache mới (worker khác / sau restart) đọc được
+    assert LLMCache(str(tmp_path / "llm.db")).get_or_compute("plan", {"a": 1}, compute) == {"plan": 1}
+
+
+def test_value_is_cached_before_leaving_inflight():
+    cache = LLMCache()
+    seen = []
+    put = cache._put
+
+    def spy(key, *a):
+        seen.append(key in cache._inflight)
+        put(key, *a)
+
+    cache._put = spy
+    cache.get_or_compute("chat", {"q": "x"}, lambda: "hi")
+    assert seen == [True] and cache._inflight == {}
+
+
+def test_leader_rechecks_cache_and_errors_are_not_cached():
+    cache = LLMCache()
+    cache.store("chat", {"q": "x"}, "cached")
+    # lượt _get() đầu miss (vd. leader trước vừa ghi xong) → leader mới thấy cache, không gọi model
+    real_get, misses = cache._get, [1]
+
+    def get_once_stale(key):
+        if misses:
+            misses.pop()
+            return False, None
+        return real_get(key)
+
+    cache._get = get_once_stale
+    assert cache.get_or_compute("chat", {"q": "x"}, lambda: pytest.fail("model called")) == "cached"
+
+    def boom():
+        raise RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("chat", {"q": "y"}, boom)
+    assert cache.get_or_compute("chat", {"q": "y"}, lambda: "ok") == "ok"
+    assert cache.get_or_compute("chat", {"q": "z"}, lambda: "", should_cache=bool) == ""
+    assert cache.lookup("chat", {"q": "z"}) == (False, None)
@@ -0,0 +1,114 @@
+import json
+
+import httpx
+
+from cashybear.outbox import HookDispatcher, enqueue
+from conftest import FakeEngine
+
+
+class FakeOutbox(FakeEngine):
+    """hook_outbox in memory; interprets the dispatcher's statements against a fake clock"""
+
+    def __init__(self):
+        super().__init__(handle=self._handle)
+        self.now = 0.0
+        self.rows = {}
+
+    def _handle(self, sql, params):
+        sql = " ".join(sql.split())
+        if sql.startswith("INSERT INTO hook_outbox"):
+            for p in params:
+                rid = len(self.rows) + 1
+                self.rows[rid] = {"id": rid, "path": p["path"], "payload": json.loads(p["payload"]), "attempts": 0, "next": self.now, "delivered": False, "last_error": None, "created": self.now}
+            return []
+        if "FOR UPDATE SKIP LOCKED" in sql:
+            due = [r for r in self.rows.values() if not r["delivered"] and r["attempts"] < params["max"] and r["next"] <= self.now]
+            due = sorted(due, key=lambda r: r["id"])[: params["lim"]]
+            for r in due:
+                r["next"] = self.now + params["lease"]  # lease
+            return [{k: r[k] for k in ("id", "path", "payload", "attempts")} for r in due]
+        if "SET delivered_at = NOW()" in sql:
+            for rid in params["ids"]:
+                self.rows[rid].update(delivered=True, attempts=self.rows[rid]["attempts"] + 1, last_error=None)
+            return []
+        if "last_error = :err" in sql:
+            for p in params:
+                r = self.rows[p["id"]]
+                r.update(attempts=r["attempts"] + 1, last_error=p["err"], next=self.now + p["delay"])
+            return []
+        if "COUNT(*) FILTER" in sql:
+            open_rows = [r for r in self.rows.values() if not r["delivered"]]
+            pending = [r for r in open_rows if r["attempts"] < params["max"]]
+            return {
+                "pending": len(pending),
+                "dead": len(open_rows) - len(pending),
+                "oldest_pending_secs": self.now - min((r["created"] for r in pending), default=self.now),
+            }
+        raise AssertionError(f"unexpected SQL: {sql[:80]}")
+
+
+def _client(status_for):
+    posted = []
+
+    def handler(request):
+        posted.append(request.url.path)
+        return httpx.Response(status_for(request.url.path))
+
+    return httpx.Client(transport=httpx.MockTransport(handler)), posted
+
+
+def _setup(**kw):
+    db = FakeOutbox()
+    with db.begin() as conn:
+        enqueue(conn, [("/hooks/plan", {"planId": "p1"}), ("/hooks/chat", {"n": 1})])
+    return db, HookDispatcher(lambda: db, "http://node:4000/", **kw)
+
+
+def test_delivers_batch_and_lease_blocks_reclaim():
+    db, disp = _setup(batch_size=1, lease_secs=60)
+    client, posted = _client(lambda path: 200)
+    assert disp.drain_once(client) == 1 and posted == ["/hooks/plan"]
+    # dòng đang được gửi bởi worker khác (lease) không bị lấy lại
+    claimed = disp._claim(db)
+    assert [r["id"] for r in claimed] == [2]
+    assert disp._claim(db) == []
+    db.now += 61
+    assert disp.drain_once(client) == 1 and posted == ["/hooks/plan", "/hooks/chat"]
+    assert disp.delivered == 2 and all(r["delivered"] for r in db.rows.values())
+
+
+def test_failures_back_off_exponentially_then_dead_letter():
+    db, disp = _setup(max_attempts=4)
+    client, posted = _client(lambda path: 500 if path == "/hooks/chat" else 200)
+    assert disp.drain_once(client) == 2
+    chat = db.rows[2]
+    delays = []
+    while chat["attempts"] < disp.max_attempts:
+        delays.append(chat["next"] - db.now)
+        assert disp.drain_once(client) == 0  # chưa tới hạn retry
+        db.now = chat["next"]
+        assert disp.drain_once(client) == 1
+    assert delays == [1, 2, 4]  # 2^attempts giây
+    assert "500" in chat["last_error"] and disp.failed == 4 and disp.delivered == 1
+    # hết max_attempts → dead-letter: không còn được claim
+    db.now += 10_000
+    assert disp.drain_once(client) == 0
+    st = disp.stats()
+    assert st["pending"] == 0 and st["dead"] == 1 and st["delivered"] == 1 and st["failed_attempts"] == 4
+    assert posted.count("/hooks/chat") == 4
+
+
+def test_backoff_is_capped():
+    db, disp = _setup(max_attempts=50)
+    client, _ = _client(lambda path: 503)
+    db.rows[1]["attempts"] = 20
+    db.rows[2]["delivered"] = True
+    disp.drain_once(client)
+    assert db.rows[1]["next"] - db.now == 600
+
+
+def test_no_engine_is_a_noop():
+    disp = HookDispatcher(lambda: None, "http://node")
+    client, posted = _client(lambda path: 200)
+    assert disp.drain_once(client) == 0 and posted == []
+    assert disp.stats()["delivered"] == 0 and "pending" not in disp.stats()
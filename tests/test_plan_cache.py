@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from zalo_bridge import PlanSummaryCache
+
+
+def _fetcher(calls, delay=0.0):
+    async def fetch(cid):
+        calls.append(cid)
+        await asyncio.sleep(delay)
+        return {"planId": f"p{cid}", "n": len(calls)}
+    return fetch
+
+
+def test_hit_coalesce_and_ttl():
+    calls = []
+
+    async def run():
+        cache = PlanSummaryCache(_fetcher(calls, 0.02), ttl_secs=0.1)
+        a, b = await asyncio.gather(cache.get(1), cache.get(1))
+        c = await cache.get(1)
+        await asyncio.sleep(0.15)
+        d = await cache.get(1)
+        return cache, a, b, c, d
+
+    cache, a, b, c, d = asyncio.run(run())
+    assert a == b == c and a["n"] == 1
+    assert d["n"] == 2  # hết TTL → fetch lại
+    assert cache.stats()["coalesced"] == 1 and cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_invalidate_during_fetch_is_not_cached():
+    calls = []
+
+    async def run():
+        cache = PlanSummaryCache(_fetcher(calls, 0.05))
+        task = asyncio.create_task(cache.get(7))
+        await asyncio.sleep(0.01)
+        cache.invalidate(7)  # plan vừa đổi trong lúc fetch cũ đang chạy
+        await task
+        await cache.get(7)
+        return cache
+
+    cache = asyncio.run(run())
+    assert calls == [7, 7]
+
+
+def test_lru_bound_and_errors_not_cached():
+    calls = []
+
+    async def failing(cid):
+        calls.append(cid)
+        raise RuntimeError("down")
+
+    async def run():
+        cache = PlanSummaryCache(_fetcher([]), max_entries=2)
+        for cid in (1, 2, 3):
+            await cache.get(cid)
+        assert cache.stats()["entries"] == 2 and 1 not in cache._entries
+        assert cache.invalidate() == 2
+        bad = PlanSummaryCache(failing)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await bad.get(5)
+
+    asyncio.run(run())
+    assert calls == [5, 5]
+
+
+def test_invalidating_unknown_customers_keeps_no_state():
+    async def run():
+        cache = PlanSummaryCache(_fetcher([]))
+        for cid in range(1000):
+            assert cache.invalidate(cid) == 0
+        await cache.get(1)
+        assert cache.invalidate(1) == 1
+        assert cache._generation == {}
+        task = asyncio.create_task(cache.get(2))
+        await asyncio.sleep(0)
+        cache.invalidate(2)
+        await task
+        assert cache._generation == {} and 2 not in cache._entries
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import os
+
+from cashybear.profiles import ProfileCache
+from propensity import notify
+
+
+def _loader(calls):
+    def load(cid, ym):
+        calls.append((cid, ym))
+        return {"customer_id": cid, "n": len(calls)}
+    return load
+
+
+def test_hit_and_local_invalidate():
+    calls = []
+    cache = ProfileCache(_loader(calls))
+    assert cache.get(1, "2025-08")["n"] == 1
+    assert cache.get(1, "2025-08")["n"] == 1
+    assert cache.invalidate(1) == 1
+    assert cache.get(1, "2025-08")["n"] == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_epoch_bump_clears_other_workers(tmp_path):
+    epoch = str(tmp_path / "profiles.epoch")
+    a_calls, b_calls = [], []
+    a = ProfileCache(_loader(a_calls), epoch_path=epoch)
+    b = ProfileCache(_loader(b_calls), epoch_path=epoch)
+    b.get(7, "2025-08")
+    b.get(7, "2025-08")
+    assert len(b_calls) == 1
+    a.invalidate()  # worker A nhận /profiles/invalidate
+    b.get(7, "2025-08")
+    assert len(b_calls) == 2  # worker B thấy epoch mới → nạp lại
+
+
+def test_notify_posts_invalidate_and_refresh(monkeypatch):
+    posted = []
+    monkeypatch.setattr(notify, "_post", lambda path, payload, timeout: posted.append((path, payload)))
+    assert notify.notify_features_reloaded() == {"profiles": True, "signals": True}
+    assert notify.notify_features_reloaded(customer_id=5, refresh_signals=False) == {"profiles": True, "signals": False}
+    assert posted == [("/profiles/invalidate", {}), ("/signals/refresh", {}), ("/profiles/invalidate", {"customerId": 5})]
+
+
+def test_notify_falls_back_to_epoch_file(monkeypatch, tmp_path):
+    epoch = tmp_path / "profiles.epoch"
+    epoch.write_text("")
+    monkeypatch.setattr(notify.config, "CASHYBEAR_PROFILE_EPOCH", str(epoch))
+
+    def down(path, payload, timeout):
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(notify, "_post", down)
+    calls = []
+    cache = ProfileCache(_loader(calls), epoch_path=str(epoch))
+    cache.get(1, "2025-08")
+    os.utime(epoch, (0, 0))  # đảm bảo mtime đổi rõ sau khi bump
+    cache._epoch = cache._read_epoch()
+    assert notify.notify_features_reloaded() == {"profiles": True, "signals": False}
+    cache.get(1, "2025-08")
+    assert len(calls) == 2
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from zalo_bridge import SendQueue
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _wait_until(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        await asyncio.sleep(0.01)
+
+
+def test_per_chat_order_and_results(tmp_path):
+    sent, results = [], []
+
+    async def send(chat_id, text):
+        await asyncio.sleep(0.001)
+        sent.append((chat_id, text))
+        return True
+
+    async def run():
+        q = SendQueue(str(tmp_path / "outbox.db"), send, workers=4, on_result=lambda *a: results.append(a))
+        await q.start()
+        ids = [q.enqueue(c, f"{c}-{i}", ref=f"conv-{c}-{i}") for i in range(5) for c in ("a", "b")]
+        await _wait_until(lambda: len(results) == len(ids))
+        await q.stop()
+        return ids
+
+    ids = _run(run())
+    assert [t for c, t in sent if c == "a"] == [f"a-{i}" for i in range(5)]
+    assert [t for c, t in sent if c == "b"] == [f"b-{i}" for i in range(5)]
+    assert sorted(r[0] for r in results) == sorted(ids)
+    assert all(ok for _, _, ok, _ in results)
+    assert {ref for _, _, _, ref in results} == {f"conv-{c}-{i}" for i in range(5) for c in ("a", "b")}
+
+
+def test_retry_then_dead_letter_does_not_block_chat(tmp_path):
+    calls = []
+
+    async def send(chat_id, text):
+        calls.append(text)
+        return text != "bad"
+
+    async def run():
+        results = []
+        q = SendQueue(str(tmp_path / "outbox.db"), send, max_attempts=3, base_delay=0.01, max_delay=0.02,
+                      poll_interval=0.05, on_result=lambda *a: results.append(a))
+        await q.start()
+        bad = q.enqueue("c", "bad")
+        good = q.enqueue("c", "good")
+        await _wait_until(lambda: len(results) == 2)
+        row = q.get(bad)
+        stats = q.stats()
+        await q.stop()
+        return bad, good, row, stats, results
+
+    bad, good, row, stats, results = _run(run())
+    assert calls == ["bad", "bad", "bad", "good"]
+    assert row["status"] == "failed" and row["attempts"] == 3
+    assert stats["failed"] == 1 and stats["sent"] == 1
+    assert [(r[0], r[2]) for r in results] == [(bad, False), (good, True)]
+
+
+def test_pending_rows_replay_with_ref_after_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+
+    async def never(chat_id, text):
+        await asyncio.sleep(3600)
+
+    async def first_run():
+        q = SendQueue(path, never)
+        await q.start()
+        msg_id = q.enqueue("c", "hello", ref="42")
+        await asyncio.sleep(0.05)
+        # drain task đang treo trong send → stop() phải hủy nó rồi mới đóng DB
+        t0 = time.monotonic()
+        await q.stop(timeout=0.1)
+        assert time.monotonic() - t0 < 2
+        assert not q._tasks
+        return msg_id
+
+    msg_id = _run(first_run())
+    results = []
+
+    async def ok(chat_id, text):
+        return True
+
+    async def second_run():
+        q = SendQueue(path, ok, on_result=lambda *a: results.append(a))
+        assert q.get(msg_id)["status"] == "pending"
+        await q.start()
+        await _wait_until(lambda: results)
+        await q.stop()
+
+    _run(second_run())
+    assert results == [(msg_id, "c", True, "42")]
+
+
+def test_bridge_marks_conversation_delivered_after_restart(bridge):
+    conv = bridge.save_conversation("u1", "User", "chat1", "hi", "", {})
+    outbox_id = bridge.queue_reply("chat1", "reply", conv)
+    assert bridge.SEND_QUEUE.get(outbox_id)["ref"] == str(conv["id"])
+
+    # restart: store mới đọc lại từ SQLite, không còn map outbox → conversation trong RAM
+    bridge.CONVERSATIONS = bridge.ConversationStore(db_path=bridge.CONVERSATION_DB_PATH)
+    bridge._on_outbox_result(outbox_id, "chat1", True, str(conv["id"]))
+    reloaded = bridge.ConversationStore(db_path=bridge.CONVERSATION_DB_PATH).get(conv["id"])
+    assert reloaded["manual_reply_sent"] is True
+    assert reloaded["send_attempts"][-1]["outbox_id"] == outbox_id
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from cashybear import sessions
+from cashybear.sessions import MemorySessionStore, SessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(ttl_secs=3600.0, history_limit=40):
+        if request.param == "memory":
+            return MemorySessionStore(ttl_secs, history_limit)
+        return SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl_secs, history_limit, expire_every=0.0)
+    return make
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_missing_session_is_fresh(make_store):
+    store = make_store()
+    assert store.load("s1") == sessions.new_session()
+    assert store.peek("s1") is None
+
+
+def test_save_load_and_history_limit(make_store):
+    store = make_store(history_limit=3)
+    st = store.load("s1")
+    st["history"] = [{"role": "user", "content": str(i)} for i in range(5)]
+    st["phase"] = "awaiting_horizon"
+    store.save("s1", st)
+    got = store.load("s1")
+    assert got["phase"] == "awaiting_horizon"
+    assert [h["content"] for h in got["history"]] == ["2", "3", "4"]
+    assert store.stats()["sessions"] == 1
+
+
+def test_expired_session_starts_over(make_store):
+    store = make_store(ttl_secs=0.05)
+    st = store.load("s1")
+    st["goal_amount"] = 5_000_000
+    store.save("s1", st)
+    assert store.peek("s1")["goal_amount"] == 5_000_000
+    time.sleep(0.08)
+    assert store.peek("s1") is None
+    assert store.load("s1") == sessions.new_session()
+    assert store.stats()["sessions"] == 0
+
+
+def test_touch_extends_deadline(make_store):
+    store = make_store(ttl_secs=0.15)
+    store.save("s1", store.load("s1"))
+    time.sleep(0.1)
+    store.save("s1", store.load("s1"))  # lưu lại → deadline mới
+    time.sleep(0.1)
+    assert store.peek("s1") is not None
+
+
+def test_make_session_store_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(sessions.config, "SESSION_BACKEND", "memory")
+    assert isinstance(sessions.make_session_store(), MemorySessionStore)
+    monkeypatch.setattr(sessions.config, "SESSION_BACKEND", "sqlite")
+    monkeypatch.setattr(sessions.config, "SESSION_DB_PATH", str(tmp_path / "s.db"))
+    assert isinstance(sessions.make_session_store(), SQLiteSessionStore)
+    monkeypatch.setattr(sessions.config, "SESSION_BACKEND", "redis")
+    with pytest.raises(ValueError):
+        sessions.make_session_store()
@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from datetime import date
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from cashybear import api, db
+from cashybear.invalidate import SummaryInvalidator
+from cashybear.spend import SpendIngestor, make_event, week_start
+from conftest import FakeEngine
+
+
+class FakeSpendDB(FakeEngine):
+    """Applies _INGEST_SQL to in-memory day/week totals like the SQL does (event_id idempotent)"""
+
+    def __init__(self, rec_week=None):
+        super().__init__(handle=self._handle)
+        self.rec_week = rec_week
+        self.events = {}
+        self.ingests = 0
+        self.fail = False
+
+    def _handle(self, sql, params):
+        if "jsonb_to_recordset" in sql:
+            if self.fail:
+                raise RuntimeError("db down")
+            self.ingests += 1
+            rows = json.loads(params["rows"])
+            new = [r for r in rows if r["event_id"] not in self.events]
+            self.events.update((r["event_id"], r) for r in new)
+            return {"inserted": len(new), "days": 0, "weeks": 0}
+        if "persona_spend_daily" in sql and "day_amount" in sql:
+            cid, day = params["cid"], params["day"].isoformat()
+            wk = params["week"].isoformat()
+            d = [e for e in self.events.values() if e["customer_id"] == cid and e["date"] == day]
+            w = [e for e in self.events.values() if e["customer_id"] == cid and week_start(date.fromisoformat(e["date"])).isoformat() == wk]
+            return {
+                "day_amount": sum(e["amount"] for e in d) or None, "day_events": len(d) or None,
+                "week_amount": sum(e["amount"] for e in w) or None, "week_events": len(w) or None,
+            }
+        if "FROM persona_plans" in sql:
+            if self.rec_week is None:
+                return None
+            return {"plan_id": "p", "created_at": None, "weekly_cap_save": None, "recommended_weekly_save": self.rec_week, "target_amount": None}
+        raise AssertionError(f"unexpected SQL: {sql[:80]}")
+
+
+MON = date(2025, 8, 4)
+
+
+def test_make_event_and_week_start():
+    ev = make_event(7, "2025-08-06T10:00:00", "12000", "food")
+    assert ev["customer_id"] == "7" and ev["date"] == "2025-08-06" and ev["amount"] == 12000.0
+    assert week_start(date(2025, 8, 10)) == MON and week_start(MON) == MON
+    with pytest.raises(ValueError):
+        make_event(7, "2025-13-01", 1)
+    with pytest.raises(ValueError):
+        make_event(7, "2025-08-01", float("nan"))
+
+
+def test_ingestor_buffers_totals_and_flushes():
+    fake = FakeSpendDB()
+    ing = SpendIngestor(lambda: fake, batch_size=2, max_buffer=3)
+    for day, amt in (("2025-08-04", 10.0), ("2025-08-04", 5.0), ("2025-08-06", 7.0)):
+        assert ing.submit(make_event(1, day, amt))
+    assert not ing.submit(make_event(1, "2025-08-04", 1.0))  # buffer đầy → caller ghi đồng bộ
+    assert ing.rejected == 1
+
+    # chưa flush: totals = DB (0) + phần buffer của worker này
+    with fake.connect() as conn:
+        t = ing.totals(conn, 1, MON)
+    assert (t["day_amount"], t["day_events"], t["week_amount"], t["week_events"]) == (15.0, 2, 22.0, 3)
+
+    assert ing.flush() == 2 and ing.flush() == 1 and ing.flush() == 0
+    assert ing.pending(1, MON) == (0, 0, 0, 0)
+    with fake.connect() as conn:
+        t = ing.totals(conn, 1, MON)
+    assert (t["day_amount"], t["week_amount"], t["week_events"]) == (15.0, 22.0, 3)
+
+
+def test_failed_flush_requeues_in_order_and_retry_is_idempotent():
+    fake = FakeSpendDB()
+    ing = SpendIngestor(lambda: fake, batch_size=10)
+    evs = [make_event(1, "2025-08-04", a) for a in (1.0, 2.0, 3.0)]
+    for ev in evs:
+        ing.submit(ev)
+    fake.fail = True
+    with pytest.raises(RuntimeError):
+        ing.flush()
+    assert ing.failed_flushes == 1 and list(ing._buf) == evs
+    assert ing.pending(1, MON)[:2] == (6.0, 3)
+    fake.fail = False
+    ing.submit(evs[0])  # cùng event_id gửi lại → không cộng hai lần
+    assert ing.flush() == 4
+    assert len(fake.events) == 3
+
+
+def test_background_thread_flushes_and_stop_drains():
+    fake = FakeSpendDB()
+    ing = SpendIngestor(lambda: fake, batch_size=100, flush_secs=0.05)
+    ing.start()
+    try:
+        ing.submit(make_event(2, "2025-08-04", 4.0))
+        deadline = time.time() + 2
+        while not fake.events and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(fake.events) == 1
+    finally:
+        ing.stop()
+    assert not ing.running
+    ing.submit(make_event(2, "2025-08-04", 1.0))
+    ing.stop()  # thread đã dừng: stop vẫn ghi nốt phần còn lại
+    assert len(fake.events) == 2
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeSpendDB(rec_week=70_000)
+    notified = []
+    monkeypatch.setattr(db, "get_engine", lambda: fake)
+    monkeypatch.setattr(api, "SPEND", SpendIngestor(lambda: fake, batch_size=100, flush_secs=60))
+    monkeypatch.setattr(api, "_notify_plan_summary_changed", lambda cid: notified.append(cid))
+    return TestClient(api.app), fake, notified
+
+
+def test_spend_log_queued_then_summary(client):
+    c, fake, notified = client
+    api.SPEND.start()
+    try:
+        r = c.post("/spend/log", json={"customerId": 3, "date": "2025-08-04", "amount": 6000})
+        assert r.json()["ok"] and r.json()["queued"] and notified == [3]
+        assert fake.ingests == 0
+        s = c.get("/spend/summary", params={"customerId": 3, "day": "2025-08-04"}).json()
+        assert s["todaySpend"] == 6000.0 and s["dailyTarget"] == 10_000.0 and s["status"] == "within"
+    finally:
+        api.SPEND.stop()
+    assert len(fake.events) == 1
+
+
+def test_spend_log_return_totals_writes_through(client):
+    c, fake, _ = client
+    api.SPEND.start()
+    try:
+        c.post("/spend/log", json={"customerId": 3, "date": "2025-08-04", "amount": 6000, "returnTotals": False})
+        r = c.post("/spend/log", json={"customerId": 3, "date": "2025-08-05", "amount": 7000, "returnTotals": True}).json()
+    finally:
+        api.SPEND.stop()
+    # returnTotals: ghi ngay (không buffer) để worker khác cũng đọc được tổng
+    assert r["queued"] is False and fake.ingests >= 1
+    sp = r["spend"]
+    assert sp["date"] == "2025-08-05" and sp["weekStart"] == "2025-08-04"
+    assert sp["todaySpend"] == 7000.0 and sp["weekSpend"] == 13_000.0 and sp["weekEvents"] == 2
+    assert sp["status"] == "within" and sp["overBy"] == pytest.approx(-3000.0)
+
+
+def test_spend_log_rejects_bad_input(client):
+    c, _, _ = client
+    assert c.post("/spend/log", json={"customerId": 3, "date": "yesterday", "amount": 1}).status_code == 422
+    assert c.get("/spend/summary", params={"customerId": 3, "day": "nope"}).status_code == 422
+
+
+def test_invalidator_coalesces_per_customer():
+    posts = []
+    done = threading.Event()
+
+    def handler(request):
+        posts.append(json.loads(request.content)["customerIds"])
+        done.set()
+        return httpx.Response(200, json={"ok": True})
+
+    inv = SummaryInvalidator("http://bridge/plan_summary/invalidate", debounce_secs=0.1, transport=httpx.MockTransport(handler))
+    for cid in (1, 2, 1, 1, 3, 2):
+        inv.notify(cid)
+    assert done.wait(2)
+    inv.stop()
+    assert posts == [[1, 2, 3]]
+    st = inv.stats()
+    assert st["requested"] == 6 and st["sent"] == 3 and st["posts"] == 1 and st["pending"] == 0
+    assert threading.active_count() < 50  # 1 thread cho cả worker, không phải 1 thread / request
+
+
+def test_invalidator_failure_is_counted_not_retried():
+    class Down:
+        def post(self, url, json):
+            raise httpx.ConnectError("down")
+
+    inv = SummaryInvalidator("http://bridge/x")
+    inv._pending.update({5, 6})
+    assert inv.flush(Down()) == 2
+    assert inv.failed_posts == 1 and inv.pending() == 0 and "down" in inv.last_error
+
+
+def test_bridge_invalidate_accepts_batched_ids(bridge):
+    c = TestClient(bridge.app)
+    for cid in (1, 2, 3):
+        bridge.PLAN_SUMMARIES._put(cid, {"planId": cid})
+    assert c.post("/plan_summary/invalidate", json={"customerIds": [1, 2]}).json()["dropped"] == 2
+    assert c.post("/plan_summary/invalidate", json={"customerIds": []}).json()["dropped"] == 0
+    assert c.post("/plan_summary/invalidate", json={}).json()["dropped"] == 1
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from zalo_bridge import WebhookDeduplicator, webhook_key
+
+
+def test_webhook_key_prefers_ids_then_hash():
+    assert webhook_key({"event_id": "e1", "message": {"message_id": "m1"}}) == "id:e1"
+    assert webhook_key({"message": {"message_id": "m1"}}) == "id:m1"
+    a = {"event_name": "message.text.received", "timestamp": 1, "message": {"text": "hi", "from": {"id": "u"}, "chat": {"id": "c"}}}
+    b = {**a, "message": {**a["message"], "text": "hello"}}
+    assert webhook_key(a).startswith("h:") and webhook_key(a) == webhook_key(dict(a))
+    assert webhook_key(a) != webhook_key(b)
+    # không id, không timestamp → không dedup được
+    assert webhook_key({"message": {"text": "hi"}}) is None
+
+
+def test_duplicate_returns_stored_result_and_concurrent_calls_coalesce():
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"reply": "ok"}
+
+    async def run():
+        d = WebhookDeduplicator(ttl_secs=60)
+        first, second = await asyncio.gather(d.run_once("k", handler), d.run_once("k", handler))
+        third = await d.run_once("k", handler)
+        none_key = await d.run_once(None, handler)
+        return d, first, second, third, none_key
+
+    d, first, second, third, none_key = asyncio.run(run())
+    assert first == ({"reply": "ok"}, False)
+    assert second == ({"reply": "ok"}, True) and third == ({"reply": "ok"}, True)
+    assert none_key == ({"reply": "ok"}, False)
+    assert len(calls) == 2  # "k" một lần + key None
+    assert d.stats()["hits"] == 2 and d.stats()["misses"] == 1
+
+
+def test_failed_handler_is_not_remembered():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return "done"
+
+    async def run():
+        d = WebhookDeduplicator()
+        with pytest.raises(RuntimeError):
+            await d.run_once("k", flaky)
+        return await d.run_once("k", flaky)
+
+    assert asyncio.run(run()) == ("done", False)
+
+
+def test_keys_survive_restart_and_expire(tmp_path):
+    path = str(tmp_path / "dedup.db")
+
+    async def handler():
+        return {"n": 1}
+
+    async def run():
+        await WebhookDeduplicator(ttl_secs=60, db_path=path).run_once("k", handler)
+        again = await WebhookDeduplicator(ttl_secs=60, db_path=path).run_once("k", handler)
+        d = WebhookDeduplicator(ttl_secs=0.05, db_path=path)
+        d._done.clear()
+        time.sleep(0.1)
+        expired = await d.run_once("k", handler)
+        return again, expired
+
+    again, expired = asyncio.run(run())
+    assert again == ({"n": 1}, True)
+    assert expired == ({"n": 1}, False)
+
+
+def test_db_hit_keeps_memory_in_time_order(tmp_path):
+    path = str(tmp_path / "dedup.db")
+
+    async def handler():
+        return "r"
+
+    async def run():
+        await WebhookDeduplicator(ttl_secs=60, db_path=path).run_once("old", handler)
+        d = WebhookDeduplicator(ttl_secs=60, max_keys=2, db_path=path)
+        await asyncio.sleep(0.01)
+        await d.run_once("new", handler)
+        # "old" có created_at cũ hơn "new" → đọc từ SQLite nhưng không chèn ra sau "new"
+        assert await d.run_once("old", handler) == ("r", True)
+        assert list(d._done) == ["new"]
+        ts = [t for t, _ in d._done.values()]
+        assert ts == sorted(ts)
+
+        fresh = WebhookDeduplicator(ttl_secs=60, max_keys=1, db_path=path)
+        await fresh.run_once("old", handler)
+        await fresh.run_once("new", handler)
+        assert list(fresh._done) == ["new"]  # max_keys áp dụng cả cho key nạp từ SQLite
+
+    asyncio.run(run())
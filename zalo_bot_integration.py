@@ -6,23 +6,98 @@ Handles webhook from Zalo Bot and forwards to CashyBear API
 
 import asyncio
 import json
-import requests
+import os
+import ssl
+from contextlib import asynccontextmanager
+import httpx
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.routing import APIRoute
 import uvicorn
+from zalo_bridge import ConversationStore, PlanSummaryCache, SendQueue, WebhookDeduplicator, webhook_key
+from telemetry import CONTENT_TYPE, Registry, TraceMiddleware, Tracer
 from typing import Dict, Any, Optional, List
 import logging
 import time
 
 # Zalo Bot Configuration
 ZALO_BOT_TOKEN = "KeyChatbot"
-ZALO_API_BASE = "https://bot-api.zapps.me/bot"
-CASHYBEAR_API_BASE = "http://127.0.0.1:8010"
+ZALO_API_BASE = os.getenv("ZALO_API_BASE", "https://bot-api.zapps.me/bot")  # bench: http://127.0.0.1:8099/bot
+CASHYBEAR_API_BASE = os.getenv("CASHYBEAR_API_BASE", "http://127.0.0.1:8010")
+
+# 📮 Outbound send queue (SQLite journal, sống sót qua restart)
+OUTBOX_DB_PATH = "zalo_outbox.db"
+OUTBOX_WORKERS = 16
+OUTBOX_MAX_ATTEMPTS = 6
+
+# 💾 Conversation store: ring buffer theo user + SQLite (None = chỉ giữ trong RAM)
+CONVERSATION_DB_PATH: Optional[str] = "zalo_conversations.db"
+CONVERSATION_PER_USER = 50
+CONVERSATION_MAX_USERS = 50_000
+CONVERSATION_KEEP_PAYLOAD = False  # True: lưu cả webhook_data gốc (debug)
+
+# ♻️ Idempotency cho webhook Zalo gửi lại (retry khi mình trả lời chậm)
+WEBHOOK_DEDUP_TTL_SECS = 6 * 3600
+WEBHOOK_DEDUP_DB_PATH: Optional[str] = "zalo_webhook_dedup.db"
+
+# 📊 Cache plan summary cho /trigger/spend (xóa khi accept plan / ghi chi tiêu)
+PLAN_SUMMARY_TTL_SECS = 300
+PLAN_SUMMARY_MAX_ENTRIES = 10_000
+
+# 🔌 HTTP connection pools: mỗi host một AsyncClient keep-alive dùng chung cho mọi request.
+# max_connections = giới hạn request đồng thời tới host đó; request vượt mức sẽ chờ tối đa `pool` giây.
+HTTP_POOLS: Dict[str, Dict[str, Any]] = {
+    "cashybear": {
+        "timeout": httpx.Timeout(30.0, connect=5.0, pool=10.0),
+        "max_connections": 64,
+        "max_keepalive": 32,
+    },
+    "zalo": {
+        "timeout": httpx.Timeout(12.0, connect=5.0, pool=10.0),
+        "max_connections": 32,
+        "max_keepalive": 16,
+    },
+}
+_HTTP_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(name: str, verify: bool = True) -> httpx.AsyncClient:
+    """Return the shared pooled client for `name` (created lazily on the running loop)"""
+    key = name if verify else f"{name}:insecure"
+    client = _HTTP_CLIENTS.get(key)
+    if client is None or client.is_closed:
+        cfg = HTTP_POOLS[name]
+        client = httpx.AsyncClient(
+            timeout=cfg["timeout"],
+            limits=httpx.Limits(
+                max_connections=cfg["max_connections"],
+                max_keepalive_connections=cfg["max_keepalive"],
+                keepalive_expiry=60.0,
+            ),
+            verify=verify,
+        )
+        _HTTP_CLIENTS[key] = client
+    return client
+
+
+async def close_http_clients():
+    clients = list(_HTTP_CLIENTS.values())
+    _HTTP_CLIENTS.clear()
+    for client in clients:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await SEND_QUEUE.start()
+    yield
+    await SEND_QUEUE.stop()
+    await close_http_clients()
+
 
 # FastAPI app for webhook
-app = FastAPI(title="Zalo Bot Webhook for CashyBear", version="1.0.0")
+app = FastAPI(title="Zalo Bot Webhook for CashyBear", version="1.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,16 +106,29 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# 📈 Prometheus metrics (GET /metrics) + stage timing của request chậm (GET /debug/slow)
+REGISTRY = Registry()
+TRACER = Tracer("zalo_bridge", REGISTRY)
+SEND_RESULTS = REGISTRY.counter("zalo_bridge_send_total", "zapps sendMessage attempts by outcome", ["outcome"])
+CASHYBEAR_CALLS = REGISTRY.counter("zalo_bridge_cashybear_calls_total", "CashyBear /chat/reply calls by outcome", ["outcome"])
+app.add_middleware(TraceMiddleware, tracer=TRACER)
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+WEBHOOK_DEDUP = WebhookDeduplicator(ttl_secs=WEBHOOK_DEDUP_TTL_SECS, db_path=WEBHOOK_DEDUP_DB_PATH)
+
 # Session mapping: Zalo User ID -> CashyBear Customer ID
 USER_MAPPING: Dict[str, int] = {}
 DEFAULT_CUSTOMER_ID = 1  # Fallback customer ID for demo
 
 # 💾 Conversation storage để debug và manual reply
-CONVERSATIONS: List[Dict[str, Any]] = []
+CONVERSATIONS = ConversationStore(
+    per_user_limit=CONVERSATION_PER_USER,
+    max_users=CONVERSATION_MAX_USERS,
+    db_path=CONVERSATION_DB_PATH,
+)
 LAST_CHAT_TARGET: Dict[str, Any] = {"chat_id": None, "user_id": None, "user_name": None}
 
 class ZaloMessage:
@@ -74,15 +162,15 @@ def save_conversation(user_id: str, user_name: str, chat_id: str, user_message:
         "user_message": user_message,
         "bot_reply": bot_reply,
         "customer_id": 1,
-        "webhook_data": webhook_data,
+        "event_name": (webhook_data or {}).get("event_name"),
+        "message_id": ((webhook_data or {}).get("message") or {}).get("message_id"),
         "send_attempts": [],
         "manual_reply_sent": False
     }
+    if CONVERSATION_KEEP_PAYLOAD:
+        conv["webhook_data"] = webhook_data
     
-    CONVERSATIONS.append(conv)
-    # Giữ chỉ 100 conversation gần nhất
-    if len(CONVERSATIONS) > 100:
-        CONVERSATIONS[:] = CONVERSATIONS[-100:]
+    CONVERSATIONS.add(conv)
     
     # Update last target
     try:
@@ -136,13 +224,14 @@ async def trigger_spend(payload: Dict[str, Any]):
             msg += f" cho {note}"
         msg += ". Cập nhật giúp nhé."
 
-        # Fetch current plan summary to compare against target
+        # Ghi khoản chi vào CashyBear; so sánh theo TỔNG chi hôm nay (bảng tổng hợp), không phải riêng khoản này
         plan_note = ""
+        totals = await log_spend(customer_id, amt, note) if amt is not None else None
+        if totals and totals.get("dailyTarget") is not None:
+            plan_note = _spend_plan_note(totals)
         try:
-            r = requests.get(f"{CASHYBEAR_API_BASE}/dashboard/todo", params={"customerId": customer_id}, timeout=8)
-            if r.status_code == 200:
-                dj = r.json()
-                summary = dj.get("summary", {}) if isinstance(dj, dict) else {}
+            summary = await PLAN_SUMMARIES.get(customer_id) if not plan_note else None
+            if summary:
                 rec_week = summary.get("recommendedWeeklySave")
                 weekly_cap = summary.get("weeklyCapSave")
                 # Approximate daily target from recommended weekly
@@ -180,18 +269,19 @@ async def trigger_spend(payload: Dict[str, Any]):
             enriched = msg + "\n" + plan_note + warning + "\nNhờ nhắc nếu mình lệch kế hoạch và gợi ý cách cân đối lại cho ngày/tuần này nhé."
 
         logger.info(f"🧩 Trigger spend → CashyBear: {enriched}")
-        cb = await call_cashybear_api(customer_id=customer_id, message=enriched, session_id=session_id, persona=persona)
+        # spend_logged: khoản chi đã ghi ở trên → CashyBear chỉ đọc tổng, không ghi lần hai
+        cb = await call_cashybear_api(customer_id=customer_id, message=enriched, session_id=session_id, persona=persona, spend_logged=totals is not None)
         reply_text = cb.get("reply", "Đã ghi nhận khoản chi tiêu.")
         if len(reply_text) > 1900:
             reply_text = reply_text[:1900] + "... (rút gọn)"
 
-        ok = await send_zalo_message(chat_id, reply_text)
-        return JSONResponse({"ok": bool(ok), "chat_id": chat_id, "reply": reply_text})
+        outbox_id = SEND_QUEUE.enqueue(chat_id, reply_text)
+        return JSONResponse({"ok": True, "queued": True, "outbox_id": outbox_id, "chat_id": chat_id, "reply": reply_text})
     except Exception as e:
         logger.error(f"/trigger/spend error: {e}")
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
-async def call_cashybear_api(customer_id: int, message: str, session_id: str, persona: str = "Angry Mom") -> Dict[str, Any]:
+async def call_cashybear_api(customer_id: int, message: str, session_id: str, persona: str = "Angry Mom", spend_logged: bool = False) -> Dict[str, Any]:
     """Call CashyBear chat API"""
     try:
         payload = {
@@ -199,31 +289,107 @@ async def call_cashybear_api(customer_id: int, message: str, session_id: str, pe
             "persona": persona,
             "sessionId": session_id,
             "message": message,
+            "spendLogged": spend_logged,
             "currentDate": "2025-01-17T10:00:00Z",  # Current timestamp
             "timezone": "Asia/Ho_Chi_Minh"
         }
         
-        response = requests.post(
-            f"{CASHYBEAR_API_BASE}/chat/reply",
-            json=payload,
-            timeout=30
-        )
+        with TRACER.span("cashybear.chat"):
+            response = await get_http_client("cashybear").post(
+                f"{CASHYBEAR_API_BASE}/chat/reply",
+                json=payload
+            )
         
         if response.status_code == 200:
+            CASHYBEAR_CALLS.inc(outcome="ok")
             return response.json()
         else:
+            CASHYBEAR_CALLS.inc(outcome="http_error")
             logger.error(f"CashyBear API error: {response.status_code} - {response.text}")
             return {"reply": "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau."}
     
     except Exception as e:
+        CASHYBEAR_CALLS.inc(outcome="exception")
         logger.error(f"Error calling CashyBear API: {e}")
         return {"reply": "Xin lỗi, tôi không thể kết nối đến hệ thống. Vui lòng thử lại sau."}
 
+async def log_spend(customer_id: int, amount: float, note: str = "") -> Optional[Dict[str, Any]]:
+    """POST /spend/log kèm tổng chi hôm nay/tuần này; None khi CashyBear lỗi"""
+    try:
+        with TRACER.span("cashybear.spend_log"):
+            r = await get_http_client("cashybear").post(
+                f"{CASHYBEAR_API_BASE}/spend/log",
+                json={"customerId": customer_id, "date": time.strftime("%Y-%m-%d"), "amount": amount, "category": "zalo", "note": note, "returnTotals": True},
+                timeout=8,
+            )
+        r.raise_for_status()
+        dj = r.json()
+        CASHYBEAR_CALLS.inc(outcome="ok" if dj.get("ok") else "http_error")
+        return dj.get("spend") if dj.get("ok") else None
+    except Exception as e:
+        CASHYBEAR_CALLS.inc(outcome="exception")
+        logger.warning(f"Log spend error: {e}")
+        return None
+
+def _spend_plan_note(totals: Dict[str, Any]) -> str:
+    weekly = float(totals["weeklyTarget"])
+    daily = float(totals["dailyTarget"])
+    today = float(totals.get("todaySpend") or 0.0)
+    head = f"Theo kế hoạch ~{weekly:,.0f} VND/tuần (~{daily:,.0f} VND/ngày). Hôm nay mình đã chi tổng {today:,.0f} VND ({int(totals.get('todayEvents') or 0)} khoản), tuần này {float(totals.get('weekSpend') or 0.0):,.0f} VND."
+    if totals.get("status") == "over":
+        return (head + f" Hôm nay mình đang vượt khoảng {today - daily:,.0f} VND.").replace(",", ".")
+    return (head + f" Hôm nay vẫn trong mức (dư {daily - today:,.0f} VND).").replace(",", ".")
+
+async def fetch_plan_summary(customer_id: int) -> Optional[Dict[str, Any]]:
+    """Plan header projection from CashyBear (None when the customer has no plan)"""
+    client = get_http_client("cashybear")
+    with TRACER.span("cashybear.plan_summary"):
+        return await _fetch_plan_summary(client, customer_id)
+
+async def _fetch_plan_summary(client: httpx.AsyncClient, customer_id: int) -> Optional[Dict[str, Any]]:
+    r = await client.get(f"{CASHYBEAR_API_BASE}/dashboard/summary", params={"customerId": customer_id}, timeout=8)
+    if r.status_code == 404:
+        # CashyBear cũ chưa có /dashboard/summary: chiếu từ /dashboard/todo
+        r = await client.get(f"{CASHYBEAR_API_BASE}/dashboard/todo", params={"customerId": customer_id, "includeTasks": "false"}, timeout=8)
+        r.raise_for_status()
+        dj = r.json()
+        if not isinstance(dj, dict) or not dj.get("planId"):
+            return None
+        summary = dj.get("summary") or {}
+        return {
+            "planId": dj.get("planId"),
+            "recommendedWeeklySave": summary.get("recommendedWeeklySave"),
+            "weeklyCapSave": summary.get("weeklyCapSave"),
+            "targetAmount": summary.get("targetAmount"),
+        }
+    r.raise_for_status()
+    dj = r.json()
+    return dj if isinstance(dj, dict) and dj.get("planId") else None
+
+
+PLAN_SUMMARIES = PlanSummaryCache(fetch_plan_summary, ttl_secs=PLAN_SUMMARY_TTL_SECS, max_entries=PLAN_SUMMARY_MAX_ENTRIES)
+
+def _is_ssl_error(exc: BaseException) -> bool:
+    """httpx wraps TLS failures in ConnectError; walk the cause chain to find them"""
+    while exc is not None:
+        if isinstance(exc, ssl.SSLError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
 async def send_zalo_message(chat_id: str, text: str) -> bool:
     """Send message via Zalo Bot Creator (zapps.me) sendMessage API.
     Spec per docs: POST https://bot-api.zapps.me/bot{BOT_TOKEN}/sendMessage
     Body: { chat_id: string, text: string }
     """
+    # Chạy trong worker của send queue → trace riêng, gắn chat_id để nối với webhook
+    with TRACER.trace("zalo.send", chat_id=chat_id):
+        ok, outcome = await _send_zalo_message(chat_id, text)
+    SEND_RESULTS.inc(outcome=outcome)
+    return ok
+
+async def _send_zalo_message(chat_id: str, text: str):
+    """(ok, outcome) cho counter zalo_bridge_send_total"""
     try:
         # Spec: https://bot-api.zapps.me/bot{BOT_TOKEN}/sendMessage (no slash between 'bot' and token)
         url = f"{ZALO_API_BASE}{ZALO_BOT_TOKEN}/sendMessage"
@@ -233,18 +399,15 @@ async def send_zalo_message(chat_id: str, text: str) -> bool:
         logger.info(f"📤 Sending to Zalo (zapps): {url}")
         logger.info(f"📦 Payload: {json.dumps(payload, ensure_ascii=False)}")
 
-        # Try normal TLS first
+        # Try normal TLS first (httpx verifies against the certifi bundle)
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=12)
-        except requests.exceptions.SSLError as ssl_err:
-            logger.warning(f"⚠️ SSL verify failed: {ssl_err}. Retrying with system CA fallback...")
-            # Retry with certifi CA bundle if available
-            try:
-                import certifi
-                response = requests.post(url, json=payload, headers=headers, timeout=12, verify=certifi.where())
-            except Exception as e2:
-                logger.warning(f"⚠️ certifi retry failed: {e2}. Last resort retry with verify=False")
-                response = requests.post(url, json=payload, headers=headers, timeout=12, verify=False)
+            response = await get_http_client("zalo").post(url, json=payload, headers=headers)
+        except httpx.ConnectError as conn_err:
+            if not _is_ssl_error(conn_err):
+                raise
+            logger.warning(f"⚠️ SSL verify failed: {conn_err}. Last resort retry with verify=False")
+            SEND_RESULTS.inc(outcome="ssl_retry")
+            response = await get_http_client("zalo", verify=False).post(url, json=payload, headers=headers)
 
         logger.info(f"📨 Response status: {response.status_code}")
         logger.info(f"📨 Response body: {response.text}")
@@ -257,25 +420,76 @@ async def send_zalo_message(chat_id: str, text: str) -> bool:
             ok = bool(data.get("ok"))
             if not ok:
                 logger.warning(f"⚠️ Zapps sendMessage returned error: {data}")
-            return ok
+            return ok, ("ok" if ok else "api_error")
 
         logger.error(f"❌ Zapps sendMessage HTTP error: {response.status_code}")
-        return False
+        return False, "http_error"
     except Exception as e:
         logger.error(f"❌ Error sending Zalo message: {e}")
-        return False
+        return False, "exception"
+
+def _on_outbox_result(outbox_id: int, chat_id: str, ok: bool, ref: Optional[str] = None):
+    """Called by the send queue once a reply is delivered or dead-lettered; ref = conversation id (lưu trong outbox)"""
+    conv = CONVERSATIONS.get(int(ref)) if ref else None
+    if conv is None:
+        return
+    attempts = conv.get("send_attempts", []) + [{"outbox_id": outbox_id, "ok": ok, "ts": time.time()}]
+    if ok:
+        CONVERSATIONS.update(conv, send_attempts=attempts, manual_reply_sent=True)
+        logger.info(f"✅ Delivered outbox #{outbox_id} to chat {chat_id}")
+    else:
+        CONVERSATIONS.update(conv, send_attempts=attempts)
+        logger.error(f"❌ Outbox #{outbox_id} dead-lettered. Conversation kept for manual response.")
+
+def queue_reply(chat_id: str, text: str, conv: Optional[Dict[str, Any]] = None) -> int:
+    """Persist a reply in the outbox; delivery happens in the background"""
+    outbox_id = SEND_QUEUE.enqueue(chat_id, text, ref=(conv.get("id") if conv is not None else None))
+    if conv is not None:
+        CONVERSATIONS.update(conv, outbox_id=outbox_id)
+    return outbox_id
+
+SEND_QUEUE = SendQueue(
+    OUTBOX_DB_PATH,
+    send_zalo_message,
+    workers=OUTBOX_WORKERS,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    on_result=_on_outbox_result,
+)
+
+REGISTRY.callback(
+    "zalo_bridge_cache_requests_total", "Webhook dedup / plan-summary cache lookups", "counter", ["cache", "result"],
+    lambda: {
+        ("webhook_dedup", "hit"): WEBHOOK_DEDUP.hits, ("webhook_dedup", "miss"): WEBHOOK_DEDUP.misses,
+        ("plan_summary", "hit"): PLAN_SUMMARIES.hits, ("plan_summary", "miss"): PLAN_SUMMARIES.misses,
+        ("plan_summary", "coalesced"): PLAN_SUMMARIES.coalesced,
+    },
+)
+REGISTRY.callback(
+    "zalo_bridge_outbox_messages", "Send queue rows by status", "gauge", ["status"],
+    lambda: {(k,): v for k, v in SEND_QUEUE.stats().items() if k in ("pending", "sent", "failed")},
+)
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"status": "ok", "service": "Zalo Bot Webhook for CashyBear"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/slow")
+async def debug_slow(limit: int = 20, name: Optional[str] = None):
+    """Request/send chậm nhất gần đây, tách theo stage (name: lọc, vd. webhook hoặc zalo.send)"""
+    return {"traces": TRACER.slowest(limit, name)}
+
 @app.get("/health")
 async def health_check():
     """Health check for monitoring"""
     # Test connection to CashyBear
     try:
-        response = requests.get(f"{CASHYBEAR_API_BASE}/health", timeout=5)
+        response = await get_http_client("cashybear").get(f"{CASHYBEAR_API_BASE}/health", timeout=5)
         cashybear_status = "ok" if response.status_code == 200 else "error"
     except:
         cashybear_status = "unreachable"
@@ -286,6 +500,51 @@ async def health_check():
         "timestamp": "2025-01-17T10:00:00Z"
     }
 
+async def process_text_message(user_id: str, user_name: Optional[str], chat_id: str, user_message: str, webhook_data: dict, save: bool = True) -> Dict[str, Any]:
+    """CashyBear round trip for one inbound text + queue the reply. Runs once per webhook key."""
+    logger.info(f"💬 Processing message from {user_name or user_id}: '{user_message}'")
+    
+    # Get customer ID (mặc định = 1)
+    customer_id = get_customer_id_for_user(user_id)
+    session_id = f"zalo_{user_id}"
+    TRACER.tag(chat_id=chat_id, session_id=session_id, customer_id=customer_id)
+    
+    logger.info(f"🚀 Calling CashyBear API: customer_id={customer_id}, message='{user_message[:50]}...'")
+    
+    # Call CashyBear API
+    cashybear_response = await call_cashybear_api(
+        customer_id=customer_id,
+        message=user_message,
+        session_id=session_id,
+        persona="Angry Mom"  # Default persona for Zalo
+    )
+    
+    reply_text = cashybear_response.get("reply", "Xin lỗi, tôi không hiểu. Vui lòng thử lại.")
+    logger.info(f"📨 CashyBear response: {reply_text[:100]}...")
+    if cashybear_response.get("planHint") == "accepted":
+        PLAN_SUMMARIES.invalidate(customer_id)
+    
+    # Truncate if too long for Zalo (max ~2000 chars)
+    if len(reply_text) > 1900:
+        reply_text = reply_text[:1900] + "... (tin nhắn đã được rút gọn)"
+    
+    # 💾 Lưu conversation để debug và manual reply
+    conv = None
+    if save:
+        conv = save_conversation(
+            user_id=user_id, 
+            user_name=user_name or "User", 
+            chat_id=chat_id, 
+            user_message=user_message, 
+            bot_reply=reply_text,
+            webhook_data=webhook_data
+        )
+    
+    # 🔄 Đưa automatic reply vào outbox (zapps sendMessage dùng chat_id), gửi nền
+    outbox_id = queue_reply(chat_id, reply_text, conv)
+    logger.info(f"📮 Queued auto reply #{outbox_id} to user {user_id}")
+    return {"outbox_id": outbox_id, "reply": reply_text}
+
 @app.post("/webhook-test/{test_id}")
 async def zalo_webhook_test(test_id: str, request: Request):
     """Handle Zalo Bot webhook test - now processes real messages"""
@@ -310,55 +569,21 @@ async def zalo_webhook_test(test_id: str, request: Request):
                 user_name = user_data.get("display_name", "User")
                 
                 if user_message and user_id:
-                    logger.info(f"💬 Processing message from {user_name}: '{user_message}'")
-                    
-                    # Get customer ID (mặc định = 1)
-                    customer_id = get_customer_id_for_user(user_id)
-                    session_id = f"zalo_{user_id}"
-                    
-                    logger.info(f"🚀 Calling CashyBear API: customer_id={customer_id}, message='{user_message[:50]}...'")
-                    
-                    # Call CashyBear API
-                    cashybear_response = await call_cashybear_api(
-                        customer_id=customer_id,
-                        message=user_message,
-                        session_id=session_id,
-                        persona="Angry Mom"
+                    result, duplicate = await WEBHOOK_DEDUP.run_once(
+                        webhook_key(webhook_data),
+                        lambda: process_text_message(user_id, user_name, chat_id, user_message, webhook_data),
                     )
-                    
-                    reply_text = cashybear_response.get("reply", "Xin lỗi, tôi không hiểu. Vui lòng thử lại.")
-                    logger.info(f"📨 CashyBear response: {reply_text[:100]}...")
-                    
-                    # Truncate if too long for Zalo
-                    if len(reply_text) > 1900:
-                        reply_text = reply_text[:1900] + "... (tin nhắn đã được rút gọn)"
-                    
-                    # 💾 Lưu conversation để debug và manual reply
-                    conv = save_conversation(
-                        user_id=user_id, 
-                        user_name=user_name, 
-                        chat_id=chat_id, 
-                        user_message=user_message, 
-                        bot_reply=reply_text,
-                        webhook_data=webhook_data
-                    )
-                    
-                    # 🔄 Thử gửi automatic reply (zapps sendMessage dùng chat_id)
-                    success = await send_zalo_message(chat_id, reply_text)
-                    
-                    if success:
-                        logger.info(f"✅ Successfully sent auto reply to user {user_id}")
-                        conv["manual_reply_sent"] = True
-                    else:
-                        logger.error(f"❌ Auto reply failed. Conversation saved for manual response.")
-                        logger.info(f"📋 Access /conversations to see pending messages")
+                    if duplicate:
+                        logger.info(f"♻️ Duplicate webhook from {user_id} acknowledged without calling CashyBear")
                     
                     return JSONResponse({
                         "ok": True,
                         "status": "success", 
-                        "message": "Message processed and replied",
+                        "message": "Message processed and reply queued",
                         "test_id": test_id,
-                        "sent_reply": success
+                        "queued": True,
+                        "outbox_id": result["outbox_id"],
+                        "duplicate": duplicate
                     })
         
         # Fallback for non-message events
@@ -416,42 +641,19 @@ async def zalo_webhook(request: Request):
             logger.warning("Missing user_id or message")
             return JSONResponse({"status": "error", "message": "Invalid message format"})
         
-        # Get customer ID for this Zalo user (mặc định = 1)
-        customer_id = get_customer_id_for_user(user_id)
-        
-        # Generate session ID (use Zalo user ID as session)
-        session_id = f"zalo_{user_id}"
-        
-        logger.info(f"🚀 Calling CashyBear API: customer_id={customer_id}, message='{user_message[:50]}...'")
-        
-        # Call CashyBear API
-        cashybear_response = await call_cashybear_api(
-            customer_id=customer_id,
-            message=user_message,
-            session_id=session_id,
-            persona="Angry Mom"  # Default persona for Zalo
-        )
-        
-        logger.info(f"📨 CashyBear response: {cashybear_response.get('reply', '')[:100]}...")
-        
-        # Extract reply from CashyBear
-        reply_text = cashybear_response.get("reply", "Xin lỗi, tôi không hiểu. Vui lòng thử lại.")
-        
-        # Truncate if too long for Zalo (max ~2000 chars)
-        if len(reply_text) > 1900:
-            reply_text = reply_text[:1900] + "... (tin nhắn đã được rút gọn)"
-        
         # Send reply back to Zalo (zapps sendMessage expects chat_id)
         # For /webhook we may not have chat_id → fallback to user_id
         chat_id = data.get("message", {}).get("chat", {}).get("id") or user_id
-        success = await send_zalo_message(chat_id, reply_text)
-        
-        if success:
-            logger.info(f"Successfully sent reply to user {user_id}")
+        result, duplicate = await WEBHOOK_DEDUP.run_once(
+            webhook_key(data),
+            lambda: process_text_message(user_id, None, chat_id, user_message, data, save=False),
+        )
+        if duplicate:
+            logger.info(f"♻️ Duplicate webhook from {user_id} acknowledged without calling CashyBear")
         else:
-            logger.error(f"Failed to send reply to user {user_id}")
+            logger.info(f"Queued reply #{result['outbox_id']} to user {user_id}")
         
-        return JSONResponse({"status": "ok", "sent": success})
+        return JSONResponse({"status": "ok", "queued": True, "outbox_id": result["outbox_id"], "duplicate": duplicate})
     
     except Exception as e:
         logger.error(f"Webhook error: {e}")
@@ -474,18 +676,59 @@ async def get_user_mappings():
 @app.get("/conversations")
 async def get_conversations():
     """Xem tất cả conversation để debug"""
-    pending = [c for c in CONVERSATIONS if not c.get("manual_reply_sent", False)]
+    stats = CONVERSATIONS.stats()
     return {
-        "total": len(CONVERSATIONS),
-        "pending": len(pending), 
-        "conversations": CONVERSATIONS[-20:],  # 20 conversation gần nhất
-        "pending_conversations": pending[-10:]  # 10 pending gần nhất
+        "total": stats["records"],
+        "users": stats["users"],
+        "pending": stats["pending"], 
+        "conversations": CONVERSATIONS.recent(20),  # 20 conversation gần nhất
+        "pending_conversations": CONVERSATIONS.pending(10)  # 10 pending gần nhất
     }
 
+@app.get("/outbox")
+async def get_outbox(failed_limit: int = 20):
+    """Outbox backlog + dead letters"""
+    return {**SEND_QUEUE.stats(), "failed_messages": SEND_QUEUE.failed(failed_limit)}
+
+@app.get("/webhook_dedup")
+async def get_webhook_dedup():
+    """Idempotency layer stats (duplicate hits / in-flight)"""
+    return WEBHOOK_DEDUP.stats()
+
+@app.get("/plan_summary")
+async def get_plan_summary_cache():
+    """Plan-summary cache stats"""
+    return PLAN_SUMMARIES.stats()
+
+@app.post("/plan_summary/invalidate")
+async def invalidate_plan_summary(payload: Dict[str, Any]):
+    """Drop cached plan summaries: { customerId?: number, customerIds?: number[] } (omit both to clear all).
+    Called by CashyBear on plan accept / spend log (batched as customerIds)."""
+    ids = list(payload.get("customerIds") or [])
+    if payload.get("customerId") is not None:
+        ids.append(payload["customerId"])
+    if not ids and "customerIds" in payload:
+        return {"ok": True, "dropped": 0}
+    if not ids:
+        return {"ok": True, "dropped": PLAN_SUMMARIES.invalidate(None)}
+    return {"ok": True, "dropped": sum(PLAN_SUMMARIES.invalidate(int(cid)) for cid in ids)}
+
+@app.get("/outbox/{outbox_id}")
+async def get_outbox_message(outbox_id: int):
+    msg = SEND_QUEUE.get(outbox_id)
+    if msg is None:
+        raise HTTPException(status_code=404, detail="Outbox message not found")
+    return msg
+
+@app.post("/outbox/retry_failed")
+async def retry_failed_outbox():
+    """Requeue all dead-lettered replies"""
+    return {"ok": True, "requeued": SEND_QUEUE.retry_failed()}
+
 @app.get("/conversations/{user_id}")
 async def get_user_conversation(user_id: str):
     """Xem conversation của một user cụ thể"""
-    user_convs = [c for c in CONVERSATIONS if c.get("user_id") == user_id]
+    user_convs = CONVERSATIONS.for_user(user_id)
     return {
         "user_id": user_id,
         "total": len(user_convs),
@@ -497,11 +740,7 @@ async def send_manual_reply(user_id: str, message: str):
     """Gửi manual reply cho user"""
     try:
         # Tìm conversation gần nhất của user
-        user_conv = None
-        for conv in reversed(CONVERSATIONS):
-            if conv.get("user_id") == user_id:
-                user_conv = conv
-                break
+        user_conv = CONVERSATIONS.latest_for_user(user_id)
         
         if not user_conv:
             return {"success": False, "error": "User conversation not found"}
@@ -509,16 +748,14 @@ async def send_manual_reply(user_id: str, message: str):
         chat_id = user_conv.get("chat_id")
         logger.info(f"📤 Manual reply to {user_id} (chat: {chat_id}): {message[:50]}...")
         
-        # Thử gửi với nhiều format
-        success = await send_zalo_message(chat_id, message)
-        
-        if success:
-            user_conv["manual_reply_sent"] = True
-            user_conv["manual_reply"] = message
-            user_conv["manual_reply_time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        # Đưa vào outbox; manual_reply_sent được cập nhật khi gửi thành công
+        outbox_id = queue_reply(chat_id, message, user_conv)
+        CONVERSATIONS.update(user_conv, manual_reply=message, manual_reply_time=time.strftime("%Y-%m-%d %H:%M:%S"))
         
         return {
-            "success": success,
+            "success": True,
+            "queued": True,
+            "outbox_id": outbox_id,
             "user_id": user_id,
             "chat_id": chat_id,
             "message": message,
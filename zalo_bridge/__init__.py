@@ -0,0 +1,8 @@
+"""Supporting subsystems for the Zalo ↔ CashyBear bridge (zalo_bot_integration.py)."""
+
+from .conversations import ConversationStore
+from .dedup import WebhookDeduplicator, webhook_key
+from .plan_cache import PlanSummaryCache
+from .send_queue import SendQueue
+
+__all__ = ["ConversationStore", "PlanSummaryCache", "SendQueue", "WebhookDeduplicator", "webhook_key"]
@@ -0,0 +1,229 @@
+"""
+Indexed, bounded conversation store for the Zalo bridge.
+
+- Per-user ring buffer (`per_user_limit` newest records), users evicted LRU
+  once `max_users` is reached, so memory stays bounded.
+- Indexes: user_id -> ring, chat_id -> user_id, id -> record, pending replies.
+- Optional SQLite (WAL) write-through: evicted users are reloaded on demand and
+  the users of the newest records get their full rings warmed back on startup.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+DDL = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    chat_id TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_conversations_user ON conversations(user_id, id);
+CREATE INDEX IF NOT EXISTS ix_conversations_chat ON conversations(chat_id, id);
+CREATE INDEX IF NOT EXISTS ix_conversations_created ON conversations(created_at);
+"""
+
+
+class ConversationStore:
+    """O(1) per-user / per-chat lookups over a bounded set of conversation records"""
+
+    def __init__(
+        self,
+        per_user_limit: int = 50,
+        max_users: int = 50_000,
+        recent_limit: int = 200,
+        db_path: Optional[str] = None,
+        keep_secs: float = 30 * 24 * 3600,
+    ):
+        self.per_user_limit = per_user_limit
+        self.max_users = max_users
+        self.keep_secs = keep_secs
+
+        self._users: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._user_chats: Dict[str, Set[str]] = {}
+        self._chats: Dict[str, str] = {}
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._pending: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent_limit)
+        self._next_id = 1
+        self._inserts = 0
+
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(DDL)
+            self._warm_up(recent_limit)
+
+    # ---------- writes ----------
+
+    def add(self, conv: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new record (assigns conv['id']) and index it."""
+        user_id = str(conv.get("user_id") or "")
+        # Resolve (and reload) the ring before inserting so the new row is not loaded twice
+        ring = self._ring(user_id, create=True)
+        if self._db is not None:
+            with self._lock:
+                cur = self._db.execute(
+                    "INSERT INTO conversations(user_id, chat_id, data, created_at) VALUES (?, ?, '{}', ?)",
+                    (user_id, conv.get("chat_id"), conv.get("timestamp") or time.time()),
+                )
+                conv["id"] = int(cur.lastrowid)
+                self._db.execute("UPDATE conversations SET data = ? WHERE id = ?", (_dumps(conv), conv["id"]))
+            self._inserts += 1
+            if self._inserts % 1000 == 0:
+                self._prune_disk()
+        else:
+            conv["id"] = self._next_id
+            self._next_id += 1
+
+        self._append(user_id, ring, conv)
+        self._recent.append(conv)
+        return conv
+
+    def update(self, conv: Dict[str, Any], **fields) -> Dict[str, Any]:
+        """Mutate a stored record and write it through to disk."""
+        conv.update(fields)
+        if conv.get("manual_reply_sent"):
+            self._pending.pop(conv.get("id"), None)
+        if self._db is not None and conv.get("id") is not None:
+            with self._lock:
+                self._db.execute("UPDATE conversations SET data = ? WHERE id = ?", (_dumps(conv), conv["id"]))
+        return conv
+
+    # ---------- reads ----------
+
+    def get(self, conv_id: int) -> Optional[Dict[str, Any]]:
+        """Record by id; not in memory (restart / evicted) → reload its user from SQLite"""
+        conv = self._by_id.get(int(conv_id))
+        if conv is not None or self._db is None:
+            return conv
+        with self._lock:
+            row = self._db.execute("SELECT user_id, data FROM conversations WHERE id = ?", (int(conv_id),)).fetchone()
+        if row is None:
+            return None
+        self._ring(str(row[0]))
+        # cũ hơn ring của user: trả bản đọc từ disk, update() vẫn ghi xuống theo id
+        return self._by_id.get(int(conv_id)) or json.loads(row[1])
+
+    def for_user(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        ring = self._ring(str(user_id))
+        if not ring:
+            return []
+        items = list(ring)
+        return items[-limit:] if limit else items
+
+    def latest_for_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ring = self._ring(str(user_id))
+        return ring[-1] if ring else None
+
+    def for_chat(self, chat_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        user_id = self._chats.get(str(chat_id))
+        if user_id is None and self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT user_id FROM conversations WHERE chat_id = ? ORDER BY id DESC LIMIT 1", (str(chat_id),)
+                ).fetchone()
+            user_id = row[0] if row else None
+        if user_id is None:
+            return []
+        items = [c for c in self.for_user(user_id) if str(c.get("chat_id")) == str(chat_id)]
+        return items[-limit:] if limit else items
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return list(self._recent)[-limit:]
+
+    def pending(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return list(self._pending.values())[-limit:]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._users),
+            "records": len(self._by_id),
+            "pending": len(self._pending),
+            "per_user_limit": self.per_user_limit,
+            "max_users": self.max_users,
+            "persistent": self._db is not None,
+        }
+
+    # ---------- internals ----------
+
+    def _ring(self, user_id: str, create: bool = False) -> Optional[Deque[Dict[str, Any]]]:
+        ring = self._users.get(user_id)
+        if ring is not None:
+            self._users.move_to_end(user_id)
+            return ring
+        if self._db is not None:
+            rows = self._load_user(user_id)
+            if rows or create:
+                ring = self._new_ring(user_id)
+                for conv in rows:
+                    self._append(user_id, ring, conv)
+                return ring
+        return self._new_ring(user_id) if create else None
+
+    def _new_ring(self, user_id: str) -> Deque[Dict[str, Any]]:
+        while len(self._users) >= self.max_users:
+            old_user, old_ring = self._users.popitem(last=False)
+            for conv in old_ring:
+                self._unindex(conv)
+            for chat_id in self._user_chats.pop(old_user, ()):
+                if self._chats.get(chat_id) == old_user:
+                    del self._chats[chat_id]
+        ring: Deque[Dict[str, Any]] = deque()
+        self._users[user_id] = ring
+        return ring
+
+    def _append(self, user_id: str, ring: Deque[Dict[str, Any]], conv: Dict[str, Any]):
+        if len(ring) >= self.per_user_limit:
+            self._unindex(ring.popleft())
+        ring.append(conv)
+        self._by_id[conv["id"]] = conv
+        if not conv.get("manual_reply_sent"):
+            self._pending[conv["id"]] = conv
+        chat_id = conv.get("chat_id")
+        if chat_id is not None:
+            self._chats[str(chat_id)] = user_id
+            self._user_chats.setdefault(user_id, set()).add(str(chat_id))
+
+    def _unindex(self, conv: Dict[str, Any]):
+        self._by_id.pop(conv.get("id"), None)
+        self._pending.pop(conv.get("id"), None)
+
+    def _load_user(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM conversations WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, self.per_user_limit),
+            ).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+    def _warm_up(self, limit: int):
+        """Load full rings (per_user_limit, qua _load_user) of the users in the newest `limit` records"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, user_id FROM conversations ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        users: "OrderedDict[str, None]" = OrderedDict()
+        for _, user_id in reversed(rows):
+            users.pop(str(user_id), None)
+            users[str(user_id)] = None  # thứ tự LRU: user hoạt động gần nhất nạp sau cùng
+        for user_id in users:
+            self._ring(user_id)
+        for conv_id, _ in reversed(rows):
+            conv = self._by_id.get(int(conv_id))
+            if conv is not None:
+                self._recent.append(conv)
+
+    def _prune_disk(self):
+        with self._lock:
+            self._db.execute("DELETE FROM conversations WHERE created_at < ?", (time.time() - self.keep_secs,))
+
+
+def _dumps(conv: Dict[str, Any]) -> str:
+    return json.dumps(conv, ensure_ascii=False, default=str)
@@ -0,0 +1,165 @@
+"""
+Idempotency layer for Zalo webhook re-deliveries.
+
+Each delivery is keyed on its event/message id (or a hash of sender + text +
+timestamp when Zalo sends no id). The first delivery runs the handler; a
+duplicate that arrives while it is still running awaits the same future, and a
+duplicate that arrives later gets the stored result back. Keys expire after
+`ttl_secs`; with `db_path` they also survive a restart.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+DDL = """
+CREATE TABLE IF NOT EXISTS processed_webhooks (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_processed_webhooks_created ON processed_webhooks(created_at);
+"""
+
+
+def webhook_key(data: Dict[str, Any]) -> Optional[str]:
+    """Idempotency key for a webhook payload, None when it cannot be identified safely"""
+    message = data.get("message") or {}
+    if not isinstance(message, dict):
+        message = {}
+    for value in (
+        data.get("event_id"),
+        message.get("message_id"),
+        message.get("msg_id"),
+        data.get("msg_id"),
+    ):
+        if value:
+            return f"id:{value}"
+
+    ts = data.get("timestamp") or message.get("date") or data.get("date")
+    if not ts:
+        # Không có id lẫn timestamp: không thể phân biệt retry với tin nhắn lặp lại thật
+        return None
+    sender = data.get("user_id") or (message.get("from") or {}).get("id")
+    chat = (message.get("chat") or {}).get("id")
+    raw = json.dumps([data.get("event_name"), sender, chat, message.get("text"), ts], ensure_ascii=False, default=str)
+    return "h:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class WebhookDeduplicator:
+    """TTL-bounded set of processed webhook keys with in-flight coalescing"""
+
+    def __init__(self, ttl_secs: float = 3600, max_keys: int = 100_000, db_path: Optional[str] = None):
+        self.ttl_secs = ttl_secs
+        self.max_keys = max_keys
+        self._done: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(DDL)
+
+    async def run_once(self, key: Optional[str], handler: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run `handler` once per key. Returns (result, is_duplicate)."""
+        if key is None:
+            return await handler(), False
+
+        now = time.time()
+        self._expire(now)
+        found, result = self._lookup(key, now)
+        if found:
+            self.hits += 1
+            return result, True
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.hits += 1
+            return await asyncio.shield(fut), True
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await handler()
+        except BaseException as e:
+            # Lỗi thì không ghi nhận key để lần re-delivery sau được xử lý lại
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._remember(key, result, time.time())
+        fut.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._done),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_secs": self.ttl_secs,
+            "persistent": self._db is not None,
+        }
+
+    # ---------- internals ----------
+
+    def _lookup(self, key: str, now: float) -> Tuple[bool, Any]:
+        entry = self._done.get(key)
+        if entry is not None:
+            return True, entry[1]
+        if self._db is None:
+            return False, None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM processed_webhooks WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_secs),
+            ).fetchone()
+        if row is None:
+            return False, None
+        result = json.loads(row[0])
+        # _done phải giữ thứ tự created_at (_expire dừng ở key đầu chưa hết hạn): key cũ hơn key mới nhất
+        # trong RAM thì không cache lại, lần sau vẫn đọc từ SQLite
+        newest = next(reversed(self._done.values()), None)
+        if newest is None or row[1] >= newest[0]:
+            self._cache(key, row[1], result)
+        return True, result
+
+    def _cache(self, key: str, result_ts: float, result: Any):
+        self._done[key] = (result_ts, result)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_keys:
+            self._done.popitem(last=False)
+
+    def _remember(self, key: str, result: Any, now: float):
+        self._cache(key, now, result)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO processed_webhooks(key, result, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False, default=str), now),
+                )
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl_secs
+        expired = False
+        while self._done:
+            key, (ts, _) = next(iter(self._done.items()))
+            if ts >= cutoff:
+                break
+            self._done.popitem(last=False)
+            expired = True
+        if expired and self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM processed_webhooks WHERE created_at < ?", (cutoff,))
@@ -0,0 +1,97 @@
+"""
+Per-customer cache of the CashyBear plan summary used by /trigger/spend.
+
+Only the plan header (recommended/cap weekly save, target) is needed to compose
+a spend message, so entries hold that small projection for `ttl_secs`. Bursts
+from the same customer share one in-flight fetch, and `invalidate()` drops an
+entry as soon as a plan is accepted or a spend is posted.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+FetchFn = Callable[[int], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class PlanSummaryCache:
+    """TTL + LRU cache of plan summaries keyed by customer_id, with request coalescing"""
+
+    def __init__(self, fetch: FetchFn, ttl_secs: float = 300, max_entries: int = 10_000):
+        self._fetch = fetch
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        # Bumped when a customer with a fetch in flight is invalidated, so that fetch is not cached;
+        # only in-flight customers have an entry (removed when the fetch ends)
+        self._generation: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        """Cached summary for `customer_id` (None when the customer has no plan)."""
+        customer_id = int(customer_id)
+        entry = self._entries.get(customer_id)
+        if entry is not None:
+            expires_at, summary = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(customer_id)
+                self.hits += 1
+                return summary
+            del self._entries[customer_id]
+
+        fut = self._inflight.get(customer_id)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[customer_id] = fut
+        try:
+            summary = await self._fetch(customer_id)
+        except BaseException as e:
+            # Lỗi fetch không được cache; lần gọi sau sẽ thử lại
+            fut.set_exception(e)
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(customer_id, None)
+            invalidated = self._generation.pop(customer_id, 0) > 0
+        if not invalidated:
+            self._put(customer_id, summary)
+        fut.set_result(summary)
+        return summary
+
+    def invalidate(self, customer_id: Optional[int] = None) -> int:
+        """Drop one customer's entry (or all entries). Returns the number dropped."""
+        if customer_id is None:
+            dropped = len(self._entries)
+            self._entries.clear()
+            for cid in self._inflight:
+                self._generation[cid] = self._generation.get(cid, 0) + 1
+            return dropped
+        customer_id = int(customer_id)
+        # KH không được cache / không đang fetch: không có gì để bỏ, không để lại dấu vết
+        if customer_id in self._inflight:
+            self._generation[customer_id] = self._generation.get(customer_id, 0) + 1
+        return 1 if self._entries.pop(customer_id, None) is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "ttl_secs": self.ttl_secs,
+        }
+
+    def _put(self, customer_id: int, summary: Optional[Dict[str, Any]]):
+        self._entries[customer_id] = (time.monotonic() + self.ttl_secs, summary)
+        self._entries.move_to_end(customer_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
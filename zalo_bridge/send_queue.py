@@ -0,0 +1,276 @@
+"""
+Durable outbound queue for Zalo replies.
+
+Replies are written to a local SQLite journal (WAL) and drained by a pool of
+asyncio workers. Messages of the same chat_id are delivered strictly in order
+(one drain task per chat, head-of-line blocking on retry); different chats are
+sent in parallel. Failed sends back off exponentially and end up as 'failed'
+(dead letter) after `max_attempts`.
+"""
+
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SendFn = Callable[[str, str], Awaitable[bool]]
+ResultFn = Callable[[int, str, bool, Optional[str]], None]  # (outbox id, chat_id, ok, ref)
+
+DDL = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    ref TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_pending ON outbox(status, chat_id, id);
+"""
+
+
+class SendQueue:
+    """SQLite-backed outbox with per-chat ordering and exponential backoff"""
+
+    def __init__(
+        self,
+        db_path: str,
+        send: SendFn,
+        workers: int = 16,
+        max_attempts: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        batch_size: int = 100,
+        poll_interval: float = 2.0,
+        keep_sent_secs: float = 24 * 3600,
+        on_result: Optional[ResultFn] = None,
+    ):
+        self.db_path = db_path
+        self._send = send
+        self._on_result = on_result
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.keep_sent_secs = keep_sent_secs
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(DDL)
+        self._lock = threading.Lock()
+
+        self._workers = asyncio.Semaphore(workers)
+        self._active: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    # ---------- SQLite helpers (short statements, safe to run on the loop) ----------
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # ---------- Public API ----------
+
+    def enqueue(self, chat_id: str, text: str, ref: Optional[str] = None) -> int:
+        """Persist a reply and wake the dispatcher. Returns the outbox id.
+
+        `ref` (e.g. the conversation id) is stored with the row and handed back to
+        on_result, so results of rows replayed after a restart still find their owner.
+        """
+        now = time.time()
+        cur = self._execute(
+            "INSERT INTO outbox(chat_id, text, ref, status, attempts, next_attempt_at, created_at) VALUES (?, ?, ?, 'pending', 0, ?, ?)",
+            (str(chat_id), text, (str(ref) if ref is not None else None), now, now),
+        )
+        if self._wake is not None:
+            self._wake.set()
+        return int(cur.lastrowid)
+
+    def get(self, msg_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._fetchall(
+            "SELECT id, chat_id, text, ref, status, attempts, next_attempt_at, last_error, created_at, sent_at FROM outbox WHERE id = ?",
+            (int(msg_id),),
+        )
+        return _row_to_dict(rows[0]) if rows else None
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: n for status, n in self._fetchall("SELECT status, COUNT(*) FROM outbox GROUP BY status")}
+        oldest = self._fetchall("SELECT MIN(created_at) FROM outbox WHERE status = 'pending'")[0][0]
+        return {
+            "pending": counts.get("pending", 0),
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "active_chats": len(self._active),
+            "oldest_pending_age_secs": (time.time() - oldest) if oldest else 0.0,
+        }
+
+    def failed(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._fetchall(
+            "SELECT id, chat_id, text, ref, status, attempts, next_attempt_at, last_error, created_at, sent_at FROM outbox WHERE status = 'failed' ORDER BY id DESC LIMIT ?",
+            (int(limit),),
+        )
+        return [_row_to_dict(r) for r in rows]
+
+    def retry_failed(self) -> int:
+        """Move dead letters back to pending (attempt counter reset)."""
+        cur = self._execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'failed'",
+            (time.time(),),
+        )
+        if self._wake is not None:
+            self._wake.set()
+        return cur.rowcount
+
+    async def start(self):
+        if self._dispatcher is not None:
+            return
+        self._wake = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        pending = self.stats()["pending"]
+        if pending:
+            logger.info(f"📮 Outbox resumed with {pending} pending message(s)")
+
+    async def stop(self, timeout: float = 10.0):
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        if self._tasks:
+            # Cho các lượt gửi đang chạy hoàn tất; phần còn lại vẫn nằm trong journal
+            _, still_running = await asyncio.wait(set(self._tasks), timeout=timeout)
+            # Quá timeout: hủy trước khi đóng DB (tin đang gửi dở vẫn 'pending', gửi lại lần chạy sau)
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                await asyncio.gather(*still_running, return_exceptions=True)
+        with self._lock:
+            self._db.close()
+
+    # ---------- Dispatcher / workers ----------
+
+    def _ready_heads(self) -> List[tuple]:
+        # Head message (lowest id) of every chat that still has pending replies
+        return self._fetchall(
+            """
+            SELECT o.chat_id, o.next_attempt_at
+            FROM outbox o
+            JOIN (SELECT MIN(id) AS id FROM outbox WHERE status = 'pending' GROUP BY chat_id) h ON h.id = o.id
+            ORDER BY o.next_attempt_at
+            LIMIT ?
+            """,
+            (self.batch_size,),
+        )
+
+    async def _dispatch_loop(self):
+        while True:
+            now = time.time()
+            next_due = now + self.poll_interval
+            try:
+                for chat_id, due in self._ready_heads():
+                    if chat_id in self._active:
+                        continue
+                    if due > now:
+                        next_due = min(next_due, due)
+                        continue
+                    self._active.add(chat_id)
+                    task = asyncio.create_task(self._drain_chat(chat_id))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                if now - self._last_purge > 600:
+                    self._purge(now)
+            except Exception as e:
+                logger.error(f"❌ Outbox dispatcher error: {e}")
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.05, next_due - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _drain_chat(self, chat_id: str):
+        try:
+            async with self._workers:
+                while True:
+                    rows = self._fetchall(
+                        "SELECT id, text, ref, attempts, next_attempt_at FROM outbox WHERE chat_id = ? AND status = 'pending' ORDER BY id LIMIT 1",
+                        (chat_id,),
+                    )
+                    if not rows:
+                        return
+                    msg_id, text, ref, attempts, due = rows[0]
+                    if due > time.time():
+                        return
+                    if not await self._deliver(msg_id, chat_id, text, attempts, ref):
+                        return
+        finally:
+            self._active.discard(chat_id)
+            if self._wake is not None:
+                self._wake.set()
+
+    async def _deliver(self, msg_id: int, chat_id: str, text: str, attempts: int, ref: Optional[str] = None) -> bool:
+        """Send one message. Returns True when the chat may continue with its next message."""
+        attempts += 1
+        error = None
+        try:
+            ok = await self._send(chat_id, text)
+        except Exception as e:
+            ok, error = False, str(e)
+
+        now = time.time()
+        if ok:
+            self._execute("UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL WHERE id = ?", (attempts, now, msg_id))
+            self._notify(msg_id, chat_id, True, ref)
+            return True
+
+        error = error or "send returned not ok"
+        if attempts >= self.max_attempts:
+            logger.error(f"❌ Outbox #{msg_id} → {chat_id} failed after {attempts} attempts: {error}")
+            self._execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?", (attempts, error, msg_id))
+            self._notify(msg_id, chat_id, False, ref)
+            # Dead letter does not block the rest of the chat
+            return True
+
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay *= 0.5 + random.random() / 2
+        logger.warning(f"⚠️ Outbox #{msg_id} → {chat_id} attempt {attempts} failed ({error}); retry in {delay:.1f}s")
+        self._execute("UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?", (attempts, now + delay, error, msg_id))
+        return False
+
+    def _notify(self, msg_id: int, chat_id: str, ok: bool, ref: Optional[str]):
+        if self._on_result is None:
+            return
+        try:
+            self._on_result(msg_id, chat_id, ok, ref)
+        except Exception as e:
+            logger.warning(f"⚠️ Outbox result callback error: {e}")
+
+    def _purge(self, now: float):
+        self._last_purge = now
+        self._execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?", (now - self.keep_sent_secs,))
+
+
+def _row_to_dict(row: tuple) -> Dict[str, Any]:
+    keys = ("id", "chat_id", "text", "ref", "status", "attempts", "next_attempt_at", "last_error", "created_at", "sent_at")
+    return dict(zip(keys, row))